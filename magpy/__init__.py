@@ -7,6 +7,7 @@ from .hamiltonian import Hamiltonian
 from .hfwfn import hfwfn
 from .ciwfn import ciwfn
 from .ciwfn_so import ciwfn_so
+from .pnociwfn import pnociwfn
 from .mpwfn import mpwfn
 from .mpwfn_so import mpwfn_so
 from .hessian import Hessian
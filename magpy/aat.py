@@ -8,6 +8,7 @@ from .utils import *
 from codetiming import Timer
 from multiprocessing import Pool
 import time
+from functools import partial
 
 class AAT(object):
 
@@ -67,6 +68,47 @@ class AAT(object):
         max_diis = kwargs.pop('max_diis', 8)
         start_diis = kwargs.pop('start_diis', 1)
         print_level = kwargs.pop('print_level', 0)
+        prefetch = kwargs.pop('prefetch', 0) # number of displaced geometries whose ERIs are computed ahead in a helper process
+        # (the helper is spawned and imports the main module again: guard a calling script with if __name__ == "__main__":)
+        batch_scf = kwargs.pop('batch_scf', False) # solve the SCF equations for all field displacements together
+        batch_ci = kwargs.pop('batch_ci', False) # solve the CID equations for all field displacements together
+        fno_threshold = kwargs.pop('fno_threshold', None) # occupation above which MP2 natural virtual orbitals are kept (None: all virtual orbitals)
+
+        # Canonical ('NONE') or local pair-natural-orbital ('PNO') CID wave functions
+        valid_locals = ['NONE', 'PNO']
+        local = kwargs.pop('local', 'NONE').upper()
+        if local not in valid_locals:
+            raise Exception(f"{local:s} is not an allowed choice of local correlation.")
+        if local == 'PNO' and (method != 'CID' or orbitals != 'SPATIAL'):
+            raise Exception("Local (PNO) wave functions are only available for CID with spatial orbitals.")
+        if batch_ci is True and (method != 'CID' or orbitals != 'SPATIAL' or local != 'NONE'):
+            raise Exception("Batched CID is only available for canonical CID with spatial orbitals.")
+        pno_threshold = kwargs.pop('pno_threshold', 1e-8) # occupation above which PNOs are kept
+        pair_threshold = kwargs.pop('pair_threshold', 1e-6) # MP2 pair energy above which pairs are kept
+
+        # Conventional or density-fitted MP2
+        valid_mp2_types = ['CONV', 'DF']
+        mp2_type = kwargs.pop('mp2_type', 'CONV').upper()
+        if mp2_type not in valid_mp2_types:
+            raise Exception(f"{mp2_type:s} is not an allowed choice of mp2_type.")
+        if mp2_type == 'DF' and orbitals != 'SPATIAL':
+            raise Exception("Density-fitted MP2 is only available with spatial orbitals.")
+
+        # Convergence thresholds: fixed (e_conv, r_conv), or derived from the step sizes and the target precision of each tensor element
+        valid_convergences = ['FIXED', 'AUTO']
+        convergence = kwargs.pop('convergence', 'FIXED').upper()
+        if convergence not in valid_convergences:
+            raise Exception(f"{convergence:s} is not an allowed choice of convergence.")
+        precision = kwargs.pop('precision', 1e-5) # target precision of each tensor element for convergence='AUTO'
+        if convergence == 'AUTO':
+            # central differences in R and B of wave-function overlaps (doubled for HF)
+            e_conv, r_conv = auto_convergence(precision, 2/(R_disp*B_disp))
+
+        # Initial guess for the displaced SCF (and CID) wave functions
+        valid_guesses = ['REFERENCE', 'CORE']
+        guess = kwargs.pop('guess', 'REFERENCE').upper()
+        if guess not in valid_guesses:
+            raise Exception(f"{guess:s} is not an allowed choice of SCF guess.")
 
         # Title output
         if print_level >= 1:
@@ -84,262 +126,349 @@ class AAT(object):
                 print(f"    AAT element = ALL")
             print(f"    r_disp = {R_disp:e}")
             print(f"    b_disp = {B_disp:e}")
+            print(f"    convergence = {convergence:s}")
+            if convergence == 'AUTO':
+                print(f"    precision = {precision:e}")
             print(f"    e_conv = {e_conv:e}")
             print(f"    r_conv = {r_conv:e}")
             print(f"    maxiter = {maxiter:d}")
             print(f"    max_diis = {max_diis:d}")
             print(f"    start_diis = {start_diis:d}")
-
-        # Compute the unperturbed HF wfn
-        H = magpy.Hamiltonian(mol)
-        scf0 = magpy.hfwfn(H, self.charge, self.spin)
-        scf0.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-        if print_level > 2:
-            print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
-        if method == 'CID':
-            if orbitals == 'SPATIAL':
-                ci0 = magpy.ciwfn(scf0, normalization=normalization)
-            else:
-                ci0 = magpy.ciwfn_so(scf0, normalization=normalization)
-        elif method == 'MP2':
-            if orbitals == 'SPATIAL':
-                ci0 = magpy.mpwfn(scf0)
-            else:
-                ci0 = magpy.mpwfn_so(scf0)
-
-
-        # Magnetic field displacements
-        B_pos = []
-        B_neg = []
-
-        # Atomic coordinate displacements
-        R_pos = []
-        R_neg = []
-
-        ### Displaced wave functions for single-element calculation
+            print(f"    prefetch = {prefetch:d}")
+            print(f"    guess = {guess:s}")
+            print(f"    batch_scf = {batch_scf}")
+            print(f"    batch_ci = {batch_ci}")
+            if fno_threshold is not None:
+                print(f"    fno_threshold = {fno_threshold:e}")
+            print(f"    local = {local:s}")
+            if method == 'MP2':
+                print(f"    mp2_type = {mp2_type:s}")
+            if local == 'PNO':
+                print(f"    pno_threshold = {pno_threshold:e}")
+                print(f"    pair_threshold = {pair_threshold:e}")
+
+        # Reference and displaced Hamiltonians in the order they are needed below
+        tasks = [((), None, None)]
         if self.single_element is True:
             R = self.element[0]
             B = self.element[1]
+            tasks += [self.field_task(B, B_disp), self.field_task(B, -B_disp)]
+            tasks += [self.geom_task(R, R_disp), self.geom_task(R, -R_disp)]
+        else:
+            for B in range(3):
+                tasks += [self.field_task(B, B_disp), self.field_task(B, -B_disp)]
+            for R in range(3*mol.natom()):
+                tasks += [self.geom_task(R, R_disp), self.geom_task(R, -R_disp)]
+        with Prefetcher(mol, tasks, prefetch) as hamiltonians:
+            # Compute the unperturbed HF wfn
+            H = hamiltonians.get(((), None, None))
+            scf0 = magpy.hfwfn(H, self.charge, self.spin)
+            scf0.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+            scf_guess = scf0 if guess == 'REFERENCE' else None # guess for all displaced SCF wave functions
+
+            # Frozen natural virtual orbitals of the reference, projected onto the virtual space of each
+            # displaced wave function below, so that all correlated wave functions use a consistent truncated space
+            C_no = None
+            if fno_threshold is not None and method != 'HF':
+                mp = magpy.mpwfn(scf0, mp2_type=mp2_type)
+                mp.solve(print_level=print_level)
+                C_no, occ = mp.natural_virtuals(fno_threshold)
+                scf0.truncate_virtuals(C_no)
+                if print_level > 0:
+                    print(f"Frozen natural orbitals: {C_no.shape[1]:d} of {occ.shape[0]:d} virtual orbitals kept.")
+
+            # Solve the SCF equations for all magnetic-field displacements together
+            if batch_scf is True:
+                field_tasks = [task for task in tasks if task[1] == 'MAGNETIC-DIPOLE']
+                field_scf = [magpy.hfwfn(hamiltonians.get(task), self.charge, self.spin) for task in field_tasks]
+                magpy.hfwfn.solve_batch(field_scf, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                field_scf = dict(zip(field_tasks, field_scf))
 
-            strength = np.zeros(3)
-
-            # +B displacement
             if print_level > 2:
-                print("B(%d)+ Displacement" % (B))
-            strength[B] = B_disp
-            H = magpy.Hamiltonian(mol)
-            H.add_field(field='magnetic-dipole', strength=strength)
-            scf = magpy.hfwfn(H, self.charge, self.spin)
-            scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-            scf.match_phase(scf0)
-            if method == 'HF':
-                B_pos.append(scf)
-            elif method == 'CID':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.ciwfn(scf, normalization=normalization)
-                else:
-                    ci = magpy.ciwfn_so(scf, normalization=normalization)
-                ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-                B_pos.append(ci)
-            elif method == 'MP2':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.mpwfn(scf)
+                print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
+            if method == 'CID':
+                if local == 'PNO':
+                    ci0 = magpy.pnociwfn(scf0, normalization=normalization, pno_threshold=pno_threshold, pair_threshold=pair_threshold)
+                elif orbitals == 'SPATIAL':
+                    ci0 = magpy.ciwfn(scf0, normalization=normalization)
                 else:
-                    ci = magpy.mpwfn_so(scf)
-                ci.solve(normalization=normalization, print_level=print_level)
-                B_pos.append(ci)
+                    ci0 = magpy.ciwfn_so(scf0, normalization=normalization)
 
-            # -B displacement
-            if print_level > 2:
-                print("B(%d)- Displacement" % (B))
-            strength[B] = -B_disp
-            H = magpy.Hamiltonian(mol)
-            H.add_field(field='magnetic-dipole', strength=strength)
-            scf = magpy.hfwfn(H, self.charge, self.spin)
-            scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-            scf.match_phase(scf0)
-            if method == 'HF':
-                B_neg.append(scf)
-            elif method == 'CID':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.ciwfn(scf, normalization=normalization)
+                # Spatial-orbital CID wave functions at the displacements, local ones with the
+                # localized orbitals, pairs, and PNOs of the reference projected onto their spaces
+                if local == 'PNO':
+                    cid = partial(magpy.pnociwfn, ref=ci0, normalization=normalization)
                 else:
-                    ci = magpy.ciwfn_so(scf, normalization=normalization)
-                ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-                B_neg.append(ci)
+                    cid = partial(magpy.ciwfn, normalization=normalization)
             elif method == 'MP2':
                 if orbitals == 'SPATIAL':
-                    ci = magpy.mpwfn(scf)
+                    ci0 = magpy.mpwfn(scf0, mp2_type=mp2_type)
                 else:
-                    ci = magpy.mpwfn_so(scf)
-                ci.solve(normalization=normalization, print_level=print_level)
-                B_neg.append(ci)
+                    ci0 = magpy.mpwfn_so(scf0)
 
-            # +R displacement
-            if print_level > 2:
-                print("R(%d)+ Displacement" % (R))
-            H = magpy.Hamiltonian(shift_geom(mol, R, R_disp))
-            rhf_e, rhf_wfn = psi4.energy('SCF', return_wfn=True)
-            scf = magpy.hfwfn(H, self.charge, self.spin)
-            scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-            if print_level > 2:
-                print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
-            scf.match_phase(scf0)
-            if method == 'HF':
-                R_pos.append(scf)
-            elif method == 'CID':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.ciwfn(scf, normalization=normalization)
-                else:
-                    ci = magpy.ciwfn_so(scf, normalization=normalization)
-                ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-                R_pos.append(ci)
-            elif method == 'MP2':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.mpwfn(scf)
-                else:
-                    ci = magpy.mpwfn_so(scf)
-                ci.solve(normalization=normalization, print_level=print_level)
-                R_pos.append(ci)
+            # Reference CID wave function, used as the guess for all displaced CID wave functions
+            ci_guess = None
+            if method == 'CID' and guess == 'REFERENCE':
+                ci0.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                ci_guess = ci0
 
-            # -R displacement
-            if print_level > 2:
-                print("R(%d)- Displacement" % (R))
-            H = magpy.Hamiltonian(shift_geom(mol, R, -R_disp))
-            scf = magpy.hfwfn(H, self.charge, self.spin)
-            scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-            if print_level > 2:
-                print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
-            scf.match_phase(scf0)
-            if method == 'HF':
-                R_neg.append(scf)
-            elif method == 'CID':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.ciwfn(scf, normalization=normalization)
-                else:
-                    ci = magpy.ciwfn_so(scf, normalization=normalization)
-                ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-                R_neg.append(ci)
-            elif method == 'MP2':
-                if orbitals == 'SPATIAL':
-                    ci = magpy.mpwfn(scf)
-                else:
-                    ci = magpy.mpwfn_so(scf)
-                ci.solve(normalization=normalization, print_level=print_level)
-                R_neg.append(ci)
 
-        ### Displaced wave functions for full tensor
-        else:
-            for B in range(3):
-                strength = np.zeros(3)
-    
+            # Magnetic field displacements
+            B_pos = []
+            B_neg = []
+
+            # Atomic coordinate displacements
+            R_pos = []
+            R_neg = []
+
+            ### Displaced wave functions for single-element calculation
+            if self.single_element is True:
+                R = self.element[0]
+                B = self.element[1]
+
                 # +B displacement
                 if print_level > 2:
                     print("B(%d)+ Displacement" % (B))
-                strength[B] = B_disp
-                H = magpy.Hamiltonian(mol)
-                H.add_field(field='magnetic-dipole', strength=strength)
-                scf = magpy.hfwfn(H, self.charge, self.spin)
-                scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                if batch_scf is True:
+                    scf = field_scf[self.field_task(B, B_disp)]
+                else:
+                    H = hamiltonians.get(self.field_task(B, B_disp))
+                    scf = magpy.hfwfn(H, self.charge, self.spin)
+                    scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                if C_no is not None:
+                    scf.truncate_virtuals(C_no, scf0.H.basisset)
                 scf.match_phase(scf0)
                 if method == 'HF':
                     B_pos.append(scf)
                 elif method == 'CID':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.ciwfn(scf, normalization=normalization)
+                        ci = cid(scf)
                     else:
                         ci = magpy.ciwfn_so(scf, normalization=normalization)
-                    ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                    if batch_ci is not True:
+                        ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
                     B_pos.append(ci)
                 elif method == 'MP2':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.mpwfn(scf)
+                        ci = magpy.mpwfn(scf, mp2_type=mp2_type)
                     else:
                         ci = magpy.mpwfn_so(scf)
                     ci.solve(normalization=normalization, print_level=print_level)
                     B_pos.append(ci)
-    
+
                 # -B displacement
                 if print_level > 2:
                     print("B(%d)- Displacement" % (B))
-                strength[B] = -B_disp
-                H = magpy.Hamiltonian(mol)
-                H.add_field(field='magnetic-dipole', strength=strength)
-                scf = magpy.hfwfn(H, self.charge, self.spin)
-                scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                if batch_scf is True:
+                    scf = field_scf[self.field_task(B, -B_disp)]
+                else:
+                    H = hamiltonians.get(self.field_task(B, -B_disp))
+                    scf = magpy.hfwfn(H, self.charge, self.spin)
+                    scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                if C_no is not None:
+                    scf.truncate_virtuals(C_no, scf0.H.basisset)
                 scf.match_phase(scf0)
                 if method == 'HF':
                     B_neg.append(scf)
                 elif method == 'CID':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.ciwfn(scf, normalization=normalization)
+                        ci = cid(scf)
                     else:
                         ci = magpy.ciwfn_so(scf, normalization=normalization)
-                    ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                    if batch_ci is not True:
+                        ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
                     B_neg.append(ci)
                 elif method == 'MP2':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.mpwfn(scf)
+                        ci = magpy.mpwfn(scf, mp2_type=mp2_type)
                     else:
                         ci = magpy.mpwfn_so(scf)
                     ci.solve(normalization=normalization, print_level=print_level)
                     B_neg.append(ci)
-    
-            for R in range(3*mol.natom()):
-    
+
                 # +R displacement
                 if print_level > 2:
                     print("R(%d)+ Displacement" % (R))
-                H = magpy.Hamiltonian(shift_geom(mol, R, R_disp))
+                H = hamiltonians.get(self.geom_task(R, R_disp))
                 rhf_e, rhf_wfn = psi4.energy('SCF', return_wfn=True)
                 scf = magpy.hfwfn(H, self.charge, self.spin)
-                scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
                 if print_level > 2:
                     print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
+                if C_no is not None:
+                    scf.truncate_virtuals(C_no, scf0.H.basisset)
                 scf.match_phase(scf0)
                 if method == 'HF':
                     R_pos.append(scf)
                 elif method == 'CID':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.ciwfn(scf, normalization=normalization)
+                        ci = cid(scf)
                     else:
                         ci = magpy.ciwfn_so(scf, normalization=normalization)
-                    ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                    ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
                     R_pos.append(ci)
                 elif method == 'MP2':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.mpwfn(scf)
+                        ci = magpy.mpwfn(scf, mp2_type=mp2_type)
                     else:
                         ci = magpy.mpwfn_so(scf)
                     ci.solve(normalization=normalization, print_level=print_level)
                     R_pos.append(ci)
-    
+
                 # -R displacement
                 if print_level > 2:
                     print("R(%d)- Displacement" % (R))
-                H = magpy.Hamiltonian(shift_geom(mol, R, -R_disp))
+                H = hamiltonians.get(self.geom_task(R, -R_disp))
                 scf = magpy.hfwfn(H, self.charge, self.spin)
-                scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
                 if print_level > 2:
                     print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
+                if C_no is not None:
+                    scf.truncate_virtuals(C_no, scf0.H.basisset)
                 scf.match_phase(scf0)
                 if method == 'HF':
                     R_neg.append(scf)
                 elif method == 'CID':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.ciwfn(scf, normalization=normalization)
+                        ci = cid(scf)
                     else:
                         ci = magpy.ciwfn_so(scf, normalization=normalization)
-                    ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                    ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
                     R_neg.append(ci)
                 elif method == 'MP2':
                     if orbitals == 'SPATIAL':
-                        ci = magpy.mpwfn(scf)
+                        ci = magpy.mpwfn(scf, mp2_type=mp2_type)
                     else:
                         ci = magpy.mpwfn_so(scf)
                     ci.solve(normalization=normalization, print_level=print_level)
                     R_neg.append(ci)
-    
+
+            ### Displaced wave functions for full tensor
+            else:
+                for B in range(3):
+                    # +B displacement
+                    if print_level > 2:
+                        print("B(%d)+ Displacement" % (B))
+                    if batch_scf is True:
+                        scf = field_scf[self.field_task(B, B_disp)]
+                    else:
+                        H = hamiltonians.get(self.field_task(B, B_disp))
+                        scf = magpy.hfwfn(H, self.charge, self.spin)
+                        scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                    if C_no is not None:
+                        scf.truncate_virtuals(C_no, scf0.H.basisset)
+                    scf.match_phase(scf0)
+                    if method == 'HF':
+                        B_pos.append(scf)
+                    elif method == 'CID':
+                        if orbitals == 'SPATIAL':
+                            ci = cid(scf)
+                        else:
+                            ci = magpy.ciwfn_so(scf, normalization=normalization)
+                        if batch_ci is not True:
+                            ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
+                        B_pos.append(ci)
+                    elif method == 'MP2':
+                        if orbitals == 'SPATIAL':
+                            ci = magpy.mpwfn(scf, mp2_type=mp2_type)
+                        else:
+                            ci = magpy.mpwfn_so(scf)
+                        ci.solve(normalization=normalization, print_level=print_level)
+                        B_pos.append(ci)
+
+                    # -B displacement
+                    if print_level > 2:
+                        print("B(%d)- Displacement" % (B))
+                    if batch_scf is True:
+                        scf = field_scf[self.field_task(B, -B_disp)]
+                    else:
+                        H = hamiltonians.get(self.field_task(B, -B_disp))
+                        scf = magpy.hfwfn(H, self.charge, self.spin)
+                        scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                    if C_no is not None:
+                        scf.truncate_virtuals(C_no, scf0.H.basisset)
+                    scf.match_phase(scf0)
+                    if method == 'HF':
+                        B_neg.append(scf)
+                    elif method == 'CID':
+                        if orbitals == 'SPATIAL':
+                            ci = cid(scf)
+                        else:
+                            ci = magpy.ciwfn_so(scf, normalization=normalization)
+                        if batch_ci is not True:
+                            ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
+                        B_neg.append(ci)
+                    elif method == 'MP2':
+                        if orbitals == 'SPATIAL':
+                            ci = magpy.mpwfn(scf, mp2_type=mp2_type)
+                        else:
+                            ci = magpy.mpwfn_so(scf)
+                        ci.solve(normalization=normalization, print_level=print_level)
+                        B_neg.append(ci)
+
+                for R in range(3*mol.natom()):
+
+                    # +R displacement
+                    if print_level > 2:
+                        print("R(%d)+ Displacement" % (R))
+                    H = hamiltonians.get(self.geom_task(R, R_disp))
+                    rhf_e, rhf_wfn = psi4.energy('SCF', return_wfn=True)
+                    scf = magpy.hfwfn(H, self.charge, self.spin)
+                    scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                    if print_level > 2:
+                        print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
+                    if C_no is not None:
+                        scf.truncate_virtuals(C_no, scf0.H.basisset)
+                    scf.match_phase(scf0)
+                    if method == 'HF':
+                        R_pos.append(scf)
+                    elif method == 'CID':
+                        if orbitals == 'SPATIAL':
+                            ci = cid(scf)
+                        else:
+                            ci = magpy.ciwfn_so(scf, normalization=normalization)
+                        ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
+                        R_pos.append(ci)
+                    elif method == 'MP2':
+                        if orbitals == 'SPATIAL':
+                            ci = magpy.mpwfn(scf, mp2_type=mp2_type)
+                        else:
+                            ci = magpy.mpwfn_so(scf)
+                        ci.solve(normalization=normalization, print_level=print_level)
+                        R_pos.append(ci)
+
+                    # -R displacement
+                    if print_level > 2:
+                        print("R(%d)- Displacement" % (R))
+                    H = hamiltonians.get(self.geom_task(R, -R_disp))
+                    scf = magpy.hfwfn(H, self.charge, self.spin)
+                    scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=scf_guess)
+                    if print_level > 2:
+                        print("Psi4 SCF = ", self.run_psi4_scf(H.molecule))
+                    if C_no is not None:
+                        scf.truncate_virtuals(C_no, scf0.H.basisset)
+                    scf.match_phase(scf0)
+                    if method == 'HF':
+                        R_neg.append(scf)
+                    elif method == 'CID':
+                        if orbitals == 'SPATIAL':
+                            ci = cid(scf)
+                        else:
+                            ci = magpy.ciwfn_so(scf, normalization=normalization)
+                        ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
+                        R_neg.append(ci)
+                    elif method == 'MP2':
+                        if orbitals == 'SPATIAL':
+                            ci = magpy.mpwfn(scf, mp2_type=mp2_type)
+                        else:
+                            ci = magpy.mpwfn_so(scf)
+                        ci.solve(normalization=normalization, print_level=print_level)
+                        R_neg.append(ci)
+
+        # Solve the CID equations for all magnetic-field displacements together
+        if batch_ci is True:
+            magpy.ciwfn.solve_batch(B_pos + B_neg, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
+
         ### Compute full MO overlap matrix for all combinations of perturbed MOs for the chosen AAT tensor element
         if self.single_element is True:
             S = [0 for k in range(4)]
@@ -529,6 +658,20 @@ class AAT(object):
 
         return AAT_00, AAT_0D, AAT_D0, AAT_DD
 
+    def field_task(self, B, B_disp):
+        """
+        Displaced-Hamiltonian task (arguments of utils.displaced_hamiltonian) for a magnetic-field displacement
+        """
+        strength = np.zeros(3)
+        strength[B] = B_disp
+        return ((), 'MAGNETIC-DIPOLE', tuple(strength))
+
+    def geom_task(self, R, R_disp):
+        """
+        Displaced-Hamiltonian task (arguments of utils.displaced_hamiltonian) for a Cartesian displacement
+        """
+        return (((R, R_disp),), None, None)
+
     def mo_overlap(self, bra, bra_basis, ket, ket_basis):
         """
         Compute the MO overlap matrix between two (possibly different) basis sets
@@ -549,12 +692,8 @@ class AAT(object):
             raise Exception("Bra and Ket States do not have the same dimensions: (%d,%d) vs. (%d,%d)." %
                     (bra.shape[0], bra.shape[1], ket.shape[0], ket.shape[1]))
 
-        # Get AO-basis overlap integrals
-        mints = psi4.core.MintsHelper(bra_basis)
-        if bra_basis == ket_basis:
-            S_ao = mints.ao_overlap().np
-        else:
-            S_ao = mints.ao_overlap(bra_basis, ket_basis).np
+        # Get (cached) AO-basis overlap integrals
+        S_ao = ao_overlap(bra_basis, ket_basis)
 
         # Transform to MO basis
         S_mo = bra.T @ S_ao @ ket
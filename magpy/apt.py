@@ -4,7 +4,7 @@ if __name__ == "__main__":
 import psi4
 import magpy
 import numpy as np
-from .utils import shift_geom
+from .utils import Prefetcher, auto_convergence
 
 class APT(object):
 
@@ -38,6 +38,42 @@ class APT(object):
         max_diis = kwargs.pop('max_diis', 8)
         start_diis = kwargs.pop('start_diis', 1)
         print_level = kwargs.pop('print_level', 0)
+        prefetch = kwargs.pop('prefetch', 0) # number of displaced geometries whose ERIs are computed ahead in a helper process
+        # (the helper is spawned and imports the main module again: guard a calling script with if __name__ == "__main__":)
+        batch_scf = kwargs.pop('batch_scf', False) # solve the SCF equations for the +/- field pairs at each geometry together
+
+        # Canonical ('NONE') or local pair-natural-orbital ('PNO') CID wave functions
+        valid_locals = ['NONE', 'PNO']
+        local = kwargs.pop('local', 'NONE').upper()
+        if local not in valid_locals:
+            raise Exception(f"{local:s} is not an allowed choice of local correlation.")
+        if local == 'PNO' and method != 'CID':
+            raise Exception("Local (PNO) wave functions are only available for CID.")
+        pno_threshold = kwargs.pop('pno_threshold', 1e-8) # occupation above which PNOs are kept
+        pair_threshold = kwargs.pop('pair_threshold', 1e-6) # MP2 pair energy above which pairs are kept
+
+        # Conventional or density-fitted MP2
+        valid_mp2_types = ['CONV', 'DF']
+        mp2_type = kwargs.pop('mp2_type', 'CONV').upper()
+        if mp2_type not in valid_mp2_types:
+            raise Exception(f"{mp2_type:s} is not an allowed choice of mp2_type.")
+        self.mp2_type = mp2_type
+
+        # Convergence thresholds: fixed (e_conv, r_conv), or derived from the step sizes and the target precision of each tensor element
+        valid_convergences = ['FIXED', 'AUTO']
+        convergence = kwargs.pop('convergence', 'FIXED').upper()
+        if convergence not in valid_convergences:
+            raise Exception(f"{convergence:s} is not an allowed choice of convergence.")
+        precision = kwargs.pop('precision', 1e-5) # target precision of each tensor element for convergence='AUTO'
+        if convergence == 'AUTO':
+            # dipole from central differences of energies in fields, then central differences in R
+            e_conv, r_conv = auto_convergence(precision, 1/(R_disp*F_disp), variational=(method == 'HF'))
+
+        # Initial guess for the displaced SCF (and CID) wave functions
+        valid_guesses = ['REFERENCE', 'CORE']
+        guess = kwargs.pop('guess', 'REFERENCE').upper()
+        if guess not in valid_guesses:
+            raise Exception(f"{guess:s} is not an allowed choice of SCF guess.")
 
         # Title output
         if print_level >= 1:
@@ -46,26 +82,66 @@ class APT(object):
             print(f"    Method = {method:s}")
             print(f"    r_disp = {R_disp:e}")
             print(f"    f_disp = {F_disp:e}")
+            print(f"    convergence = {convergence:s}")
+            if convergence == 'AUTO':
+                print(f"    precision = {precision:e}")
             print(f"    e_conv = {e_conv:e}")
             print(f"    r_conv = {r_conv:e}")
             print(f"    maxiter = {maxiter:d}")
             print(f"    max_diis = {max_diis:d}")
             print(f"    start_diis = {start_diis:d}")
-
-        params = [e_conv, r_conv, maxiter, max_diis, start_diis, print_level]
+            print(f"    prefetch = {prefetch:d}")
+            print(f"    guess = {guess:s}")
+            print(f"    batch_scf = {batch_scf}")
+            print(f"    local = {local:s}")
+            if method == 'MP2':
+                print(f"    mp2_type = {mp2_type:s}")
+            if local == 'PNO':
+                print(f"    pno_threshold = {pno_threshold:e}")
+                print(f"    pair_threshold = {pair_threshold:e}")
+
+        params = [e_conv, r_conv, maxiter, max_diis, start_diis, print_level, batch_scf]
 
         if print_level > 1:
             print("Initial geometry:")
             print(self.molecule.geometry().np)
 
-        dipder = np.zeros((self.natom*3, 3))
+        # Displaced Hamiltonians in the order they are needed below
+        tasks = []
+        if guess == 'REFERENCE' or local == 'PNO':
+            tasks.append(((), None, None))
         for R in range(self.natom*3):
             M = R//3; alpha = R%3 # atom and coordinate
-
-            mu_p = self.dipole(M, alpha,  R_disp, F_disp, params)
-            mu_m = self.dipole(M, alpha, -R_disp, F_disp, params)
-
-            dipder[R] = (mu_p - mu_m)/(2*R_disp)
+            for disp in [R_disp, -R_disp]:
+                tasks += self.tasks(M, alpha, disp, F_disp)
+        with Prefetcher(self.molecule, tasks, prefetch) as hamiltonians:
+            # Reference SCF wave function, used as the guess for all displaced SCF wave functions
+            scf0 = None
+            if guess == 'REFERENCE' or local == 'PNO':
+                scf0 = magpy.hfwfn(hamiltonians.get(((), None, None)), self.charge, self.spin)
+                scf0.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+            scf_guess = scf0 if guess == 'REFERENCE' else None
+
+            # Reference local CID wave function, whose localized orbitals, pairs, and PNOs are
+            # projected onto the spaces of all displaced CID wave functions
+            ci_ref = None
+            if local == 'PNO':
+                ci_ref = magpy.pnociwfn(scf0, pno_threshold=pno_threshold, pair_threshold=pair_threshold)
+
+            # Reference CID wave function, used as the guess for all displaced CID wave functions
+            ci_guess = None
+            if guess == 'REFERENCE' and method == 'CID':
+                ci_guess = magpy.ciwfn(scf_guess) if ci_ref is None else ci_ref
+                ci_guess.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+
+            dipder = np.zeros((self.natom*3, 3))
+            for R in range(self.natom*3):
+                M = R//3; alpha = R%3 # atom and coordinate
+
+                mu_p = self.dipole(M, alpha,  R_disp, F_disp, params, hamiltonians, scf_guess, ci_guess, ci_ref)
+                mu_m = self.dipole(M, alpha, -R_disp, F_disp, params, hamiltonians, scf_guess, ci_guess, ci_ref)
+
+                dipder[R] = (mu_p - mu_m)/(2*R_disp)
 
         if print_level > 0:
             print("APT (Eh/(e a0^2))")
@@ -74,9 +150,27 @@ class APT(object):
         return dipder
 
 
-    def dipole(self, M, alpha, R_disp, F_disp, params):
+    def tasks(self, M, alpha, R_disp, F_disp):
+        """
+        Displaced-Hamiltonian tasks (arguments of utils.displaced_hamiltonian) for the +/- field pairs of dipole()
+        """
+        tasks = []
+        strength = np.eye(3) * F_disp
+        for beta in range(3):
+            for sign in [1.0, -1.0]:
+                tasks.append((((M*3+alpha, R_disp),), 'ELECTRIC-DIPOLE', tuple(sign*strength[beta])))
+
+        return tasks
+
+
+    def dipole(self, M, alpha, R_disp, F_disp, params, hamiltonians=None, guess=None, ci_guess=None, ci_ref=None):
         """
         Energy wrappter function
+
+        guess: hfwfn object (e.g., at the reference geometry) used as the initial guess for the SCF
+        ci_guess: converged ciwfn object (e.g., at the reference geometry) used as the initial guess for the CID
+        ci_ref: pnociwfn object (e.g., at the reference geometry) whose localized orbitals, pairs, and PNOs are
+        used for local CID wave functions (None: canonical CID)
         """
         e_conv = params[0]
         r_conv = params[1]
@@ -84,40 +178,55 @@ class APT(object):
         max_diis = params[3]
         start_diis = params[4]
         print_level = params[5]
+        batch_scf = params[6] if len(params) > 6 else False
+
+        if hamiltonians is None:
+            tasks = self.tasks(M, alpha, R_disp, F_disp)
+            hamiltonians = Prefetcher(self.molecule, tasks, 0)
+        tasks = iter(self.tasks(M, alpha, R_disp, F_disp))
+
+        # Solve the SCF equations for all six fields at this geometry together
+        if batch_scf is True:
+            wfns = [magpy.hfwfn(hamiltonians.get(task), self.charge, self.spin) for task in tasks]
+            results = magpy.hfwfn.solve_batch(wfns, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=guess)
+            wfns = iter(zip(wfns, results))
 
         mu = np.zeros((3))
-        strength = np.eye(3) * F_disp
         for beta in range(3):
-            H = magpy.Hamiltonian(shift_geom(self.molecule, M*3+alpha, R_disp))
-            H.add_field(field='electric-dipole', strength=strength[beta])
-            scf = magpy.hfwfn(H, self.charge, self.spin)
-            escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+            if batch_scf is True:
+                scf, (escf, C) = next(wfns)
+            else:
+                H = hamiltonians.get(next(tasks))
+                scf = magpy.hfwfn(H, self.charge, self.spin)
+                escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=guess)
 
             if self.method == 'HF':
                 E_pos = escf
             elif self.method == 'CID':
-                ci = magpy.ciwfn(scf)
-                eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                ci = magpy.ciwfn(scf) if ci_ref is None else magpy.pnociwfn(scf, ref=ci_ref)
+                eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
                 E_pos = eci + escf
             elif self.method == 'MP2':
-                ci = magpy.mpwfn(scf)
-                eci, C0, C2 = ci.solve(print_level=print_level)
+                ci = magpy.mpwfn(scf, mp2_type=self.mp2_type)
+                eci, C0, C2 = ci.solve(print_level=print_level, amplitudes=False)
                 E_pos = eci + escf
 
-            H = magpy.Hamiltonian(shift_geom(self.molecule, M*3+alpha, R_disp))
-            H.add_field(field='electric-dipole', strength=-1.0*strength[beta])
-            scf = magpy.hfwfn(H, self.charge, self.spin)
-            escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+            if batch_scf is True:
+                scf, (escf, C) = next(wfns)
+            else:
+                H = hamiltonians.get(next(tasks))
+                scf = magpy.hfwfn(H, self.charge, self.spin)
+                escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=guess)
 
             if self.method == 'HF':
                 E_neg = escf
             elif self.method == 'CID':
-                ci = magpy.ciwfn(scf)
-                eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+                ci = magpy.ciwfn(scf) if ci_ref is None else magpy.pnociwfn(scf, ref=ci_ref)
+                eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
                 E_neg = eci + escf
             elif self.method == 'MP2':
-                ci = magpy.mpwfn(scf)
-                eci, C0, C2 = ci.solve(print_level=print_level)
+                ci = magpy.mpwfn(scf, mp2_type=self.mp2_type)
+                eci, C0, C2 = ci.solve(print_level=print_level, amplitudes=False)
                 E_neg = eci + escf
 
             mu[beta] = -(E_pos - E_neg)/(2 * F_disp)
@@ -3,9 +3,11 @@ if __name__ == "__main__":
 
 import numpy as np
 import psi4
-from opt_einsum import contract
+from opt_einsum import contract, contract_expression
 import psi4
-from .utils import DIIS
+import tempfile
+from .utils import DIIS, JK, MOIntegrals, ao_ladder, batch_contract, pair_index, single_precision, double_precision, PrecisionSwitch, split_contract
+from .hamiltonian import ao_overlap, geometry_key
 
 
 class ciwfn(object):
@@ -22,9 +24,27 @@ class ciwfn(object):
             raise Exception(f"{normalization:s} is not an allowed choice of normalization.")
         self.normalization = normalization
 
-        nt = self.nt = hfwfn.nbf - nfzc # assumes number of MOs = number of AOs
+        # Particle-particle ladder algorithm: AO-direct or with MO-basis vvvv integrals
+        valid_ladders = ['AO', 'MO']
+        ladder = kwargs.pop('ladder', 'AO').upper()
+        if ladder not in valid_ladders:
+            raise Exception(f"{ladder:s} is not an allowed choice of ladder algorithm.")
+        self.ladder = ladder
+
+        # Memory (MB) for each tile of the MO-basis vvvv integrals, which are held in memory or
+        # memory-mapped to scratch files
+        ladder_memory = kwargs.pop('ladder_memory', 1000)
+        valid_storages = ['MEMORY', 'DISK']
+        ladder_storage = kwargs.pop('ladder_storage', 'MEMORY').upper()
+        if ladder_storage not in valid_storages:
+            raise Exception(f"{ladder_storage:s} is not an allowed choice of ladder storage.")
+        self.ladder_storage = ladder_storage
+        self.scratch = kwargs.pop('scratch', None)
+        self.files = []
+
+        nt = self.nt = hfwfn.nmo - nfzc
         no = self.no = hfwfn.ndocc - nfzc
-        nv = self.nv = hfwfn.nbf - self.no - nfzc
+        nv = self.nv = hfwfn.nmo - self.no - nfzc
 
         # Set up orbital subspace slices
         o = self.o = slice(0, no)
@@ -42,8 +62,8 @@ class ciwfn(object):
         if nfzc > 0:
             C = self.hfwfn.C[:,:nfzc] # only core MOs
             Pc = contract('pi,qi->pq', C, C.conj())
-            ERI = self.hfwfn.H.ERI
-            hc = h + 2.0 * contract('pqrs,pq->rs', ERI, Pc) - contract('pqrs,ps->qr', ERI, Pc)
+            J, K = JK(self.hfwfn.H.ERI).jk(Pc)
+            hc = h + 2.0 * J - K
             self.efzc = contract('pq,pq->', (h+hc), Pc)
             h = hc
 
@@ -54,19 +74,30 @@ class ciwfn(object):
         self.h = C.conj().T @ h @ C
         self.h0 = self.h.copy() # Keep original core Hamiltonian
 
-        # AO->MO two-electron integral transformation
-        ERI = self.hfwfn.H.ERI
-        ERI = contract('pqrs,sl->pqrl', ERI, C)
-        ERI = contract('pqrl,rk->pqkl', ERI, C.conj())
-        ERI = contract('pqkl,qj->pjkl', ERI, C)
-        ERI = contract('pjkl,pi->ijkl', ERI, C.conj())
-
-        # Convert to Dirac ordering and build spin-adapted L
-        ERI = self.ERI = ERI.swapaxes(1,2)
-        L = self.L = 2.0 * ERI - ERI.swapaxes(2,3)
+        # AO->MO two-electron integral transformation.  Only the blocks needed
+        # below are built, in Dirac ordering, and the vvvv block only if the
+        # particle-particle ladder is computed in the MO basis.
+        ERI_AO = self.hfwfn.H.ERI
+        self.Cv = C[:,v]
+        mo = MOIntegrals(ERI_AO, C, no)
+        aoao = mo.block('aoao')
+        aooa = mo.block('aooa')
+        ERI = self.ERI = {}
+        for key in ['oooo', 'oovv', 'ovov', 'ovvo']:
+            ERI[key] = np.ascontiguousarray(mo.block(key))
+        if self.ladder == 'MO':
+            # Packed <ab|ef> +/- <ab|fe> for a <= b and e <= f (see pp_ladder())
+            ERI['vvvv+'], ERI['vvvv-'] = self.vvvv_tiles(ERI_AO, ladder_memory)
+        else:
+            ERI['AO'] = ERI_AO # for the AO-direct ladder
+
+        # Spin-adapted L = 2 <pq|rs> - <pq|sr>
+        L = self.L = {}
+        for key in ['oooo', 'oovv', 'ovvo']:
+            L[key] = mo.L(key)
 
         # Build MO-basis Fock matrix (diagonal for canonical MOs, but we don't assume them)
-        F = self.F = self.h + contract('pmqm->pq', L[a,o,a,o])
+        F = self.F = self.h + contract('pmqm->pq', 2.0 * aoao - aooa.swapaxes(2,3))
 
         # Build orbital energy denominators
         eps_occ = np.diag(F)[o]
@@ -75,6 +106,35 @@ class ciwfn(object):
         Dijab = eps_occ.reshape(-1,1,1,1) + eps_occ.reshape(-1,1,1) - eps_vir.reshape(-1,1) - eps_vir
         self.Dijab = Dijab
 
+        # The doubles amplitudes and residuals are iterated (and extrapolated by DIIS) in spin-adapted,
+        # pair-packed form, T[0] = (C2[i,j,a,b] + C2[i,j,b,a])/2 and T[1] = (C2[i,j,a,b] - C2[i,j,b,a])/2
+        # for i <= j and a <= b, which holds all of C2 given its symmetry C2[i,j,a,b] = C2[j,i,b,a].
+        # Only the DIIS subspace and the particle-particle ladder work with the packed arrays: the other
+        # terms of the residual are built from the unpacked C2, which is held alongside T.
+        self.pairs_o = np.triu_indices(no)
+        self.pairs_v = np.triu_indices(nv)
+        self.Po, self.So = pair_index(no)
+        self.Pv, self.Sv = pair_index(nv)
+
+        # Number of unpacked elements represented by each packed one
+        io, jo = self.pairs_o
+        iv, jv = self.pairs_v
+        self.weight = np.outer(np.where(io == jo, 1.0, 2.0), np.where(iv == jv, 1.0, 2.0))
+
+        # Contraction expressions for the iterations, with their paths found once for these shapes
+        C2 = (no, no, nv, nv)
+        packed = (2, len(io), len(iv))
+        self.contractions = {
+            'Fvv': contract_expression('ijae,be->ijab', C2, (nv, nv)),
+            'Foo': contract_expression('imab,mj->ijab', C2, (no, no)),
+            'oooo': contract_expression('mnab,mnij->ijab', C2, ERI['oooo'].shape),
+            'ovov': contract_expression('imeb,maje->ijab', C2, ERI['ovov'].shape),
+            'ovvo': contract_expression('imea,mbej->ijab', C2, ERI['ovvo'].shape),
+            'L_ovvo': contract_expression('miea,mbej->ijab', C2, L['ovvo'].shape),
+            'dot': contract_expression('ijab,ijab->', C2, C2),
+            'rms': contract_expression('ij,xij,xij->', self.weight.shape, packed, packed),
+        }
+
 
     def solve(self, **kwargs):
 
@@ -84,10 +144,23 @@ class ciwfn(object):
         maxiter = kwargs.pop('maxiter', 100)
         max_diis = kwargs.pop('max_diis', 8)
         start_diis = kwargs.pop('start_diis', 1)
+        diis_storage = kwargs.pop('diis_storage', 'MEMORY') # 'MEMORY' or 'DISK' storage of the DIIS subspace
+        diis_precision = kwargs.pop('diis_precision', 'DOUBLE') # 'DOUBLE' or 'SINGLE' precision of the DIIS subspace
+        mixed_precision = kwargs.pop('mixed_precision', False) # early iterations in single precision
+        precision_switch = kwargs.pop('precision_switch', 1e-5) # residual below which double precision is used (also once it stops improving)
         print_level = kwargs.pop('print_level', 0)
+        guess = kwargs.pop('guess', None) # converged ciwfn object (e.g., at the reference geometry) for the initial amplitudes
+
+        # Projected equations by Jacobi updates with DIIS, or the lowest eigenvector of the CID Hamiltonian
+        valid_solvers = ['JACOBI', 'DAVIDSON']
+        solver = kwargs.pop('solver', 'JACOBI').upper()
+        if solver not in valid_solvers:
+            raise Exception(f"{solver:s} is not an allowed choice of solver.")
+        max_space = kwargs.pop('max_space', 16) # Davidson subspace dimension at which it is collapsed
+        collapse = kwargs.pop('collapse', 2) # Ritz vectors (current and previous) kept at a collapse
 
         if print_level > 2:
-            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nbf, self.nt, self.no, self.nv))
+            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nmo, self.nt, self.no, self.nv))
 
         o = self.o
         v = self.v
@@ -99,7 +172,7 @@ class ciwfn(object):
         Dijab = self.Dijab
 
         # SCF check
-        ESCF = self.efzc + 2.0 * contract('ii->',self.h[o,o]) + contract('ijij->', L[o,o,o,o])
+        ESCF = self.efzc + 2.0 * contract('ii->',self.h[o,o]) + contract('ijij->', L['oooo'])
         E0 = self.hfwfn.escf + self.hfwfn.H.enuc
         if print_level > 2:
             print("\nESCF (electronic) = ", ESCF)
@@ -112,13 +185,44 @@ class ciwfn(object):
 
         # initial guess amplitudes
         C0 = 1.0
-        C2 = ERI[o,o,v,v]/Dijab
+        if guess is None:
+            C2 = ERI['oovv']/Dijab
+        else:
+            C2 = self.guess_amplitudes(guess)
 
         # initial CI energy (= MP2 energy)
         eci = self.compute_cid_energy(o, v, L, C2)
 
+        if solver == 'DAVIDSON':
+            eci, C0, C2 = self.davidson(C2, e_conv, r_conv, maxiter, max_space, collapse, print_level)
+            if self.normalization == 'INTERMEDIATE':
+                C0, C2 = 1.0, C2/C0
+
+            if print_level > 2:
+                print("\nCID Equations converged.")
+                print("CID Correlation Energy = ", eci)
+                print("CID Total Energy       = ", eci + E0)
+
+            self.C0 = C0
+            self.C2 = C2
+
+            return eci, C0, C2
+
+        # Packed amplitudes and denominators, and the weights that give packed errors the norm of unpacked ones
+        T = self.pack(C2)
+        D = Dijab[self.pairs_o][(slice(None),) + self.pairs_v]
+        weight = np.sqrt(self.weight)
+
+        # Single-precision integrals and amplitudes for the early iterations
+        single = mixed_precision
+        switch = PrecisionSwitch(precision_switch)
+        if single:
+            F, ERI, L, D = [single_precision(X) for X in (F, ERI, L, D)]
+            T = single_precision(T)
+            C2 = self.unpack(T)
+
         # Setup DIIS object
-        diis = DIIS(C2, max_diis)
+        diis = DIIS(T, max_diis, storage=diis_storage, precision='SINGLE' if single else diis_precision)
 
         if print_level > 2:
             print("CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  MP2" % (0, eci, -eci))
@@ -128,11 +232,12 @@ class ciwfn(object):
         for niter in range(1, maxiter+1):
             eci_last = eci
 
-            r2 = self.r_T2(o, v, eci, F, ERI, L, C2)
-            C2 += r2/Dijab
+            r2 = self.r_T2(o, v, eci, F, ERI, L, C2, T)
+            T += r2/D
+            C2 = self.unpack(T)
             self.C2 = C2
 
-            rms = contract('ijab,ijab->', r2/Dijab, r2/Dijab)
+            rms = self.contractions['rms'](self.weight, r2/D, r2/D)
             rms = np.sqrt(rms)
 
             eci = self.compute_cid_energy(o, v, L, C2)
@@ -142,7 +247,18 @@ class ciwfn(object):
             if print_level > 2:
                 print('CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  rms = %.5E' % (niter, eci, ediff, rms))
 
-            if ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
+            if single:
+                # Finish in double precision, with a new DIIS subspace
+                if switch(abs(rms)):
+                    single = False
+                    F, ERI, L = self.F, self.ERI, self.L
+                    D = Dijab[self.pairs_o][(slice(None),) + self.pairs_v]
+                    T = double_precision(T)
+                    C2 = self.unpack(T)
+                    eci = self.compute_cid_energy(o, v, L, C2)
+                    diis = DIIS(T, max_diis, storage=diis_storage, precision=diis_precision)
+                    continue
+            elif ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
                 if print_level > 2:
                     print("\nCID Equations converged.")
                     print("CID Correlation Energy = ", eci)
@@ -151,7 +267,7 @@ class ciwfn(object):
                 # Re-normalize if necessary
                 if self.normalization == 'FULL':
                     C0, C2 = self.normalize(o, v, C2)
-                    norm = np.sqrt(C0*C0 + 2.0 * contract('ijab,ijab->', C2.conj(), C2) - contract('ijab,ijba', C2.conj(), C2))
+                    norm = np.sqrt(C0*C0 + self.contractions['dot'](2.0*C2.conj() - C2.swapaxes(2,3).conj(), C2))
                     if print_level > 2:
                         print(f"Normalization check = {norm:18.12f}")
 
@@ -160,32 +276,476 @@ class ciwfn(object):
 
                 return eci, C0, C2
 
-            diis.add_error_vector(C2, r2/Dijab)
+            diis.add_error_vector(T, weight * r2/D)
             if niter >= start_diis:
-                C2 = diis.extrapolate(C2)
+                T = diis.extrapolate(T)
+                C2 = self.unpack(T)
+
+        raise Exception("CID iterations failed to converge in %d cycles." % (maxiter))
+
+
+    @staticmethod
+    def solve_batch(wfns, **kwargs):
+        """
+        Solve the CID equations together for a batch of wave functions with the same numbers of
+        active orbitals (e.g., at different external fields at one geometry)
+
+        The amplitudes, Fock matrices, and integrals of all members are stacked with a leading batch
+        index, so that each term of the residual is one batched matrix multiplication for the whole
+        batch (see batch_contract()).  If the members share the AO-basis ERIs and use the AO-direct
+        ladder, the ladders of all members are also one contraction with the ERIs.  Each member has
+        its own DIIS space and drops out of the batch when it converges, so the iterations of each
+        member are those of solve() with the Jacobi solver.
+
+        Parameters
+        ----------
+        wfns: list of ciwfn objects
+        e_conv, r_conv, maxiter, max_diis, start_diis, print_level: as for solve()
+        guess: converged ciwfn object used for the initial amplitudes of all members, or None for the MP2 amplitudes
+
+        Returns
+        -------
+        list of (eci, C0, C2) for each member, as returned by solve()
+        """
+        e_conv = kwargs.pop('e_conv', 1e-7)
+        r_conv = kwargs.pop('r_conv', 1e-7)
+        maxiter = kwargs.pop('maxiter', 100)
+        max_diis = kwargs.pop('max_diis', 8)
+        start_diis = kwargs.pop('start_diis', 1)
+        print_level = kwargs.pop('print_level', 0)
+        guess = kwargs.pop('guess', None)
+
+        wfn0 = wfns[0]
+        for wfn in wfns:
+            if (wfn.no, wfn.nv) != (wfn0.no, wfn0.nv):
+                raise Exception("Batched CID requires wave functions with the same numbers of active orbitals.")
+        o = wfn0.o
+        v = wfn0.v
+        io, jo = wfn0.pairs_o
+
+        # One AO-direct ladder for the batch if all members share the AO-basis ERIs
+        ERI_AO = wfn0.hfwfn.H.ERI
+        shared_ladder = all(wfn.ladder == 'AO' and geometry_key(wfn.hfwfn.H.molecule) == geometry_key(wfn0.hfwfn.H.molecule) for wfn in wfns)
+
+        # Stacked integrals, packed denominators, and initial amplitudes
+        F = {'oo': np.array([wfn.F[o,o] for wfn in wfns]), 'vv': np.array([wfn.F[v,v] for wfn in wfns])}
+        ERI = {key: np.array([wfn.ERI[key] for wfn in wfns]) for key in ['oooo', 'oovv', 'ovov', 'ovvo']}
+        L = {key: np.array([wfn.L[key] for wfn in wfns]) for key in ['oovv', 'ovvo']}
+        Cv = np.array([wfn.Cv for wfn in wfns])
+        D = np.array([wfn.Dijab[wfn.pairs_o][(slice(None),) + wfn.pairs_v] for wfn in wfns])[:,None]
+        if guess is None:
+            C2 = np.array([wfn.ERI['oovv']/wfn.Dijab for wfn in wfns])
+        else:
+            C2 = np.array([wfn.guess_amplitudes(guess) for wfn in wfns])
+        T = wfn0.pack(C2)
+        weight = np.sqrt(wfn0.weight)
+
+        def energy(L, C2):
+            return batch_contract('xijab,xijab->x', C2, L['oovv'])
+
+        def residual(batch, E, F, ERI, L, Cv, C2, T):
+            r2 = 0.5 * ERI['oovv'].conj()
+            r2 += batch_contract('xijae,xbe->xijab', C2, F['vv'])
+            r2 -= batch_contract('ximab,xmj->xijab', C2, F['oo'])
+            r2 += 0.5 * batch_contract('xmnab,xmnij->xijab', C2, ERI['oooo'])
+
+            r2 -= batch_contract('ximeb,xmaje->xijab', C2, ERI['ovov'])
+            r2 -= batch_contract('ximea,xmbej->xijab', C2, ERI['ovvo'])
+            r2 += batch_contract('xmiea,xmbej->xijab', C2, L['ovvo'])
+
+            r2 += r2.swapaxes(1,2).swapaxes(3,4)
+            r2 -= E.reshape(-1,1,1,1,1) * C2
+            r2 = wfn0.pack(r2)
+
+            # Particle-particle ladder, with the AO-basis amplitudes of all members and pairs
+            # contracted with the ERIs at once
+            if shared_ladder:
+                X = batch_contract('xpef,xle->xplf', C2[:, io, jo], Cv)
+                X = batch_contract('xplf,xsf->xpls', X, Cv)
+                X = split_contract('mlns,...ls->...mn', ERI_AO, X)
+                X = batch_contract('xpmn,xma->xpan', X, Cv.conj())
+                X = batch_contract('xpan,xnb->xpab', X, Cv.conj())
+                return r2 + wfn0.pack(X, packed_o=True)
+
+            return r2 + np.array([wfn.pp_ladder(wfn.ERI, C2[b], T[b]) for b, wfn in enumerate(batch)])
+
+        eci = energy(L, C2)
+        diis = [DIIS(T[b], max_diis) for b in range(len(wfns))]
+
+        results = [None] * len(wfns)
+        active = np.arange(len(wfns)) # Members not yet converged
+        for niter in range(1, maxiter+1):
+            eci_last = eci
+
+            r2 = residual([wfns[b] for b in active], eci, F, ERI, L, Cv, C2, T)
+            T += r2/D
+            C2 = wfn0.unpack(T)
 
+            rms = np.sqrt(contract('ij,xyij,xyij->x', wfn0.weight, r2/D, r2/D))
 
-    def r_T2(self, o, v, E, F, ERI, L, C2):
-        r2 = 0.5 * ERI[v,v,o,o].swapaxes(0,2).swapaxes(1,3).copy()
-        r2 += contract('ijae,be->ijab', C2, F[v,v])
-        r2 -= contract('imab,mj->ijab', C2, F[o,o])
-        r2 += 0.5 * contract('mnab,mnij->ijab', C2, ERI[o,o,o,o])
-        r2 += 0.5 * contract('ijef,abef->ijab', C2, ERI[v,v,v,v])
+            eci = energy(L, C2)
+            ediff = eci - eci_last
 
-        r2 -= contract('imeb,maje->ijab', C2, ERI[o,v,o,v])
-        r2 -= contract('imea,mbej->ijab', C2, ERI[o,v,v,o])
-        r2 += contract('miea,mbej->ijab', C2, L[o,v,v,o])
+            if print_level > 2:
+                print("CID Iter %3d: active = %d  max dE = %.5E  max rms = %.5E" % (niter, len(active), np.max(np.abs(ediff)), np.max(np.abs(rms))))
+
+            # Store converged members and remove them from the batch
+            converged = (np.abs(ediff) < e_conv) & (np.abs(rms) < r_conv)
+            for b in np.flatnonzero(converged):
+                wfn = wfns[active[b]]
+                C0, C2_b = 1.0, C2[b]
+                E_b = eci[b]
+                if not np.iscomplexobj(wfn.ERI['oovv']):
+                    C2_b, E_b = C2_b.real.copy(), E_b.real
+                if wfn.normalization == 'FULL':
+                    C0, C2_b = wfn.normalize(o, v, C2_b)
+                wfn.C0 = C0
+                wfn.C2 = C2_b
+                results[active[b]] = (E_b, C0, C2_b)
+
+            if converged.all():
+                return results
+
+            keep = ~converged
+            active = active[keep]
+            F = {key: X[keep] for key, X in F.items()}
+            ERI = {key: X[keep] for key, X in ERI.items()}
+            L = {key: X[keep] for key, X in L.items()}
+            Cv, D, T, C2, eci, r2 = Cv[keep], D[keep], T[keep], C2[keep], eci[keep], r2[keep]
+
+            for b in range(len(active)):
+                diis[active[b]].add_error_vector(T[b], weight * r2[b]/D[b])
+                if niter >= start_diis:
+                    T[b] = diis[active[b]].extrapolate(T[b])
+            C2 = wfn0.unpack(T)
+
+        # Convergence failure
+        raise Exception("Batched CID iterations failed to converge in %d cycles." % (maxiter))
+
+
+    def guess_amplitudes(self, guess):
+        """
+        Initial doubles amplitudes from the converged solution of another wave function (e.g., at a
+        nearby geometry or field), transformed to the orbitals of this one
+
+        With S[p,q] = <p|q'> the overlap of the active orbitals of the guess (p) with those of this
+        wave function (q'), the amplitudes in intermediate normalization are
+
+            C2'[k,l,c,d] = sum_ijab C2[i,j,a,b] S[i,k] S[j,l] S*[a,c] S*[b,d],
+
+        which also makes their phases consistent with those of the current orbitals.
+
+        Parameters
+        ----------
+        guess: converged ciwfn object with the same numbers of active orbitals
+
+        Returns
+        -------
+        C2: initial-guess doubles amplitudes in intermediate normalization (NumPy array)
+        """
+        if (guess.no, guess.nv) != (self.no, self.nv):
+            raise Exception("Guess and current wave functions do not have the same numbers of active orbitals: (%d,%d) vs. (%d,%d)." %
+                    (guess.no, guess.nv, self.no, self.nv))
+
+        # Active-orbital overlaps across the (possibly different) basis sets
+        C_guess = guess.hfwfn.C[:,guess.nfzc:]
+        C = self.hfwfn.C[:,self.nfzc:]
+        S = C_guess.conj().T @ ao_overlap(guess.hfwfn.H.basisset, self.hfwfn.H.basisset) @ C
+
+        Soo = S[self.o,self.o]
+        Svv = S[self.v,self.v].conj()
+
+        C2 = contract('ijab,ik,jl,ac,bd->klcd', guess.C2/guess.C0, Soo, Soo, Svv, Svv)
+        if not np.iscomplexobj(self.ERI['oovv']):
+            C2 = C2.real.copy()
+
+        return C2
+
+
+    def davidson(self, C2, e_conv, r_conv, maxiter, max_space, collapse, print_level=0):
+        """
+        Lowest eigenpair of the CID Hamiltonian (relative to the SCF energy) by Davidson's method
+
+        The CI vector x = (C0, T) holds the reference coefficient and the packed doubles (see pack()),
+        with the metric G = weight * (1, 3) on T under which 1 + <T|G|T> is the norm of the CID
+        wave function in intermediate normalization.  The sigma vector,
+
+            (sigma0, sigmaT) = (<b|G|T>, C0 b + A T),
+
+        is built from the projected residual r_T2() = b + A T - E T, and the correction vectors are
+        preconditioned with the orbital-energy denominators Dijab.  The subspace is collapsed to the
+        current (and previous) Ritz vector when its dimension reaches max_space.
+
+        Parameters
+        ----------
+        C2: initial guess doubles amplitudes, in intermediate normalization (NumPy array)
+        e_conv: convergence threshold for the correlation energy
+        r_conv: convergence threshold for the residual (in intermediate normalization)
+        maxiter: maximum number of iterations
+        max_space: maximum dimension of the subspace
+        collapse: number of Ritz vectors kept at a collapse (1 or 2)
+        print_level: amount of output
+
+        Returns
+        -------
+        eci: CID correlation energy
+        C0: reference coefficient (real and positive)
+        C2: doubles amplitudes, with C0 fully normalized (NumPy array)
+        """
+        o = self.o
+        v = self.v
+        F = self.F
+        ERI = self.ERI
+        L = self.L
+
+        b = self.pack(ERI['oovv'].conj())
+        shape = b.shape
+        D = self.Dijab[self.pairs_o][(slice(None),) + self.pairs_v]
+        G = np.concatenate(([1.0], (self.weight * np.array([1.0, 3.0]).reshape(-1,1,1)).ravel()))
+
+        # The antisymmetric amplitudes of i = j or a = b pairs vanish, and are kept out of the subspace
+        io, jo = self.pairs_o
+        iv, jv = self.pairs_v
+        mask = np.ones(shape)
+        mask[1] = np.outer(io != jo, iv != jv)
+
+        def sigma(x):
+            T = x[1:].reshape(shape)
+            AT = self.r_T2(o, v, 0.0, F, ERI, L, self.unpack(T), T) - b
+            return np.concatenate(([np.vdot(b, G[1:].reshape(shape) * T)], (mask * (x[0] * b + AT)).ravel()))
+
+        def orthonormalize(x, V, sx=None, S=None):
+            # Gram-Schmidt (twice) in the G metric against the subspace, applied also to the sigma vector if given
+            for _ in range(2):
+                for k, u in enumerate(V):
+                    c = np.vdot(u, G * x)
+                    x = x - c * u
+                    if sx is not None:
+                        sx = sx - c * S[k]
+            norm = np.sqrt(np.vdot(x, G * x).real)
+            return x/norm, (None if sx is None else sx/norm), norm
+
+        # Subspace of the reference, whose sigma vector is just (0, b), and the guess doubles
+        dtype = np.result_type(b, C2)
+        e0 = np.zeros(G.size, dtype=dtype); e0[0] = 1.0
+        s0 = np.concatenate(([0.0], (mask * b).ravel())).astype(dtype)
+        x, _, norm = orthonormalize(np.concatenate(([0.0], (mask * self.pack(C2)).ravel())).astype(dtype), [e0])
+        V = [e0, x]
+        S = [s0, sigma(x)]
+
+        eci = 0.0
+        x_last = None
+        for niter in range(1, maxiter+1):
+            eci_last = eci
+
+            # Ritz pair of the lowest eigenvalue
+            Vm = np.array(V); Sm = np.array(S)
+            h = Vm.conj() @ (G * Sm).T
+            h = 0.5 * (h + h.conj().T)
+            w, U = np.linalg.eigh(h)
+            eci = w[0]
+            x = U[:,0] @ Vm
+            sx = U[:,0] @ Sm
+            R = sx - eci * x
+
+            # Residual and its norm in intermediate normalization, as in the projected equations
+            C0 = x[0]
+            RT = R[1:].reshape(shape)
+            rms = np.sqrt(np.sum(self.weight * np.abs(RT/D)**2)) / abs(C0)
+            ediff = eci - eci_last
+
+            if print_level > 2:
+                print('CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  rms = %.5E  nvec = %d' % (niter, eci, ediff, rms, len(V)))
+
+            if ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
+                # Fix the phase of the normalized vector so that C0 is real and positive
+                x = x * (abs(C0)/C0)
+                C0 = x[0].real
+                return eci, C0, self.unpack(x[1:].reshape(shape))
+
+            # Collapse the subspace to the current (and previous) Ritz vectors, whose sigma
+            # vectors are combinations of those of the subspace
+            if len(V) >= max_space:
+                keep = [(x, sx)] if (collapse < 2 or x_last is None) else [(x, sx), x_last]
+                V = [e0]; S = [s0]
+                for u, su in keep:
+                    u, su, norm = orthonormalize(u, V, su, S)
+                    if norm > 1e-8:
+                        V.append(u); S.append(su)
+            x_last = (x, sx)
+
+            # Preconditioned correction; the reference is always in the subspace
+            delta = np.concatenate(([0.0], (RT/(D + eci)).ravel()))
+            delta, _, norm = orthonormalize(delta, V)
+            V.append(delta)
+            S.append(sigma(delta))
+
+        raise Exception("CID Davidson iterations failed to converge in %d cycles." % (maxiter))
+
+
+    def r_T2(self, o, v, E, F, ERI, L, C2, T):
+        """
+        Doubles residual in packed form (see pack())
+
+        Apart from the particle-particle ladder (see pp_ladder()), the terms are built from the unpacked
+        amplitudes as a full (o,o,v,v) array, which is then packed.
+
+        Parameters
+        ----------
+        o, v: occupied and virtual orbital slices
+        E: current correlation energy
+        F: MO-basis Fock matrix (NumPy array)
+        ERI, L: dicts of MO-basis integrals and spin-adapted integrals (NumPy arrays)
+        C2: doubles amplitudes (NumPy array)
+        T: packed doubles amplitudes (NumPy array)
+
+        Returns
+        -------
+        r2: packed doubles residual (NumPy array)
+        """
+        r2 = 0.5 * ERI['oovv'].conj()
+        r2 += self.contractions['Fvv'](C2, F[v,v])
+        r2 -= self.contractions['Foo'](C2, F[o,o])
+        r2 += 0.5 * self.contractions['oooo'](C2, ERI['oooo'])
+
+        r2 -= self.contractions['ovov'](C2, ERI['ovov'])
+        r2 -= self.contractions['ovvo'](C2, ERI['ovvo'])
+        r2 += self.contractions['L_ovvo'](C2, L['ovvo'])
 
         r2 += r2.swapaxes(0,1).swapaxes(2,3)
         r2 -= E*C2
-        return r2
+
+        # The ladder has the pair symmetry already, so it is added after symmetrization
+        return self.pack(r2) + self.pp_ladder(ERI, C2, T)
+
+
+    def vvvv_tiles(self, ERI_AO, memory):
+        """
+        Packed MO-basis integrals for the particle-particle ladder (see pp_ladder()), built by tiles
+
+        The rows ab (a <= b) of each tile are those of a block of a, for which <ab|ef> = (ae|bf) is
+        transformed from the AO basis directly, so that neither the full vvvv block nor its
+        half-transformed integrals are ever held in memory.  The number of a per tile is chosen
+        so that the transformation of a tile and its rows fit in the given memory.
+
+        Parameters
+        ----------
+        ERI_AO: AO-basis two-electron integrals in chemist's notation (NumPy array)
+        memory: memory (MB) for each tile
+
+        Returns
+        -------
+        vvvv_p, vvvv_m: packed <ab|ef> +/- <ab|fe> (NumPy arrays, or memmaps with ladder_storage='DISK')
+        """
+        Cv = self.Cv
+        nbf, nv = Cv.shape
+        iv, jv = np.triu_indices(nv)
+        npv = len(iv)
+        dtype = np.result_type(ERI_AO, Cv)
+        itemsize = np.dtype(dtype).itemsize
+
+        if self.ladder_storage == 'DISK':
+            vvvv = []
+            for _ in range(2):
+                f = tempfile.TemporaryFile(dir=self.scratch)
+                self.files.append(f)
+                vvvv.append(np.memmap(f, dtype=dtype, mode='w+', shape=(npv, npv)))
+        else:
+            vvvv = [np.zeros((npv, npv), dtype=dtype) for _ in range(2)]
+
+        # Tiles of rows ab for blocks of a, within the memory for the transformation of a block
+        # (a|ls) and <ab|ef>, and its packed rows
+        na = int(min(nv, max(1, memory * 1024**2 // (itemsize * (nbf**3 + nv**3 + 2*nv*npv)))))
+        start = np.searchsorted(iv, np.arange(nv+1))
+        self.ladder_tiles = []
+        for a0 in range(0, nv, na):
+            a1 = min(a0 + na, nv)
+            rows = slice(start[a0], start[a1])
+            self.ladder_tiles.append(rows)
+
+            X = split_contract('mnls,ma->anls', ERI_AO, Cv[:,a0:a1].conj())
+            X = contract('anls,ne,lb,sf->abef', X, Cv, Cv.conj(), Cv)
+            X = np.concatenate([X[a-a0, a:] for a in range(a0, a1)])
+            vvvv[0][rows] = (X + X.swapaxes(1,2))[:, iv, jv] * np.where(iv == jv, 0.5, 1.0)
+            vvvv[1][rows] = (X - X.swapaxes(1,2))[:, iv, jv]
+
+        return vvvv
+
+
+    def pp_ladder(self, ERI, C2, T):
+        """
+        Particle-particle ladder term, sum_ef C2[i,j,e,f] <ab|ef>, in packed form
+
+        With the MO-basis integrals, the symmetric and antisymmetric amplitudes are contracted with
+        <ab|ef> + <ab|fe> and <ab|ef> - <ab|fe> over e <= f, about a quarter of the unpacked cost, one
+        tile of rows ab at a time (see vvvv_tiles()).  With the AO-direct algorithm, the ladder is only
+        built for the i <= j pairs.
+
+        Parameters
+        ----------
+        ERI: dict of MO-basis (and AO-basis) integrals (NumPy arrays)
+        C2: doubles amplitudes (NumPy array)
+        T: packed doubles amplitudes (NumPy array)
+
+        Returns
+        -------
+        X: packed ladder contribution to the doubles residual (NumPy array)
+        """
+        if self.ladder == 'MO':
+            X = np.zeros(T.shape, dtype=np.result_type(T, ERI['vvvv+']))
+            for rows in self.ladder_tiles:
+                X[0][:,rows] = T[0] @ ERI['vvvv+'][rows].T
+                X[1][:,rows] = T[1] @ ERI['vvvv-'][rows].T
+            return X
+
+        return self.pack(ao_ladder(ERI['AO'], C2[self.pairs_o], self.Cv), packed_o=True)
+
+
+    def pack(self, X, packed_o=False):
+        """
+        Spin-adapted pair packing, X[i,j,a,b] -> (X[i,j,a,b] +/- X[i,j,b,a])/2 for i <= j and a <= b
+
+        Parameters
+        ----------
+        X: doubles amplitudes or residual with the symmetry X[i,j,a,b] = X[j,i,b,a], with any
+            leading (batch) indices (NumPy array)
+        packed_o: if True, X holds only the i <= j pairs, as X[ij,a,b]
+
+        Returns
+        -------
+        T: packed array of shape (..., 2, no*(no+1)/2, nv*(nv+1)/2) (NumPy array)
+        """
+        if not packed_o:
+            io, jo = self.pairs_o
+            X = X[..., io, jo, :, :]
+        iv, jv = self.pairs_v
+        Xt = X.swapaxes(-1,-2)
+        return np.stack([0.5 * (X + Xt)[..., iv, jv], 0.5 * (X - Xt)[..., iv, jv]], axis=-3)
+
+
+    def unpack(self, T):
+        """
+        Unpack spin-adapted, pair-packed amplitudes (see pack())
+
+        Parameters
+        ----------
+        T: packed doubles amplitudes, with any leading (batch) indices (NumPy array)
+
+        Returns
+        -------
+        C2: doubles amplitudes (NumPy array)
+        """
+        Po = self.Po[:,:,None,None]
+        Pv = self.Pv[None,None,:,:]
+        S = self.So[:,:,None,None] * self.Sv[None,None,:,:]
+        return T[...,0,:,:][..., Po, Pv] + S * T[...,1,:,:][..., Po, Pv]
 
 
     def compute_cid_energy(self, o, v, L, C2):
-        eci = 1.0 * contract('ijab,ijab->', C2, L[o,o,v,v])
+        eci = 1.0 * self.contractions['dot'](C2, L['oovv'])
         return eci
 
     def normalize(self, o, v, C2):
-        N = 1.0/np.sqrt(1.0 + contract('ijab,ijab->', (2*C2-C2.swapaxes(2,3)).conj(), C2))
+        N = 1.0/np.sqrt(1.0 + self.contractions['dot']((2*C2-C2.swapaxes(2,3)).conj(), C2))
         C0 = N; C2 = N * C2
         return C0, C2
@@ -3,9 +3,10 @@ if __name__ == "__main__":
 
 import numpy as np
 import psi4
-from opt_einsum import contract
+from opt_einsum import contract, contract_expression
 import psi4
-from .utils import DIIS
+from .utils import DIIS, JK, MOIntegrals, ao_ladder, single_precision, double_precision, PrecisionSwitch
+from .hamiltonian import ao_overlap
 
 
 class ciwfn_so(object):
@@ -22,6 +23,13 @@ class ciwfn_so(object):
             raise Exception(f"{normalization:s} is not an allowed choice of normalization.")
         self.normalization = normalization
 
+        # Particle-particle ladder algorithm: AO-direct or with MO-basis vvvv integrals
+        valid_ladders = ['AO', 'MO']
+        ladder = kwargs.pop('ladder', 'AO').upper()
+        if ladder not in valid_ladders:
+            raise Exception(f"{ladder:s} is not an allowed choice of ladder algorithm.")
+        self.ladder = ladder
+
         ## Transform Hamiltonian to MO basis
 
         # AO-basis one-electron Hamiltonian
@@ -33,8 +41,8 @@ class ciwfn_so(object):
         if nfzc > 0:
             C = self.hfwfn.C[:,:nfzc] # only core MOs
             Pc = contract('pi,qi->pq', C, C.conj())
-            ERI = self.hfwfn.H.ERI
-            hc = h + 2.0 * contract('pqrs,pq->rs', ERI, Pc) - contract('pqrs,ps->qr', ERI, Pc)
+            J, K = JK(self.hfwfn.H.ERI).jk(Pc)
+            hc = h + 2.0 * J - K
             self.efzc = contract('pq,pq->', (h+hc), Pc)
             h = hc
 
@@ -44,18 +52,9 @@ class ciwfn_so(object):
         # AO->MO one-electron integral transformation
         h_mo = C.conj().T @ h @ C
 
-        # AO->MO two-electron integral transformation
-        ERI = self.hfwfn.H.ERI
-        ERI = contract('pqrs,sl->pqrl', ERI, C)
-        ERI = contract('pqrl,rk->pqkl', ERI, C.conj())
-        ERI = contract('pqkl,qj->pjkl', ERI, C)
-        ERI = contract('pjkl,pi->ijkl', ERI, C.conj())
-        ERI_MO = ERI
-
         ## Translate Hamiltonian to spin orbital basis
-        data = h_mo.dtype
 
-        nt = self.nt = 2*(hfwfn.nbf - nfzc) # assumes number of MOs = number of AOs
+        nt = self.nt = 2*(hfwfn.nmo - nfzc)
         no = self.no = 2*(hfwfn.ndocc - nfzc)
         nv = self.nv = self.nt - self.no
         self.nfzc = 2*nfzc
@@ -65,24 +64,27 @@ class ciwfn_so(object):
         v = self.v = slice(no, nt)
         a = self.a = slice(0, nt)
 
-        # Convert to Dirac ordering
-        h = np.zeros((nt,nt), dtype=data)
-        for p in range(nt):
-            for q in range(nt):
-                h[p,q] = h_mo[p//2,q//2] * (p%2 == q%2)
-        self.h = h
-
-        ERI = np.zeros((nt, nt, nt, nt), dtype=data)
-        for p in range(nt):
-            for q in range(nt):
-                for r in range(nt):
-                    for s in range(nt):
-                        ERI[p,q,r,s] = ERI_MO[p//2,r//2,q//2,s//2] * (p%2 == r%2) * (q%2 == s%2)
-                        ERI[p,q,r,s] -= ERI_MO[p//2,s//2,q//2,r//2] * (p%2 == s%2) * (q%2 == r%2)
-        self.ERI = ERI
+        # Spin-orbital one-electron Hamiltonian
+        self.h = np.kron(h_mo, np.eye(2))
+
+        # AO->MO two-electron integral transformation to antisymmetrized spin-orbital form.
+        # Only the blocks needed below are built, and the vvvv block only if the
+        # particle-particle ladder is computed in the MO basis.
+        ERI_AO = self.hfwfn.H.ERI
+        self.Cv = C[:,no//2:]
+        mo = MOIntegrals(ERI_AO, C, no//2)
+        aoao = mo.so_block('aoao')
+        ERI = self.ERI = {}
+        ERI['oooo'] = np.ascontiguousarray(mo.so_block('oooo'))
+        ERI['oovv'] = np.ascontiguousarray(mo.so_block('oovv'))
+        ERI['voov'] = np.ascontiguousarray(-aoao[v,:,v,:].swapaxes(2,3))
+        if self.ladder == 'MO':
+            ERI['vvvv'] = np.ascontiguousarray(mo.so_block('vvvv'))
+        else:
+            ERI['AO'] = ERI_AO # for the AO-direct ladder
 
         # Build MO-basis Fock matrix (diagonal for canonical MOs, but we don't assume that)
-        F = self.F = self.h + contract('pmqm->pq', ERI[a,o,a,o])
+        F = self.F = self.h + contract('pmqm->pq', aoao)
 
         # Build orbital energy denominators
         eps_occ = np.diag(F)[o]
@@ -91,6 +93,18 @@ class ciwfn_so(object):
         Dijab = eps_occ.reshape(-1,1,1,1) + eps_occ.reshape(-1,1,1) - eps_vir.reshape(-1,1) - eps_vir
         self.Dijab = Dijab
 
+        # Contraction expressions for the iterations, with their paths found once for these shapes
+        C2 = (no, no, nv, nv)
+        self.contractions = {
+            'Fvv': contract_expression('ijae,be->ijab', C2, (nv, nv)),
+            'Foo': contract_expression('imab,mj->ijab', C2, (no, no)),
+            'oooo': contract_expression('mnab,mnij->ijab', C2, ERI['oooo'].shape),
+            'voov': contract_expression('mjeb,amie->ijab', C2, ERI['voov'].shape),
+            'dot': contract_expression('ijab,ijab->', C2, C2),
+        }
+        if self.ladder == 'MO':
+            self.contractions['vvvv'] = contract_expression('ijef,abef->ijab', C2, ERI['vvvv'].shape)
+
 
     def solve(self, **kwargs):
 
@@ -100,10 +114,15 @@ class ciwfn_so(object):
         maxiter = kwargs.pop('maxiter', 100)
         max_diis = kwargs.pop('max_diis', 8)
         start_diis = kwargs.pop('start_diis', 1)
+        diis_storage = kwargs.pop('diis_storage', 'MEMORY') # 'MEMORY' or 'DISK' storage of the DIIS subspace
+        diis_precision = kwargs.pop('diis_precision', 'DOUBLE') # 'DOUBLE' or 'SINGLE' precision of the DIIS subspace
+        mixed_precision = kwargs.pop('mixed_precision', False) # early iterations in single precision
+        precision_switch = kwargs.pop('precision_switch', 1e-5) # residual below which double precision is used (also once it stops improving)
         print_level = kwargs.pop('print_level', 0)
+        guess = kwargs.pop('guess', None) # converged ciwfn object (e.g., at the reference geometry) for the initial amplitudes
 
         if print_level > 2:
-            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nbf, self.nt, self.no, self.nv))
+            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nmo, self.nt, self.no, self.nv))
 
         o = self.o
         v = self.v
@@ -114,7 +133,7 @@ class ciwfn_so(object):
         Dijab = self.Dijab
 
         # SCF check
-        ESCF = contract('ii->',self.h[o,o]) + 0.5 * contract('ijij->', ERI[o,o,o,o])
+        ESCF = contract('ii->',self.h[o,o]) + 0.5 * contract('ijij->', ERI['oooo'])
         E0 = self.hfwfn.escf + self.hfwfn.H.enuc
         if print_level > 2:
             print("ESCF (electronic) = ", ESCF)
@@ -127,13 +146,23 @@ class ciwfn_so(object):
 
         # initial guess amplitudes -- intermediate normalization
         C0 = 1.0
-        C2 = ERI[o,o,v,v]/Dijab
+        if guess is None:
+            C2 = ERI['oovv']/Dijab
+        else:
+            C2 = self.guess_amplitudes(guess)
 
         # initial CI energy (= MP2 energy)
         eci = self.compute_cid_energy(o, v, ERI, C2)
 
+        # Single-precision integrals and amplitudes for the early iterations
+        single = mixed_precision
+        switch = PrecisionSwitch(precision_switch)
+        if single:
+            F, ERI, Dijab = [single_precision(X) for X in (F, ERI, Dijab)]
+            C2 = single_precision(C2)
+
         # Setup DIIS object
-        diis = DIIS(C2, max_diis)
+        diis = DIIS(C2, max_diis, storage=diis_storage, precision='SINGLE' if single else diis_precision)
 
         if print_level > 2:
             print("CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  MP2" % (0, eci, -eci))
@@ -146,7 +175,7 @@ class ciwfn_so(object):
             r2 = self.r_T2(o, v, eci, F, ERI, C2)
             C2 += r2/Dijab
 
-            rms = contract('ijab,ijab->', r2/Dijab, r2/Dijab)
+            rms = self.contractions['dot'](r2/Dijab, r2/Dijab)
             rms = np.sqrt(rms)
 
             eci = self.compute_cid_energy(o, v, ERI, C2)
@@ -156,7 +185,19 @@ class ciwfn_so(object):
             if print_level > 2:
                 print('CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  rms = %.5E' % (niter, eci, ediff, rms))
 
-            if ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
+            if single:
+                # Finish in double precision, with a new DIIS subspace
+                if switch(abs(rms)):
+                    single = False
+                    F, ERI, Dijab = self.F, self.ERI, self.Dijab
+                    C2 = double_precision(C2)
+                    # Restore the antisymmetry lost to single-precision round-off, which the iterations remove only slowly
+                    C2 = 0.5 * (C2 - C2.swapaxes(2,3))
+                    C2 = 0.5 * (C2 - C2.swapaxes(0,1))
+                    eci = self.compute_cid_energy(o, v, ERI, C2)
+                    diis = DIIS(C2, max_diis, storage=diis_storage, precision=diis_precision)
+                    continue
+            elif ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
                 if print_level > 2:
                     print("\nCID Equations converged.")
                     print("CID Correlation Energy = ", eci)
@@ -165,7 +206,7 @@ class ciwfn_so(object):
                 # Re-normalize if necessary
                 if self.normalization == 'FULL':
                     C0, C2 = self.normalize(o, v, C2)
-                    norm = np.sqrt(C0*C0 + (1/4) * contract('ijab,ijab', C2.conj(), C2))
+                    norm = np.sqrt(C0*C0 + (1/4) * self.contractions['dot'](C2.conj(), C2))
                     if print_level > 2:
                         print(f"Normalization check = {norm:18.12f}")
                 self.C0 = C0
@@ -177,28 +218,101 @@ class ciwfn_so(object):
             if niter >= start_diis:
                 C2 = diis.extrapolate(C2)
 
+        raise Exception("CID iterations failed to converge in %d cycles." % (maxiter))
 
-    def r_T2(self, o, v, E, F, ERI, C2):
-        r2 = ERI[v,v,o,o].swapaxes(0,2).swapaxes(1,3).copy()
-        r2 += contract('ijae,be->ijab', C2, F[v,v]) - contract('ijbe,ae->ijab', C2, F[v,v])
-        r2 -= contract('imab,mj->ijab', C2, F[o,o]) - contract('jmab,mi->ijab', C2, F[o,o])
-        r2 += 0.5 * contract('mnab,mnij->ijab', C2, ERI[o,o,o,o])
-        r2 += 0.5 * contract('ijef,abef->ijab', C2, ERI[v,v,v,v])
 
-        r2 += contract('mjeb,amie->ijab', C2, ERI[v,o,o,v])
-        r2 -= contract('mieb,amje->ijab', C2, ERI[v,o,o,v])
-        r2 -= contract('mjea,bmie->ijab', C2, ERI[v,o,o,v])
-        r2 += contract('miea,bmje->ijab', C2, ERI[v,o,o,v])
+    def guess_amplitudes(self, guess):
+        """
+        Initial doubles amplitudes from the converged solution of another wave function (e.g., at a
+        nearby geometry or field), transformed to the orbitals of this one
+
+        With S[p,q] = <p|q'> the overlap of the active orbitals of the guess (p) with those of this
+        wave function (q'), the amplitudes in intermediate normalization are
+
+            C2'[k,l,c,d] = sum_ijab C2[i,j,a,b] S[i,k] S[j,l] S*[a,c] S*[b,d],
+
+        which also makes their phases consistent with those of the current orbitals.
+
+        Parameters
+        ----------
+        guess: converged ciwfn_so object with the same numbers of active orbitals
+
+        Returns
+        -------
+        C2: initial-guess doubles amplitudes in intermediate normalization (NumPy array)
+        """
+        if (guess.no, guess.nv) != (self.no, self.nv):
+            raise Exception("Guess and current wave functions do not have the same numbers of active orbitals: (%d,%d) vs. (%d,%d)." %
+                    (guess.no, guess.nv, self.no, self.nv))
+
+        # Active-orbital overlaps across the (possibly different) basis sets
+        C_guess = guess.hfwfn.C[:,guess.nfzc//2:]
+        C = self.hfwfn.C[:,self.nfzc//2:]
+        S = C_guess.conj().T @ ao_overlap(guess.hfwfn.H.basisset, self.hfwfn.H.basisset) @ C
+
+        # Spin-orbital overlaps, in the ordering of the spin-orbital Hamiltonian
+        S = np.kron(S, np.eye(2))
+        Soo = S[self.o,self.o]
+        Svv = S[self.v,self.v].conj()
+
+        C2 = contract('ijab,ik,jl,ac,bd->klcd', guess.C2/guess.C0, Soo, Soo, Svv, Svv)
+        if not np.iscomplexobj(self.ERI['oovv']):
+            C2 = C2.real.copy()
+
+        return C2
+
+
+    def r_T2(self, o, v, E, F, ERI, C2):
+        r2 = ERI['oovv'].conj().copy()
+        X = self.contractions['Fvv'](C2, F[v,v])
+        r2 += X - X.swapaxes(2,3)
+        X = self.contractions['Foo'](C2, F[o,o])
+        r2 -= X - X.swapaxes(0,1)
+        r2 += 0.5 * self.contractions['oooo'](C2, ERI['oooo'])
+        if self.ladder == 'MO':
+            r2 += 0.5 * self.contractions['vvvv'](C2, ERI['vvvv'])
+        else:
+            r2 += self.ao_ladder(C2, ERI['AO'])
+
+        X = self.contractions['voov'](C2, ERI['voov'])
+        r2 += X - X.swapaxes(0,1) - X.swapaxes(2,3) + X.swapaxes(0,1).swapaxes(2,3)
 
         r2 -= E*C2
         return r2
 
 
+    def ao_ladder(self, C2, ERI_AO=None):
+        """
+        AO-direct particle-particle ladder term, 0.5 * sum_ef C2[i,j,e,f] <ab||ef>
+
+        Parameters
+        ----------
+        C2: spin-orbital doubles amplitudes (NumPy array)
+        ERI_AO: AO-basis two-electron integrals (NumPy array), by default those of the Hamiltonian
+
+        Returns
+        -------
+        r2: the ladder contribution to the doubles residual (NumPy array)
+        """
+        # Separate the spin of each virtual index, so that <ab|ef> = <a'b'|e'f'> delta(a,e) delta(b,f)
+        # reduces to a spatial-orbital ladder for each pair of spins
+        no = C2.shape[0]
+        nv = C2.shape[2]//2
+        C2 = C2.reshape(no, no, nv, 2, nv, 2).transpose(0,1,3,5,2,4)
+        if ERI_AO is None:
+            ERI_AO = self.hfwfn.H.ERI
+        X = ao_ladder(ERI_AO, C2, self.Cv)
+        X = X.transpose(0,1,4,2,5,3).reshape(no, no, 2*nv, 2*nv)
+
+        # <ab||ef> = <ab|ef> - <ba|ef>
+        return 0.5 * (X - X.swapaxes(2,3))
+
+
     def compute_cid_energy(self, o, v, ERI, C2):
-        eci = (1/4) * contract('ijab,ijab->', C2, ERI[o,o,v,v])
+        eci = (1/4) * self.contractions['dot'](C2, ERI['oovv'])
         return eci
 
     def normalize(self, o, v, C2):
-        N = 1.0/np.sqrt(1.0 + (1/4) * contract('ijab,ijab->', C2.conj(), C2))
+        N = 1.0/np.sqrt(1.0 + (1/4) * self.contractions['dot'](C2.conj(), C2))
         C0 = N; C2 = N * C2
         return C0, C2
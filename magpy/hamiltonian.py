@@ -4,6 +4,111 @@ if __name__ == "__main__":
 
 import psi4
 import numpy as np
+import threading
+from collections import OrderedDict
+
+
+## Basis sets, orthogonalizers, and density-fitting factors depend only on the geometry and the basis, not on any
+## applied field, so they are shared among all Hamiltonians built for the same geometry
+## (e.g., the field-displaced Hamiltonians of the AAT and APT drivers).  The cache is
+## bounded (least-recently-used entries are dropped) and locked, so that Hamiltonians may
+## be built from more than one thread.
+_geometry_cache = OrderedDict()
+_geometry_cache_size = 16
+_geometry_cache_lock = threading.Lock()
+
+
+def geometry_key(molecule):
+    """
+    Build the key identifying a molecular geometry and orbital basis in the geometry cache
+
+    Parameters
+    ----------
+    molecule: Psi4 Molecule object
+
+    Returns
+    -------
+    key: tuple of the basis name, atom labels and nuclear charges, and the Cartesian geometry (bohr)
+    """
+    # A molecule from psi4.geometry() has no atoms until its geometry is updated (which building
+    # its basis set would otherwise do)
+    molecule.update_geometry()
+    atoms = tuple((molecule.label(i), molecule.Z(i)) for i in range(molecule.natom()))
+    geom = np.asarray(molecule.geometry().np, dtype='float64')
+    return (psi4.core.get_global_option('BASIS'), psi4.core.get_global_option('PUREAM'), atoms, geom.tobytes())
+
+
+def clear_geometry_cache():
+    """
+    Remove all cached basis sets, orthogonalizers, and density-fitting factors
+    """
+    with _geometry_cache_lock:
+        _geometry_cache.clear()
+    with _overlap_cache_lock:
+        _overlap_cache.clear()
+
+
+def _geometry_entry(molecule):
+    """
+    Return the (possibly new) geometry-cache entry for the given molecule, building its basis set if necessary
+    """
+    key = geometry_key(molecule)
+    with _geometry_cache_lock:
+        if key in _geometry_cache:
+            _geometry_cache.move_to_end(key)
+            return _geometry_cache[key]
+
+    entry = {'basisset': psi4.core.BasisSet.build(molecule), 'X': {}, 'B': {}, 'L': {}}
+
+    with _geometry_cache_lock:
+        entry = _geometry_cache.setdefault(key, entry)
+        _geometry_cache.move_to_end(key)
+        while len(_geometry_cache) > _geometry_cache_size:
+            _geometry_cache.popitem(last=False)
+
+    return entry
+
+
+## AO overlaps between basis sets (e.g., at a displaced geometry and the reference geometry) are
+## reused by phase matching, guess projection, and the MO overlaps of the AAT driver, so they are
+## cached per pair of basis-set objects.  The cache holds references to the basis sets, so their
+## ids cannot be reused while an entry is alive.
+_overlap_cache = OrderedDict()
+_overlap_cache_size = 64
+_overlap_cache_lock = threading.Lock()
+
+
+def ao_overlap(bra_basis, ket_basis):
+    """
+    Compute (or retrieve from the overlap cache) the AO-basis overlap matrix between two basis sets
+
+    Parameters
+    ----------
+    bra_basis: Psi4 BasisSet object for the bra
+    ket_basis: Psi4 BasisSet object for the ket
+
+    Returns
+    -------
+    S: AO-basis overlap matrix (p|q) for p in bra_basis and q in ket_basis (NumPy array)
+    """
+    key = (id(bra_basis), id(ket_basis))
+    with _overlap_cache_lock:
+        if key in _overlap_cache:
+            _overlap_cache.move_to_end(key)
+            return _overlap_cache[key][2]
+
+    mints = psi4.core.MintsHelper(bra_basis)
+    if bra_basis == ket_basis:
+        S = mints.ao_overlap().np
+    else:
+        S = mints.ao_overlap(bra_basis, ket_basis).np
+
+    with _overlap_cache_lock:
+        _overlap_cache[key] = (bra_basis, ket_basis, S)
+        while len(_overlap_cache) > _overlap_cache_size:
+            _overlap_cache.popitem(last=False)
+
+    return S
 
 
 class Hamiltonian(object):
@@ -13,16 +118,24 @@ class Hamiltonian(object):
     Attributes
     ----------
     """
-    def __init__(self, molecule):
+    def __init__(self, molecule, ERI=None):
+        """
+        Parameters
+        ----------
+        molecule: Psi4 Molecule object
+        ERI: AO-basis two-electron integrals for this geometry computed elsewhere (e.g., by the
+            helper process of utils.Prefetcher), or None to compute them here
+        """
 
         self.molecule = molecule
-        self.basisset = psi4.core.BasisSet.build(molecule)
-        mints = psi4.core.MintsHelper(self.basisset)
+        self._geometry = _geometry_entry(molecule) # basis set and orthogonalizers shared for this geometry
+        self.basisset = self._geometry['basisset']
+        self.mints = mints = psi4.core.MintsHelper(self.basisset)
 
-        self.S = np.asarray(mints.ao_overlap()) # (p|q)
-        self.T = np.asarray(mints.ao_kinetic()) # (p|T|q)
-        self.V = np.asarray(mints.ao_potential()) # (p|v|q)
-        self.ERI = np.asarray(mints.ao_eri()) # (pr|qs)
+        self.S = mints.ao_overlap().np # (p|q)
+        self.T = mints.ao_kinetic().np # (p|T|q)
+        self.V = mints.ao_potential().np # (p|v|q)
+        self.ERI = mints.ao_eri().np if ERI is None else ERI # (pr|qs)
 
         # Save the true nuclear-electron attraction potential in case the
         # user adds external fields later
@@ -31,28 +144,158 @@ class Hamiltonian(object):
 		# Nuclear repulsion energy (zero field)
         self.enuc = self.molecule.nuclear_repulsion_energy()
 
-        ## One-electron property integrals for adding multipole fields
+        ## One-electron property integrals for adding multipole fields are
+        ## computed on first use (see the mu, m, p, and Q properties below)
+        self._mu = None
+        self._m = None
+        self._p = None
+        self._Q = None
 
-        # Electric dipole integrals (length): -e r
-        self.mu = mints.so_dipole()
-        for i in range(3):
-            self.mu[i] = np.asarray(self.mu[i])
+    @property
+    def mu(self):
+        """
+        Electric dipole integrals (length): -e r
+        """
+        if self._mu is None:
+            self._mu = [mu.np for mu in self.mints.so_dipole()]
+        return self._mu
 
-        # Magnetic dipole integrals: -(e/2 m_e) L
-        self.m = mints.ao_angular_momentum()
-        for i in range(3):
-            self.m[i] = -0.5j * np.asarray(self.m[i])
+    @property
+    def m(self):
+        """
+        Magnetic dipole integrals: -(e/2 m_e) L
+        """
+        if self._m is None:
+            self._m = [-0.5j * m.np for m in self.mints.ao_angular_momentum()]
+        return self._m
 
-        # Linear momentum integrals: (-e) (-i hbar) Del
-        self.p = mints.ao_nabla()
-        for i in range(3):
-            self.p[i] = 1.0j * np.asarray(self.p[i])
+    @property
+    def p(self):
+        """
+        Linear momentum integrals: (-e) (-i hbar) Del
+        """
+        if self._p is None:
+            self._p = [1.0j * p.np for p in self.mints.ao_nabla()]
+        return self._p
+
+    @property
+    def Q(self):
+        """
+        Traceless quadrupole: -e Q
+        """
+        if self._Q is None:
+            self._Q = [Q.np for Q in self.mints.ao_traceless_quadrupole()]
+        return self._Q
+
+
+    def orthogonalizer(self, kind='SYMMETRIC', s_tol=1e-7):
+        """
+        Compute (or retrieve from the geometry cache) the AO-basis orthogonalizer X, with X^T S X = 1
+
+        Parameters
+        ----------
+        kind: 'SYMMETRIC' (S^-1/2) or 'CANONICAL' (U s^-1/2) orthogonalization
+        s_tol: eigenvalues of S below this threshold are treated as linear dependencies and their
+        eigenvectors removed.  Symmetric orthogonalization falls back to canonical if any are found.
+
+        Returns
+        -------
+        X: orthogonalizer (NumPy array) of dimension nbf x nmo, where nmo <= nbf
+        """
+        valid_kinds = ['SYMMETRIC', 'CANONICAL']
+        kind = kind.upper()
+        if kind not in valid_kinds:
+            raise Exception(f"{kind:s} is not an allowed choice of orthogonalizer.")
+
+        key = (kind, s_tol)
+        X = self._geometry['X'].get(key)
+        if X is None:
+            s, U = np.linalg.eigh(self.S)
+            keep = s > s_tol
+            if kind == 'SYMMETRIC' and keep.all():
+                X = (U * s**(-0.5)) @ U.T
+            else:
+                X = U[:,keep] * s[keep]**(-0.5)
+            self._geometry['X'][key] = X
+
+        return X
+
+    def df_factors(self, aux_name=None, j_tol=1e-10):
+        """
+        Compute (or retrieve from the geometry cache) the density-fitting factors of the two-electron integrals,
+
+            B[Q,p,q] = sum_P (Q|P)^-1/2 (P|pq),   so that   (pq|rs) ~= sum_Q B[Q,p,q] B[Q,r,s]
+
+        Parameters
+        ----------
+        aux_name: name of the auxiliary (RI) basis set, or None for the DF_BASIS_MP2 option (by default, the
+        RIFIT basis matching BASIS)
+        j_tol: eigenvalues of the Coulomb metric (Q|P) below this threshold are treated as linear dependencies
+
+        Returns
+        -------
+        B: density-fitting factors (NumPy array) of dimension naux x nbf x nbf
+        """
+        if aux_name is None:
+            aux_name = psi4.core.get_global_option('DF_BASIS_MP2')
+
+        key = (aux_name, j_tol)
+        B = self._geometry['B'].get(key)
+        if B is None:
+            aux = psi4.core.BasisSet.build(self.molecule, 'DF_BASIS_MP2', aux_name, 'RIFIT', psi4.core.get_global_option('BASIS'))
+            zero = psi4.core.BasisSet.zero_ao_basis_set()
+            naux = aux.nbf()
+            nbf = self.basisset.nbf()
+
+            # Three-center integrals (P|pq) and the inverse square root of the metric (Q|P)
+            Ppq = self.mints.ao_eri(zero, aux, self.basisset, self.basisset).np.reshape(naux, nbf, nbf)
+            s, U = np.linalg.eigh(self.mints.ao_eri(zero, aux, zero, aux).np.reshape(naux, naux))
+            keep = s > j_tol
+            J = (U[:,keep] * s[keep]**(-0.5)) @ U[:,keep].T
+
+            B = np.tensordot(J, Ppq, axes=1)
+            self._geometry['B'][key] = B
+
+        return B
+
+    def cholesky_factors(self, tol=1e-8):
+        """
+        Compute (or retrieve from the geometry cache) the pivoted Cholesky factors of the two-electron integrals,
+
+            (pq|rs) ~= sum_P L[P,p,q] L[P,r,s]
+
+        A vector is added for the largest remaining diagonal element, (pq|pq), until all are below tol,
+        which bounds the error of every integral [Beebe and Linderberg, Int. J. Quantum Chem. 12, 683 (1977)].
+
+        Parameters
+        ----------
+        tol: threshold on the remaining diagonal elements
+
+        Returns
+        -------
+        L: Cholesky factors (NumPy array) of dimension nvec x nbf x nbf
+        """
+        L = self._geometry['L'].get(tol)
+        if L is None:
+            nbf = self.basisset.nbf()
+            ERI = self.ERI.reshape(nbf*nbf, nbf*nbf)
+            d = np.diag(ERI).copy()
+            L = np.zeros((0, nbf*nbf))
+            nvec = 0
+            while nvec < nbf*nbf:
+                pq = np.argmax(d)
+                if d[pq] < tol:
+                    break
+                if nvec == L.shape[0]:
+                    L = np.vstack((L, np.zeros((max(nbf, nvec), nbf*nbf))))
+                L[nvec] = (ERI[pq] - L[:nvec,pq] @ L[:nvec]) / np.sqrt(d[pq])
+                d -= L[nvec]**2
+                nvec += 1
 
-        # Traceless quadrupole: -e Q
-        self.Q = mints.ao_traceless_quadrupole()
-        for i in range(len(self.Q)):
-            self.Q[i] = np.asarray(self.Q[i])
+            L = L[:nvec].reshape(nvec, nbf, nbf)
+            self._geometry['L'][tol] = L
 
+        return L
 
     def add_field(self, **kwargs):
 
@@ -4,7 +4,7 @@ if __name__ == "__main__":
 import psi4
 import magpy
 import numpy as np
-from .utils import shift_geom
+from .utils import displaced_hamiltonian, Prefetcher, auto_convergence
 
 class Hessian(object):
 
@@ -38,35 +38,80 @@ class Hessian(object):
         max_diis = kwargs.pop('max_diis', 8)
         start_diis = kwargs.pop('start_diis', 1)
         print_level = kwargs.pop('print_level', 0)
-
+        prefetch = kwargs.pop('prefetch', 0) # number of displaced geometries whose ERIs are computed ahead in a helper process
+        # (the helper is spawned and imports the main module again: guard a calling script with if __name__ == "__main__":)
+
+        # Conventional or density-fitted MP2
+        valid_mp2_types = ['CONV', 'DF']
+        mp2_type = kwargs.pop('mp2_type', 'CONV').upper()
+        if mp2_type not in valid_mp2_types:
+            raise Exception(f"{mp2_type:s} is not an allowed choice of mp2_type.")
+        self.mp2_type = mp2_type
+
+        # Convergence thresholds: fixed (e_conv, r_conv), or derived from the step sizes and the target precision of each tensor element
+        valid_convergences = ['FIXED', 'AUTO']
+        convergence = kwargs.pop('convergence', 'FIXED').upper()
+        if convergence not in valid_convergences:
+            raise Exception(f"{convergence:s} is not an allowed choice of convergence.")
+        precision = kwargs.pop('precision', 1e-5) # target precision of each tensor element for convergence='AUTO'
+
+        # Initial guess for the displaced SCF (and CID) wave functions
+        valid_guesses = ['REFERENCE', 'CORE']
+        guess = kwargs.pop('guess', 'REFERENCE').upper()
+        if guess not in valid_guesses:
+            raise Exception(f"{guess:s} is not an allowed choice of SCF guess.")
+
+        # Off-diagonal elements use a four-point formula in two displacements (weight 1/disp^2) and
+        # diagonal elements a five-point formula in one displacement (weight 16/(3 disp^2))
         params = [e_conv, r_conv, maxiter, max_diis, start_diis, print_level]
+        params_diag = params
+        if convergence == 'AUTO':
+            e_conv, r_conv = auto_convergence(precision, 1/(disp*disp), variational=(method == 'HF'))
+            params = [e_conv, r_conv, maxiter, max_diis, start_diis, print_level]
+            e_conv, r_conv = auto_convergence(precision, 16/(3*disp*disp), variational=(method == 'HF'))
+            params_diag = [e_conv, r_conv, maxiter, max_diis, start_diis, print_level]
 
         if print_level > 1:
             print("Initial geometry:")
             print(self.molecule.geometry().np)
 
-        E0 = self.energy(0, 0, 0, 0, 0, 0, params)
-
-        hess = np.zeros((self.natom*3, self.natom*3))
+        # Displaced geometries in the order their energies are needed below
+        tasks = [self.task(0, 0, 0, 0, 0, 0)]
         for R in range(self.natom*3):
             for S in range(R+1):
-                M1 = R//3; alpha1 = R%3 # left-hand atom and coordinate
-                M2 = S//3; alpha2 = S%3 # right-hand atom and coordinate
-
+                M1 = R//3; alpha1 = R%3
+                M2 = S//3; alpha2 = S%3
                 if R != S:
-                    Epp = self.energy(M1, alpha1, disp, M2, alpha2, disp, params)
-                    Epm = self.energy(M1, alpha1, disp, M2, alpha2, -disp, params)
-                    Emp = self.energy(M1, alpha1, -disp, M2, alpha2, disp, params)
-                    Emm = self.energy(M1, alpha1, -disp, M2, alpha2, -disp, params)
-
-                    hess[R,S] = hess[S,R] = (Epp - Epm - Emp + Emm)/(4*disp*disp)
+                    for disp1, disp2 in [(disp, disp), (disp, -disp), (-disp, disp), (-disp, -disp)]:
+                        tasks.append(self.task(M1, alpha1, disp1, M2, alpha2, disp2))
                 else:
-                    E2p = self.energy(M1, alpha1, 2*disp, M2, alpha2, 0, params)
-                    Ep = self.energy(M1, alpha1, disp, M2, alpha2, 0, params)
-                    Em = self.energy(M1, alpha1, -disp, M2, alpha2, 0, params)
-                    E2m = self.energy(M1, alpha1, -2*disp, M2, alpha2, 0, params)
-
-                    hess[R,R] = -(E2p - 16*Ep + 30*E0 - 16*Em + E2m)/(12*disp*disp)
+                    for disp1 in [2*disp, disp, -disp, -2*disp]:
+                        tasks.append(self.task(M1, alpha1, disp1, M2, alpha2, 0))
+        with Prefetcher(self.molecule, tasks, prefetch) as hamiltonians:
+            E0, scf0, ci0 = self.energy(0, 0, 0, 0, 0, 0, params_diag, hamiltonians, return_wfn=True)
+            scf_guess = scf0 if guess == 'REFERENCE' else None # guess for all displaced SCF wave functions
+            ci_guess = ci0 if guess == 'REFERENCE' else None # guess for all displaced CID wave functions
+
+            hess = np.zeros((self.natom*3, self.natom*3))
+            for R in range(self.natom*3):
+                for S in range(R+1):
+                    M1 = R//3; alpha1 = R%3 # left-hand atom and coordinate
+                    M2 = S//3; alpha2 = S%3 # right-hand atom and coordinate
+
+                    if R != S:
+                        Epp = self.energy(M1, alpha1, disp, M2, alpha2, disp, params, hamiltonians, scf_guess, ci_guess)
+                        Epm = self.energy(M1, alpha1, disp, M2, alpha2, -disp, params, hamiltonians, scf_guess, ci_guess)
+                        Emp = self.energy(M1, alpha1, -disp, M2, alpha2, disp, params, hamiltonians, scf_guess, ci_guess)
+                        Emm = self.energy(M1, alpha1, -disp, M2, alpha2, -disp, params, hamiltonians, scf_guess, ci_guess)
+
+                        hess[R,S] = hess[S,R] = (Epp - Epm - Emp + Emm)/(4*disp*disp)
+                    else:
+                        E2p = self.energy(M1, alpha1, 2*disp, M2, alpha2, 0, params_diag, hamiltonians, scf_guess, ci_guess)
+                        Ep = self.energy(M1, alpha1, disp, M2, alpha2, 0, params_diag, hamiltonians, scf_guess, ci_guess)
+                        Em = self.energy(M1, alpha1, -disp, M2, alpha2, 0, params_diag, hamiltonians, scf_guess, ci_guess)
+                        E2m = self.energy(M1, alpha1, -2*disp, M2, alpha2, 0, params_diag, hamiltonians, scf_guess, ci_guess)
+
+                        hess[R,R] = -(E2p - 16*Ep + 30*E0 - 16*Em + E2m)/(12*disp*disp)
 
         if print_level > 1:
             print("Hessian (Eh/a0^2)")
@@ -75,9 +120,20 @@ class Hessian(object):
         return hess
 
 
-    def energy(self, M1, alpha1, disp1, M2, alpha2, disp2, params):
+    def task(self, M1, alpha1, disp1, M2, alpha2, disp2):
+        """
+        Displaced-Hamiltonian task (arguments of utils.displaced_hamiltonian) for a pair of Cartesian displacements
+        """
+        return (((M1*3+alpha1, disp1), (M2*3+alpha2, disp2)), None, None)
+
+
+    def energy(self, M1, alpha1, disp1, M2, alpha2, disp2, params, hamiltonians=None, guess=None, ci_guess=None, return_wfn=False):
         """
         Energy wrappter function
+
+        guess: hfwfn object (e.g., at the reference geometry) used as the initial guess for the SCF
+        ci_guess: converged ciwfn object (e.g., at the reference geometry) used as the initial guess for the CID
+        return_wfn: if True, return the SCF and CID (None for other methods) wave functions along with the energy
         """
         e_conv = params[0]
         r_conv = params[1]
@@ -86,21 +142,29 @@ class Hessian(object):
         start_diis = params[4]
         print_level = params[5]
 
-        H = magpy.Hamiltonian(shift_geom(shift_geom(self.molecule, M1*3+alpha1, disp1), M2*3+alpha2, disp2))
+        task = self.task(M1, alpha1, disp1, M2, alpha2, disp2)
+        if hamiltonians is None:
+            H = displaced_hamiltonian(self.molecule, *task)
+        else:
+            H = hamiltonians.get(task)
         scf = magpy.hfwfn(H, self.charge, self.spin)
-        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=guess)
         if print_level > 2:
             print(f"{M1:d}, {alpha1:d}; {M2:d}, {alpha2:d} ::: {disp1:0.5f}; {disp2:0.5f}")
             print(H.molecule.geometry().np)
             print(f"ESCF = {escf:18.15f}")
 
         if self.method == 'HF':
-            return escf
+            E = escf
         elif self.method == 'CID':
             ci = magpy.ciwfn(scf)
-            eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
-            return eci + escf
+            eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, guess=ci_guess)
+            E = eci + escf
         elif self.method == 'MP2':
-            ci = magpy.mpwfn(scf)
-            eci, C0, C2 = ci.solve(print_level=print_level)
-            return eci + escf
+            ci = magpy.mpwfn(scf, mp2_type=self.mp2_type)
+            eci, C0, C2 = ci.solve(print_level=print_level, amplitudes=False)
+            E = eci + escf
+
+        if return_wfn is True:
+            return E, scf, (ci if self.method == 'CID' else None)
+        return E
@@ -6,6 +6,7 @@ from opt_einsum import contract
 import math
 import scipy.linalg
 from .utils import *
+from .hamiltonian import geometry_key
 
 class hfwfn(object):
 
@@ -20,8 +21,9 @@ class hfwfn(object):
             raise Exception("MagPy is for closed-shell systems only at present.")
         self.ndocc = nelec//2;
 
-        # Determine number of orbitals
+        # Determine number of orbitals (nmo may be reduced by linear dependencies in solve())
         self.nbf = H.basisset.nbf()
+        self.nmo = self.nbf
 
 
     def nelectron(self, charge):
@@ -40,7 +42,25 @@ class hfwfn(object):
         maxiter = kwargs.pop('maxiter', 100)
         max_diis = kwargs.pop('max_diis', 8)
         start_diis = kwargs.pop('start_diis', 1)
+        diis_storage = kwargs.pop('diis_storage', 'MEMORY') # 'MEMORY' or 'DISK' storage of the DIIS subspace
+        diis_precision = kwargs.pop('diis_precision', 'DOUBLE') # 'DOUBLE' or 'SINGLE' precision of the DIIS subspace
         print_level = kwargs.pop('print_level', 0)
+        orthogonalizer = kwargs.pop('orthogonalizer', 'SYMMETRIC')
+        s_tol = kwargs.pop('s_tol', 1e-7)
+        guess = kwargs.pop('guess', None) # hfwfn object or occupied MO coefficients
+        guess_D = kwargs.pop('guess_D', None) # density matrix
+        guess_basis = kwargs.pop('guess_basis', None) # basis set of guess/guess_D if not that of self.H
+        incfock = kwargs.pop('incfock', False) # build J and K from the change in the density
+        incfock_rebuild = kwargs.pop('incfock_rebuild', 8) # iterations between full J and K builds
+        ediis = kwargs.pop('ediis', False) # EDIIS far from convergence, blended into DIIS
+        ediis_start = kwargs.pop('ediis_start', 1e-1) # DIIS error above which EDIIS alone is used
+        ediis_stop = kwargs.pop('ediis_stop', 1e-4) # DIIS error below which DIIS alone is used
+        soscf = kwargs.pop('soscf', False) # second-order (Newton) iterations near convergence
+        soscf_start = kwargs.pop('soscf_start', 1e-4) # RMS(D) below which second-order iterations begin
+        soscf_conv = kwargs.pop('soscf_conv', 1e-3) # relative convergence of the Newton equations
+        soscf_max_micro = kwargs.pop('soscf_max_micro', 20) # maximum number of microiterations per Newton step
+        mixed_precision = kwargs.pop('mixed_precision', False) # early iterations with single-precision J and K
+        precision_switch = kwargs.pop('precision_switch', 1e-5) # RMS(D) below which double precision is used (also once it stops improving)
 
         # Electronic Hamiltonian, including fields
         H = self.H
@@ -51,22 +71,42 @@ class hfwfn(object):
         # Core Hamiltonian
         h = H.T + H.V
 
-        # Symmetric orthogonalizer
-        X = scipy.linalg.fractional_matrix_power(H.S, -0.5)
+        # Orthogonalizer (shared by all Hamiltonians at this geometry)
+        X = H.orthogonalizer(orthogonalizer, s_tol)
+        self.nmo = X.shape[1]
 
-        # Form the initial guess for density
+        # Form the initial guess for density: from the core Hamiltonian or
+        # (projected from) the given orbitals or density
         F = h.copy()
-        Fp = X @ F @ X
-        eps, Cp = np.linalg.eigh(Fp)
-        C = X @ Cp
-        C_occ = C[:,:self.ndocc]
-        D = C_occ @ C_occ.T.conj()
+        if isinstance(guess, hfwfn):
+            guess_basis = guess.H.basisset
+            guess = guess.C
+        if guess is not None:
+            D = self.guess_density(C_occ=guess[:,:self.ndocc], basis=guess_basis)
+        elif guess_D is not None:
+            D = self.guess_density(D=guess_D, basis=guess_basis)
+        else:
+            Fp = X.T @ F @ X
+            eps, Cp = np.linalg.eigh(Fp)
+            C = X @ Cp
+            C_occ = C[:,:self.ndocc]
+            D = C_occ @ C_occ.T.conj()
 
         # Compute the initial-guess energy
         escf = contract('ij,ji->', D, (h+F))
 
         # Setup DIIS object
-        diis = DIIS(F, max_diis)
+        single = mixed_precision
+        switch = PrecisionSwitch(precision_switch)
+        diis = DIIS(F, max_diis, storage=diis_storage, precision='SINGLE' if single else diis_precision)
+        if ediis:
+            edi = EDIIS(max_diis)
+
+        # Setup J and K builder, with single-precision integrals for the early iterations if requested
+        if single:
+            jk = JK(single_precision(H.ERI), incremental=incfock, rebuild=incfock_rebuild)
+        else:
+            jk = JK(H.ERI, incremental=incfock, rebuild=incfock_rebuild)
 
         if print_level > 2:
             print("\n  Nuclear repulsion energy = %20.12f" % self.enuc)
@@ -74,23 +114,45 @@ class hfwfn(object):
             print(" %02d %20.13f %20.13f %20.13f" % (0, escf.real, escf.imag, escf.real + self.enuc))
 
         # SCF iteration
+        second_order = False
         for niter in range(1, maxiter+1):
 
             escf_last = escf
             D_last = D
 
             # Build the new Fock matrix
-            F = h + contract('kl,ijkl->ij', D, (2*H.ERI-H.ERI.swapaxes(1,2)))
-
-            # DIIS extrapolation
-            e = (X @ (F @ D @ H.S - (F @ D @ H.S).conj().T) @ X)
-            diis.add_error_vector(F, e)
-            if niter >= start_diis:
-                F = diis.extrapolate(F)
-
-            Fp = X @ F @ X
-            eps, Cp = np.linalg.eigh(Fp)
-            C = X @ Cp
+            if single:
+                J, K = jk.update(single_precision(D))
+            else:
+                J, K = jk.update(D)
+            F = h + 2.0 * J - K
+
+            if second_order:
+                # Newton step for the orbitals that produced D
+                C = self.soscf_step(C, F, jk, soscf_conv, soscf_max_micro)
+            else:
+                # DIIS extrapolation
+                e = (X.T @ (F @ D @ H.S - (F @ D @ H.S).conj().T) @ X)
+                diis.add_error_vector(F, e)
+                if ediis:
+                    edi.add(D, F, contract('ij,ji->', D, (h+F)).real)
+                if niter >= start_diis:
+                    if ediis:
+                        # EDIIS far from convergence, DIIS close to it, and a linear blend in between
+                        err = np.max(np.abs(e))
+                        F_ediis = edi.extrapolate()
+                        F = diis.extrapolate(F)
+                        if err > ediis_start:
+                            F = F_ediis
+                        elif err > ediis_stop:
+                            w = err/ediis_start
+                            F = w * F_ediis + (1.0 - w) * F
+                    else:
+                        F = diis.extrapolate(F)
+
+                Fp = X.T @ F @ X
+                eps, Cp = np.linalg.eigh(Fp)
+                C = X @ Cp
             C_occ = C[:,:self.ndocc]
             D = C_occ @ C_occ.T.conj()
 
@@ -100,13 +162,35 @@ class hfwfn(object):
             rms = np.linalg.norm(D-D_last).real
 
             if print_level > 2:
-                print(" %02d %20.13f %20.13f %20.13f %20.13f %20.13f" % (niter, escf.real, escf.imag, escf.real + self.enuc, ediff, rms))
+                print(" %02d %20.13f %20.13f %20.13f %20.13f %20.13f" % (niter, escf.real, escf.imag, escf.real + self.enuc, ediff, rms) + ("  SO" if second_order else ""))
+
+            if single:
+                # Finish in double precision, with new J/K builder and DIIS subspace
+                if switch(rms):
+                    single = False
+                    jk = JK(H.ERI, incremental=incfock, rebuild=incfock_rebuild)
+                    diis = DIIS(F, max_diis, storage=diis_storage, precision=diis_precision)
+                    if ediis:
+                        edi = EDIIS(max_diis)
+                continue
+
+            if soscf and rms < soscf_start:
+                second_order = True
 
             # Check for convergence
             if ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
+                if second_order:
+                    # Canonicalize the final orbitals
+                    J, K = jk.jk(D)
+                    F = h + 2.0 * J - K
+                    Fp = X.T @ F @ X
+                    eps, Cp = np.linalg.eigh(Fp)
+                    C = X @ Cp
+                    escf = contract('ij,ji->', D, (h+F))
                 self.escf = escf
                 self.C = C
                 self.eps = eps
+                self.niter = niter
                 if print_level > 2:
                     print("E(SCF) =  %20.15f" % (escf + self.enuc))
                 return (escf+self.enuc), C
@@ -115,23 +199,314 @@ class hfwfn(object):
         raise Exception("SCF iterations failed to converge in %d cycles." % (maxiter))
 
 
-    def match_phase(self, ref):
+    @staticmethod
+    def solve_batch(wfns, **kwargs):
+        """
+        Solve the SCF equations together for a batch of wave functions whose Hamiltonians differ
+        only in the one-electron potential (e.g., different external fields at one geometry)
+
+        The Fock matrices of all members are built with one contraction of the (shared) AO-basis
+        ERIs against the stack of densities and diagonalized with one batched eigh.  Each member
+        has its own DIIS space and drops out of the batch when it converges.
+
+        Parameters
+        ----------
+        wfns: list of hfwfn objects, all at the same geometry and with the same number of electrons
+        e_conv, r_conv, maxiter, max_diis, start_diis, print_level, orthogonalizer, s_tol: as for solve()
+        guess: hfwfn object used as the initial guess for all members, or None for the core Hamiltonian
+
+        Returns
+        -------
+        list of (escf, C) for each member, as returned by solve()
+        """
+        e_conv = kwargs.pop('e_conv', 1e-7)
+        r_conv = kwargs.pop('r_conv', 1e-7)
+        maxiter = kwargs.pop('maxiter', 100)
+        max_diis = kwargs.pop('max_diis', 8)
+        start_diis = kwargs.pop('start_diis', 1)
+        print_level = kwargs.pop('print_level', 0)
+        orthogonalizer = kwargs.pop('orthogonalizer', 'SYMMETRIC')
+        s_tol = kwargs.pop('s_tol', 1e-7)
+        guess = kwargs.pop('guess', None)
+
+        # The members must share the geometry and basis set (and thus S, T, and the ERIs)
+        H0 = wfns[0].H
+        for wfn in wfns:
+            if geometry_key(wfn.H.molecule) != geometry_key(H0.molecule) or wfn.ndocc != wfns[0].ndocc:
+                raise Exception("Batched SCF requires Hamiltonians at the same geometry with the same number of electrons.")
+        ndocc = wfns[0].ndocc
+
+        X = H0.orthogonalizer(orthogonalizer, s_tol)
+        for wfn in wfns:
+            wfn.enuc = wfn.H.enuc
+            wfn.nmo = X.shape[1]
+
+        # Stack of core Hamiltonians
+        h = np.array([wfn.H.T + wfn.H.V for wfn in wfns])
+        F = h.copy()
+
+        # Initial densities
+        if guess is not None:
+            D = np.array([wfn.guess_density(C_occ=guess.C[:,:ndocc], basis=guess.H.basisset) for wfn in wfns], dtype=h.dtype)
+        else:
+            eps, Cp = np.linalg.eigh(X.T @ F @ X)
+            C = X @ Cp
+            D = C[:,:,:ndocc] @ C[:,:,:ndocc].conj().swapaxes(1,2)
+        escf = contract('bij,bji->b', D, (h+F))
+
+        diis = [DIIS(F[b], max_diis) for b in range(len(wfns))]
+        jk = JK(H0.ERI)
+
+        results = [None] * len(wfns)
+        active = np.arange(len(wfns)) # Members not yet converged
+        for niter in range(1, maxiter+1):
+
+            escf_last = escf
+            D_last = D
+
+            # Stacked Fock build for the active members
+            J, K = jk.jk(D)
+            F = h[active] + 2.0 * J - K
+
+            # DIIS extrapolation for each member
+            for b in range(len(active)):
+                FDS = F[b] @ D[b] @ H0.S
+                e = X.T @ (FDS - FDS.conj().T) @ X
+                diis[active[b]].add_error_vector(F[b], e)
+                if niter >= start_diis:
+                    F[b] = diis[active[b]].extrapolate(F[b])
+
+            eps, Cp = np.linalg.eigh(X.T @ F @ X)
+            C = X @ Cp
+            D = C[:,:,:ndocc] @ C[:,:,:ndocc].conj().swapaxes(1,2)
+
+            escf = contract('bij,bji->b', D, (h[active]+F))
+
+            ediff = (escf - escf_last).real
+            rms = np.linalg.norm(D-D_last, axis=(1,2))
+
+            if print_level > 2:
+                print(" %02d  active = %d  max Delta(E) = %20.13f  max RMS(D) = %20.13f" % (niter, len(active), np.max(np.abs(ediff)), np.max(rms)))
+
+            # Store converged members and remove them from the batch
+            converged = (np.abs(ediff) < e_conv) & (rms < r_conv)
+            for b in np.flatnonzero(converged):
+                wfn = wfns[active[b]]
+                wfn.escf = escf[b]
+                wfn.C = C[b]
+                wfn.eps = eps[b]
+                wfn.niter = niter
+                results[active[b]] = ((escf[b]+wfn.enuc), C[b])
+
+            if converged.all():
+                return results
+
+            keep = ~converged
+            active = active[keep]
+            escf = escf[keep]
+            D = D[keep]
+
+        # Convergence failure
+        raise Exception("Batched SCF iterations failed to converge in %d cycles." % (maxiter))
+
+
+    def soscf_step(self, C, F, jk, conv=1e-3, max_micro=20):
+        """
+        Take a second-order (Newton) step in the occupied-virtual orbital rotations
+
+        The Newton equations, F_vv x - x F_oo + [G(D1(x))]_vo = -F_vo, where D1(x) is the
+        first-order change of the density under the rotation x and G(D) = 2J(D) - K(D), are
+        solved by preconditioned conjugate gradients in the real and imaginary parts of x, so
+        that complex rotations (e.g., in a magnetic field) are treated exactly.
+
+        Parameters
+        ----------
+        C: current MO coefficients (NumPy array)
+        F: AO-basis Fock matrix of the current density (NumPy array)
+        jk: JK object for the Hamiltonian
+        conv: convergence of the residual of the Newton equations relative to the orbital gradient
+        max_micro: maximum number of conjugate-gradient iterations
+
+        Returns
+        -------
+        C: rotated MO coefficients (NumPy array)
+        """
+        C_o = C[:,:self.ndocc]
+        C_v = C[:,self.ndocc:]
+
+        F_oo = C_o.T.conj() @ F @ C_o
+        F_vv = C_v.T.conj() @ F @ C_v
+        g = C_v.T.conj() @ F @ C_o
+
+        def hessian(x):
+            D1 = C_v @ x @ C_o.T.conj()
+            D1 = D1 + D1.T.conj()
+            J, K = jk.jk(D1)
+            return F_vv @ x - x @ F_oo + C_v.T.conj() @ (2.0 * J - K) @ C_o
+
+        def dot(x, y):
+            return np.vdot(x, y).real
+
+        # Diagonal preconditioner, e(a) - e(i)
+        precon = np.diag(F_vv).real.reshape(-1,1) - np.diag(F_oo).real
+
+        x = -g/precon
+        r = -g - hessian(x)
+        z = r/precon
+        p = z.copy()
+        rz = dot(r, z)
+        gnorm = np.linalg.norm(g)
+        for micro in range(max_micro):
+            if np.linalg.norm(r) < conv * gnorm:
+                break
+            Hp = hessian(p)
+            alpha = rz/dot(p, Hp)
+            x = x + alpha * p
+            r = r - alpha * Hp
+            z = r/precon
+            rz_new = dot(r, z)
+            p = z + (rz_new/rz) * p
+            rz = rz_new
+
+        # Rotate the orbitals by U = exp(kappa), with kappa_vo = x and kappa_ov = -x^dagger
+        nocc = self.ndocc
+        kappa = np.zeros((C.shape[1], C.shape[1]), dtype=x.dtype)
+        kappa[nocc:,:nocc] = x
+        kappa[:nocc,nocc:] = -x.T.conj()
+
+        return C @ scipy.linalg.expm(kappa)
+
+
+    def guess_density(self, C_occ=None, D=None, basis=None):
+        """
+        Build an initial-guess density from occupied orbitals or a density, projecting
+        it from another basis (e.g., at a displaced geometry) if necessary
+
+        Parameters
+        ----------
+        C_occ: occupied MO coefficients of the guess (NumPy array)
+        D: density matrix of the guess (NumPy array), used if C_occ is not given
+        basis: Psi4 BasisSet object of the guess, or None for the basis of self.H
+
+        Returns
+        -------
+        D: initial-guess density matrix in the basis of self.H (NumPy array)
+        """
+        S = self.H.S
+
+        # Projector onto the current basis, S^-1 S(new,old)
+        if basis is None or basis is self.H.basisset:
+            P = None
+        else:
+            S_mixed = ao_overlap(self.H.basisset, basis)
+            P = np.linalg.solve(S, S_mixed)
+
+        if C_occ is not None:
+            if P is not None:
+                C_occ = P @ C_occ
+            # Re-orthonormalize the (projected) occupied orbitals
+            s, U = np.linalg.eigh(C_occ.T.conj() @ S @ C_occ)
+            C_occ = C_occ @ (U * s**(-0.5)) @ U.T.conj()
+            return C_occ @ C_occ.T.conj()
+
+        if P is not None:
+            D = P @ D @ P.T
+        return D.copy()
+
+
+    def match_phase(self, ref, **kwargs):
         """
         Compute the phases of the MOs in a ket state and match them to those
-        of a given bra state
+        of a given bra state, optionally first aligning near-degenerate orbitals
+        of the ket with those of the bra by a unitary (Procrustes) rotation
 
         Parameters
         ----------
         ref: MagPy hfwfn object containing the reference orbitals and basisset
+        degeneracy_tol: orbital-energy gap below which orbitals are treated as
+        degenerate and rotated into alignment with the reference (default None, no rotation)
 
         Returns
         -------
         None, but modifies self.C in place with new phases
         """
+        degeneracy_tol = kwargs.pop('degeneracy_tol', None)
+
         S = mo_overlap(ref.C, ref.H.basisset, self.C, self.H.basisset)
 
+        # Within each block of (near-)degenerate occupied or virtual orbitals, the rotation U
+        # maximizing Re Tr[S_block U] is V W^+ from the SVD S_block = W s V^+, after which the
+        # block overlap W s W^+ is Hermitian and positive-definite
+        if degeneracy_tol is not None:
+            for block in self.degenerate_blocks(degeneracy_tol):
+                if len(block) > 1:
+                    W, s, Vh = np.linalg.svd(S[np.ix_(block, block)])
+                    U = Vh.T.conj() @ W.T.conj()
+                    self.C[:, block] = self.C[:, block] @ U
+                    S[:, block] = S[:, block] @ U
+
         # Compute normalization constant and phase, and correct phase of ket
-        for p in range(self.C.shape[1]):
-            N = np.sqrt(S[p][p] * np.conj(S[p][p]))
-            phase = S[p][p]/N
-            self.C[:, p] *= phase**(-1)
+        d = np.diag(S)
+        self.C /= d/np.abs(d)
+
+    def truncate_virtuals(self, C_no, basis=None):
+        """
+        Replace the virtual orbitals by a truncated set spanned by given orbitals (e.g., frozen
+        natural orbitals at the reference geometry), projected onto the virtual space of this
+        wave function, orthonormalized, and semicanonicalized
+
+        Projecting the same reference orbitals at every displaced geometry or field gives truncated
+        virtual spaces that vary smoothly with the perturbation, so they may be used in finite differences.
+
+        Parameters
+        ----------
+        C_no: AO-basis coefficients of the orbitals spanning the truncated virtual space (NumPy array)
+        basis: Psi4 BasisSet object of C_no, or None for the basis of self.H
+
+        Returns
+        -------
+        None, but modifies self.C, self.eps, and self.nmo in place
+        """
+        if basis is None or basis is self.H.basisset:
+            S_mixed = self.H.S
+        else:
+            S_mixed = ao_overlap(self.H.basisset, basis)
+
+        # Projection onto the current virtual space, in the basis of the canonical virtual orbitals
+        C_v = self.C[:,self.ndocc:]
+        W = C_v.conj().T @ S_mixed @ C_no
+
+        # Symmetric orthonormalization, which keeps the orbitals as close as possible to the projected ones
+        s, V = np.linalg.eigh(W.conj().T @ W)
+        W = W @ (V * s**(-0.5)) @ V.conj().T
+
+        # Semicanonical orbitals, diagonalizing the Fock matrix in the truncated space
+        eps_v, Q = np.linalg.eigh(W.conj().T @ (self.eps[self.ndocc:,None] * W))
+        W = W @ Q
+
+        self.C = np.hstack((self.C[:,:self.ndocc], C_v @ W))
+        self.eps = np.concatenate((self.eps[:self.ndocc], eps_v))
+        self.nmo = self.C.shape[1]
+
+    def degenerate_blocks(self, tol):
+        """
+        Group the occupied and the virtual orbitals into blocks of consecutive orbitals
+        whose orbital energies differ by less than tol
+
+        Parameters
+        ----------
+        tol: orbital-energy gap below which neighboring orbitals belong to the same block
+
+        Returns
+        -------
+        blocks: list of lists of MO indices
+        """
+        eps = np.real(self.eps)
+        blocks = []
+        for start, stop in [(0, self.ndocc), (self.ndocc, len(eps))]:
+            for p in range(start, stop):
+                if p == start or eps[p] - eps[p-1] >= tol:
+                    blocks.append([p])
+                else:
+                    blocks[-1].append(p)
+        return blocks
@@ -5,15 +5,23 @@ import numpy as np
 import psi4
 from opt_einsum import contract
 import psi4
-from .utils import DIIS
+from .utils import DIIS, JK, MOIntegrals
 
 
 class mpwfn(object):
 
-    def __init__(self, hfwfn):
+    def __init__(self, hfwfn, **kwargs):
 
         self.hfwfn = hfwfn
 
+        # Conventional (four-index) or density-fitted (three-index) two-electron integrals
+        valid_mp2_types = ['CONV', 'DF']
+        mp2_type = kwargs.pop('mp2_type', 'CONV').upper()
+        if mp2_type not in valid_mp2_types:
+            raise Exception(f"{mp2_type:s} is not an allowed choice of mp2_type.")
+        self.mp2_type = mp2_type
+        batch_memory = kwargs.pop('batch_memory', 500) # memory (MB) for the integrals and amplitudes of each batch of occupied pairs
+
         ## Transform Hamiltonian to MO basis
 
         # AO-basis one-electron Hamiltonian
@@ -26,36 +34,15 @@ class mpwfn(object):
         if nfzc > 0:
             C = self.hfwfn.C[:,:nfzc] # only core MOs
             Pc = contract('pi,qi->pq', C, C.conj())
-            ERI = self.hfwfn.H.ERI
-            hc = h + 2.0 * contract('pqrs,pq->rs', ERI, Pc) - contract('pqrs,ps->qr', ERI, Pc)
+            J, K = JK(self.hfwfn.H.ERI).jk(Pc)
+            hc = h + 2.0 * J - K
             self.efzc = contract('pq,pq->', (h+hc), Pc)
             h = hc
 
         # Select active MOs
         C = self.hfwfn.C[:,nfzc:]
 
-        # AO->MO two-electron integral transformation: (ov|ov)
-        ERI = self.hfwfn.H.ERI
-        ERI = contract('pqrs,sl->pqrl', ERI, C[:,hfwfn.ndocc-nfzc:])
-        ERI = contract('pqrl,rk->pqkl', ERI, C.conj()[:,:hfwfn.ndocc-nfzc])
-        ERI = contract('pqkl,qj->pjkl', ERI, C[:,hfwfn.ndocc-nfzc:])
-        ERI = contract('pjkl,pi->ijkl', ERI, C.conj()[:,:hfwfn.ndocc-nfzc])
-
-        # Convert to Dirac ordering
-        ERI_oovv = self.ERI_oovv = ERI.swapaxes(1,2)
-        L = self.L = 2.0 * ERI_oovv - ERI_oovv.swapaxes(2,3)
-
-        # AO->MO two-electron integral transformation: (vo|vo)
-        ERI = self.hfwfn.H.ERI
-        ERI = contract('pqrs,sl->pqrl', ERI, C[:,:hfwfn.ndocc-nfzc])
-        ERI = contract('pqrl,rk->pqkl', ERI, C.conj()[:,hfwfn.ndocc-nfzc:])
-        ERI = contract('pqkl,qj->pjkl', ERI, C[:,:hfwfn.ndocc-nfzc])
-        ERI = contract('pjkl,pi->ijkl', ERI, C.conj()[:,hfwfn.ndocc-nfzc:])
-
-        # Convert to Dirac ordering
-        ERI_vvoo = self.ERI_vvoo = ERI.swapaxes(1,2)
-
-        nt = self.nt = hfwfn.nbf - nfzc # assumes number of MOs = number of AOs
+        nt = self.nt = hfwfn.nmo - nfzc
         no = self.no = hfwfn.ndocc - nfzc
         nv = self.nv = self.nt - self.no
 
@@ -64,12 +51,26 @@ class mpwfn(object):
         v = self.v = slice(no, nt)
         a = self.a = slice(0, nt)
 
-        # Build orbital energy denominators
-        eps_occ = hfwfn.eps[nfzc:hfwfn.ndocc]
-        eps_vir = hfwfn.eps[hfwfn.ndocc:]
-        Dia = eps_occ.reshape(-1,1) - eps_vir # For later when I add singles
-        Dijab = eps_occ.reshape(-1,1,1,1) + eps_occ.reshape(-1,1,1) - eps_vir.reshape(-1,1) - eps_vir
-        self.Dijab = Dijab
+        # AO->MO two-electron integral transformation: <oo|vv>, or the density-fitted (Q|ov) from which
+        # <ij|ab> = (ia|jb) is built for one batch of occupied pairs at a time (see oovv())
+        if mp2_type == 'CONV':
+            mo = MOIntegrals(self.hfwfn.H.ERI, C, no)
+            self.ERI_oovv = mo.block('oovv')
+        else:
+            B = self.hfwfn.H.df_factors()
+            self.B_ov = contract('Qmn,mi,na->Qia', B, C[:,o].conj(), C[:,v])
+
+        # Orbital energies for the denominators
+        self.eps_occ = hfwfn.eps[nfzc:hfwfn.ndocc]
+        self.eps_vir = hfwfn.eps[hfwfn.ndocc:]
+
+        # Occupied orbitals i per batch of ij pairs, with <ij|ab>, its exchange counterpart, and
+        # the amplitudes held at once
+        itemsize = np.dtype(C.dtype).itemsize
+        self.batch_size = int(min(no, max(1, batch_memory * 1024**2 // (3 * itemsize * no * nv * nv))))
+
+        self.C0 = None # set by solve()
+        self._C2 = None
 
 
 
@@ -77,6 +78,7 @@ class mpwfn(object):
 
         # Extract kwargs
         print_level = kwargs.pop('print_level', 0)
+        amplitudes = kwargs.pop('amplitudes', True) # return the doubles amplitudes (else None, and C2 is built on first use)
 
         valid_normalizations = ['FULL', 'INTERMEDIATE']
         normalization = kwargs.pop('normalization', 'FULL').upper()
@@ -85,46 +87,117 @@ class mpwfn(object):
         self.normalization = normalization
 
         if print_level > 2:
-            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nbf, self.nt, self.no, self.nv))
+            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nmo, self.nt, self.no, self.nv))
 
         o = self.o
         v = self.v
-        ERI_vvoo = self.ERI_vvoo
-        L = self.L
-        Dijab = self.Dijab
 
         E0 = self.hfwfn.escf + self.hfwfn.H.enuc
         if print_level > 2:
             print("HFWFN ESCF (electronic) = ", self.hfwfn.escf)
             print("HFWFN ESCF (total) =      ", self.hfwfn.escf + self.hfwfn.enuc)
 
-        # first-order wfn amplitudes -- intermediate normalization
-        C0 = 1.0
-        C2 = ERI_vvoo.swapaxes(0,2).swapaxes(1,3)/Dijab
-
-        # MP2 energy
-        emp2 = self.compute_mp2_energy(o, v, L, C2)
+        # MP2 energy and norm of the first-order wfn (intermediate normalization), by batches of occupied pairs
+        emp2 = 0.0
+        norm2 = 0.0
+        for i in range(0, self.no, self.batch_size):
+            ERI_oovv, C2 = self.amplitudes(i, i + self.batch_size)
+            L = 2.0 * ERI_oovv - ERI_oovv.swapaxes(2,3)
+            emp2 += self.compute_mp2_energy(o, v, L, C2)
+            norm2 += contract('ijab,ijab->', (2*C2-C2.swapaxes(2,3)).conj(), C2)
 
         if print_level > 2:
             print("MP2 Correlation Energy = ", emp2)
             print("MP2 Total Energy       = ", emp2 + E0)
 
         # Re-normalize if necessary
+        C0 = 1.0
         if self.normalization == 'FULL':
-            C0, C2 = self.normalize(o, v, C2)
-            norm = np.sqrt(C0*C0 + contract('ijab,ijab->', (2*C2-C2.swapaxes(2,3)).conj(), C2))
+            C0 = 1.0/np.sqrt(1.0 + norm2)
+            norm = np.sqrt(C0*C0 * (1.0 + norm2))
             if print_level > 2:
                 print(f"Normalization check = {norm:18.12f}")
         self.C0 = C0
-        self.C2 = C2
-
-        return emp2, C0, C2
+        self._C2 = None # built on first use
+
+        return emp2, C0, (self.C2 if amplitudes else None)
+
+    @property
+    def C2(self):
+        """
+        First-order doubles amplitudes, in the normalization of solve(), built on first use
+        """
+        if self.C0 is None:
+            raise Exception("MP2 amplitudes are not available before solve().")
+        if self._C2 is None:
+            self._C2 = self.C0 * np.concatenate([self.amplitudes(i, i + self.batch_size)[1] for i in range(0, self.no, self.batch_size)])
+        return self._C2
+
+    def oovv(self, i0, i1):
+        """
+        Integrals <ij|ab> for a batch of occupied orbitals i
+
+        Parameters
+        ----------
+        i0, i1: range of the first occupied index
+
+        Returns
+        -------
+        ERI: <ij|ab> for i0 <= i < i1 (NumPy array)
+        """
+        if self.mp2_type == 'CONV':
+            return self.ERI_oovv[i0:i1]
+        return contract('Qia,Qjb->ijab', self.B_ov[:,i0:i1], self.B_ov)
+
+    def amplitudes(self, i0, i1):
+        """
+        First-order doubles amplitudes in intermediate normalization, C2[i,j,a,b] = <ab|ij>/D[i,j,a,b],
+        for a batch of occupied orbitals i
+
+        Parameters
+        ----------
+        i0, i1: range of the first occupied index
+
+        Returns
+        -------
+        ERI: <ij|ab> for i0 <= i < i1 (NumPy array)
+        C2: amplitudes for i0 <= i < i1 (NumPy array)
+        """
+        ERI_oovv = self.oovv(i0, i1)
+        eps_occ = self.eps_occ
+        eps_vir = self.eps_vir
+        Dijab = eps_occ[i0:i1].reshape(-1,1,1,1) + eps_occ.reshape(-1,1,1) - eps_vir.reshape(-1,1) - eps_vir
+
+        return ERI_oovv, ERI_oovv.conj()/Dijab
+
+    def natural_virtuals(self, threshold):
+        """
+        Frozen natural virtual orbitals from the MP2 virtual-virtual density,
+
+            D[a,b] = sum_ijc (2 C2[i,j,a,c] - C2[i,j,c,a]) C2[i,j,b,c]^*,
+
+        with the amplitudes in intermediate normalization, accumulated by batches of occupied pairs.
+
+        Parameters
+        ----------
+        threshold: natural orbitals with occupation numbers above threshold are kept
+
+        Returns
+        -------
+        C_no: AO-basis coefficients of the kept natural virtual orbitals, by decreasing occupation (NumPy array)
+        occ: occupation numbers of all natural virtual orbitals, by decreasing occupation (NumPy array)
+        """
+        D = 0.0
+        for i in range(0, self.no, self.batch_size):
+            C2 = self.amplitudes(i, i + self.batch_size)[1]
+            D += contract('ijac,ijbc->ab', 2*C2 - C2.swapaxes(2,3), C2.conj())
+        occ, U = np.linalg.eigh(0.5 * (D + D.conj().T))
+        occ = occ[::-1]; U = U[:,::-1]
+
+        C_no = self.hfwfn.C[:,self.hfwfn.ndocc:] @ U[:,occ > threshold]
+
+        return C_no, occ
 
     def compute_mp2_energy(self, o, v, L, C2):
         emp2 = 1 * contract('ijab,ijab->', C2, L)
         return emp2
-
-    def normalize(self, o, v, C2):
-        N = 1.0/np.sqrt(1.0 + contract('ijab,ijab->', (2*C2-C2.swapaxes(2,3)).conj(), C2))
-        C0 = N; C2 = N * C2
-        return C0, C2
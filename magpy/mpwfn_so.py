@@ -5,7 +5,7 @@ import numpy as np
 import psi4
 from opt_einsum import contract
 import psi4
-from .utils import DIIS
+from .utils import DIIS, JK, MOIntegrals
 
 
 class mpwfn_so(object):
@@ -26,12 +26,12 @@ class mpwfn_so(object):
         if nfzc > 0:
             C = self.hfwfn.C[:,:nfzc] # only core MOs
             Pc = contract('pi,qi->pq', C, C.conj())
-            ERI = self.hfwfn.H.ERI
-            hc = h + 2.0 * contract('pqrs,pq->rs', ERI, Pc) - contract('pqrs,ps->qr', ERI, Pc)
+            J, K = JK(self.hfwfn.H.ERI).jk(Pc)
+            hc = h + 2.0 * J - K
             self.efzc = contract('pq,pq->', (h+hc), Pc)
             h = hc
 
-        nt = self.nt = 2*(hfwfn.nbf - nfzc) # assumes number of MOs = number of AOs
+        nt = self.nt = 2*(hfwfn.nmo - nfzc)
         no = self.no = 2*(hfwfn.ndocc - nfzc)
         nv = self.nv = self.nt - self.no
         self.nfzc = 2*nfzc
@@ -44,43 +44,11 @@ class mpwfn_so(object):
         # Select active MOs
         C = self.hfwfn.C[:,nfzc:]
 
-        # AO->MO two-electron integral transformation: (ov|ov)
-        ERI = self.hfwfn.H.ERI
-        ERI = contract('pqrs,sl->pqrl', ERI, C[:,hfwfn.ndocc-nfzc:])
-        ERI = contract('pqrl,rk->pqkl', ERI, C.conj()[:,:hfwfn.ndocc-nfzc])
-        ERI = contract('pqkl,qj->pjkl', ERI, C[:,hfwfn.ndocc-nfzc:])
-        ERI = contract('pjkl,pi->ijkl', ERI, C.conj()[:,:hfwfn.ndocc-nfzc])
-        ERI = ERI
-
-        ## Translate Hamiltonian to spin orbital basis
-        data = ERI.dtype
-
-        # Convert to Dirac ordering
-        ERI_oovv = np.zeros((no, no, nv, nv), dtype=data)
-        for p in range(no):
-            for q in range(no):
-                for r in range(nv):
-                    for s in range(nv):
-                        ERI_oovv[p,q,r,s] = ERI[p//2,r//2,q//2,s//2] * (p%2 == r%2) * (q%2 == s%2)
-                        ERI_oovv[p,q,r,s] -= ERI[p//2,s//2,q//2,r//2] * (p%2 == s%2) * (q%2 == r%2)
-        self.ERI_oovv = ERI_oovv
-
-        # AO->MO two-electron integral transformation: (vo|vo)
-        ERI = self.hfwfn.H.ERI
-        ERI = contract('pqrs,sl->pqrl', ERI, C[:,:hfwfn.ndocc-nfzc])
-        ERI = contract('pqrl,rk->pqkl', ERI, C.conj()[:,hfwfn.ndocc-nfzc:])
-        ERI = contract('pqkl,qj->pjkl', ERI, C[:,:hfwfn.ndocc-nfzc])
-        ERI = contract('pjkl,pi->ijkl', ERI, C.conj()[:,hfwfn.ndocc-nfzc:])
-
-        # Convert to Dirac ordering
-        ERI_vvoo = np.zeros((nv, nv, no, no), dtype=data)
-        for p in range(nv):
-            for q in range(nv):
-                for r in range(no):
-                    for s in range(no):
-                        ERI_vvoo[p,q,r,s] = ERI[p//2,r//2,q//2,s//2] * (p%2 == r%2) * (q%2 == s%2)
-                        ERI_vvoo[p,q,r,s] -= ERI[p//2,s//2,q//2,r//2] * (p%2 == s%2) * (q%2 == r%2)
-        self.ERI_vvoo = ERI_vvoo
+        # AO->MO two-electron integral transformation to antisymmetrized spin-orbital
+        # form: <oo||vv>, and <vv||oo> = <oo||vv>^*
+        mo = MOIntegrals(self.hfwfn.H.ERI, C, hfwfn.ndocc-nfzc)
+        self.ERI_oovv = mo.so_block('oovv')
+        self.ERI_vvoo = mo.so_block('vvoo')
 
         # Build orbital energy denominators
         eps = hfwfn.eps[nfzc:hfwfn.ndocc]
@@ -109,7 +77,7 @@ class mpwfn_so(object):
         self.normalization = normalization
 
         if print_level > 2:
-            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nbf, self.nt, self.no, self.nv))
+            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nmo, self.nt, self.no, self.nv))
 
         o = self.o
         v = self.v
@@ -21,6 +21,10 @@ def normal(molecule, method='HF', r_disp=0.001, f_disp=0.0001, b_disp=0.0001, **
     max_diis = kwargs.pop('max_diis', 8)
     start_diis = kwargs.pop('start_diis', 1)
     print_level = kwargs.pop('print_level', 1)
+    prefetch = kwargs.pop('prefetch', 0) # number of displaced geometries whose ERIs are computed ahead in a helper process
+    # (the helper is spawned and imports the main module again: guard a calling script with if __name__ == "__main__":)
+    convergence = kwargs.pop('convergence', 'FIXED').upper() # 'FIXED' (e_conv, r_conv) or 'AUTO' (from step sizes)
+    precision = kwargs.pop('precision', 1e-5) # target precision of each tensor element for convergence='AUTO'
     read_hessian = kwargs.pop('read_hessian', False)
     if read_hessian == True:
         fcm_file = kwargs.pop('fcm_file', 'fcm')
@@ -38,11 +42,15 @@ def normal(molecule, method='HF', r_disp=0.001, f_disp=0.0001, b_disp=0.0001, **
         print(f"    r_disp = {r_disp:e}")
         print(f"    f_disp = {f_disp:e}")
         print(f"    b_disp = {b_disp:e}")
+        print(f"    convergence = {convergence:s}")
+        if convergence == 'AUTO':
+            print(f"    precision = {precision:e}")
         print(f"    e_conv = {e_conv:e}")
         print(f"    r_conv = {r_conv:e}")
         print(f"    maxiter = {maxiter:d}")
         print(f"    max_diis = {max_diis:d}")
         print(f"    start_diis = {start_diis:d}")
+        print(f"    prefetch = {prefetch:d}")
         print(f"    read_hessian = {read_hessian}")
         if read_hessian is True:
             print(f"    fcm_file = {fcm_file:s}")
@@ -74,7 +82,7 @@ def normal(molecule, method='HF', r_disp=0.001, f_disp=0.0001, b_disp=0.0001, **
     # Compute the Hessian [Eh/(a0^2)]
     if read_hessian is False:
         hessian = magpy.Hessian(molecule)
-        H = hessian.compute(method, r_disp, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+        H = hessian.compute(method, r_disp, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, prefetch=prefetch, convergence=convergence, precision=precision)
     else:
         print("Using provided hessian...")
         H = np.genfromtxt(fcm_file, skip_header=1).reshape(3*molecule.natom(),3*molecule.natom())
@@ -98,7 +106,7 @@ def normal(molecule, method='HF', r_disp=0.001, f_disp=0.0001, b_disp=0.0001, **
 
     # Compute APTs and transform to normal mode basis
     APT = magpy.APT(molecule)
-    P = APT.compute(method, r_disp, f_disp, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+    P = APT.compute(method, r_disp, f_disp, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, prefetch=prefetch, convergence=convergence, precision=precision)
     # (e a0)/(a0 sqrt(m_e))
     P = P.T @ S # 3 x (3N-6)
 
@@ -114,11 +122,11 @@ def normal(molecule, method='HF', r_disp=0.001, f_disp=0.0001, b_disp=0.0001, **
     r_disp = 0.0001 # need smaller displacement for AAT
     AAT = magpy.AAT(molecule)
     if method == 'HF':
-        I = AAT.compute(method, r_disp, b_disp, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level)
+        I = AAT.compute(method, r_disp, b_disp, e_conv=e_conv, r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis, print_level=print_level, prefetch=prefetch, convergence=convergence, precision=precision)
     elif method == 'CID' or method == 'MP2':
         I_00, I_0D, I_D0, I_DD = AAT.compute(method, r_disp, b_disp, e_conv=e_conv,
         r_conv=r_conv, maxiter=maxiter, max_diis=max_diis, start_diis=start_diis,
-        print_level=print_level, parallel=parallel, num_procs=num_procs)
+        print_level=print_level, parallel=parallel, num_procs=num_procs, prefetch=prefetch, convergence=convergence, precision=precision)
         I = I_00 + I_DD
     J = AAT.nuclear() # nuclear contribution
     M = I + J   # 3N x 3
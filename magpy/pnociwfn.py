@@ -0,0 +1,537 @@
+if __name__ == "__main__":
+    raise Exception("This file cannot be invoked on its own.")
+
+import numpy as np
+from opt_einsum import contract
+from .utils import DIIS, JK
+from .hamiltonian import ao_overlap
+
+
+class pnociwfn(object):
+    """
+    Local CID wave function in pair natural orbitals (PNOs)
+
+    The active occupied orbitals are localized (Cholesky orbitals), pairs of localized orbitals
+    with a small semicanonical MP2 pair energy are dropped, and the doubles amplitudes of each
+    remaining pair ij are expanded in its own truncated set of semicanonical PNOs, the eigenvectors
+    of the MP2 pair density with occupations above a threshold.  The residual of each pair is built
+    in its PNO basis from the amplitudes of the other pairs, through the overlaps of their PNOs, and
+    from PNO-basis integrals of the Cholesky-decomposed two-electron integrals, so the dimensions of
+    the iterations are those of the pair and PNO spaces.  C0/C2 are returned in the canonical orbitals
+    of hfwfn, as for ciwfn, so that the wave function may be used in the same way (e.g., in AAT and APT).
+
+    Two pairs are coupled only if they have an occupied index in common or their <mn|ij> integral is
+    above coupling_threshold, and the PNO overlaps are kept for coupled pairs alone.  The cost and
+    memory of each iteration thus grow with the number of significant pairs times the number of pairs
+    coupled to each, which is bounded for localized orbitals of well-separated groups, rather than
+    with the square of the number of pairs.  The integrals are built from the full Cholesky vectors
+    before the iterations, so the setup is not reduced-scaling.
+
+    For finite differences, the localized orbitals, pairs, and PNOs of a reference wave function
+    (ref) are instead projected onto the orbital spaces of this one, so that they vary smoothly
+    with the perturbation.
+    """
+    def __init__(self, hfwfn, **kwargs):
+        """
+        Constructor for the PNO-CID wave function.
+
+        Parameters
+        ----------
+        hfwfn: converged hfwfn object
+        normalization: 'FULL' (default) or 'INTERMEDIATE'
+        pno_threshold: occupation number above which PNOs are kept (default 1e-8)
+        pair_threshold: absolute MP2 pair energy above which pairs are kept (default 1e-6)
+        coupling_threshold: integral |<mn|ij>| above which the amplitudes of a pair mn with no index in
+        common with ij enter the residual of ij (default 1e-8)
+        cholesky_threshold: threshold of the Cholesky decomposition of the two-electron integrals (default 1e-8)
+        ref: pnociwfn object (e.g., at the reference geometry) whose localized orbitals, pairs,
+        and PNOs are projected onto the spaces of this wave function (thresholds are then ignored)
+
+        Returns
+        -------
+        pnociwfn object
+        """
+        self.hfwfn = hfwfn
+
+        self.nfzc = nfzc = hfwfn.H.basisset.n_frozen_core()
+
+        valid_normalizations = ['FULL', 'INTERMEDIATE']
+        normalization = kwargs.pop('normalization', 'FULL').upper()
+        if normalization not in valid_normalizations:
+            raise Exception(f"{normalization:s} is not an allowed choice of normalization.")
+        self.normalization = normalization
+
+        ref = kwargs.pop('ref', None)
+        self.pno_threshold = kwargs.pop('pno_threshold', 1e-8)
+        self.pair_threshold = kwargs.pop('pair_threshold', 1e-6)
+        self.coupling_threshold = kwargs.pop('coupling_threshold', 1e-8)
+        self.cholesky_threshold = kwargs.pop('cholesky_threshold', 1e-8)
+
+        nt = self.nt = hfwfn.nmo - nfzc
+        no = self.no = hfwfn.ndocc - nfzc
+        nv = self.nv = hfwfn.nmo - self.no - nfzc
+
+        # Set up orbital subspace slices
+        o = self.o = slice(0, no)
+        v = self.v = slice(no, nt)
+
+        # Active canonical MOs
+        C = self.hfwfn.C[:,nfzc:]
+        C_occ = C[:,o]
+        self.Cv = Cv = C[:,v]
+
+        # AO-basis Fock matrix of the SCF density (including any frozen core orbitals)
+        C_docc = self.hfwfn.C[:,:hfwfn.ndocc]
+        J, K = JK(self.hfwfn.H.ERI).jk(contract('pi,qi->pq', C_docc, C_docc.conj()))
+        F_ao = self.hfwfn.H.T + self.hfwfn.H.V + 2.0 * J - K
+
+        if ref is not None:
+            if (ref.no, ref.nv) != (no, nv):
+                raise Exception("Reference and current wave functions do not have the same numbers of active orbitals: (%d,%d) vs. (%d,%d)." %
+                        (ref.no, ref.nv, no, nv))
+            self.pno_threshold = ref.pno_threshold
+            self.pair_threshold = ref.pair_threshold
+            self.coupling_threshold = ref.coupling_threshold
+            self.cholesky_threshold = ref.cholesky_threshold
+            if ref.hfwfn.H.basisset is hfwfn.H.basisset:
+                S_mixed = hfwfn.H.S
+            else:
+                S_mixed = ao_overlap(hfwfn.H.basisset, ref.hfwfn.H.basisset)
+
+        # Localized occupied orbitals, C_lmo = C_occ U
+        if ref is None:
+            U = self.localize(C_occ)
+        else:
+            U = self.project(C_occ, S_mixed @ ref.C_lmo)
+        self.U = U
+        self.C_lmo = C_occ @ U
+
+        # Occupied-occupied Fock matrix in the localized orbitals and virtual-virtual in the canonical ones
+        F_occ = self.F_occ = self.C_lmo.conj().T @ F_ao @ self.C_lmo
+        F_vir = self.F_vir = Cv.conj().T @ F_ao @ Cv
+        f = np.diag(F_occ).real
+        eps_vir = np.diag(F_vir).real
+
+        # Cholesky-decomposed two-electron integrals, (pq|rs) = sum_P B[P,p,q] B[P,r,s], in the localized
+        # occupied and canonical virtual orbitals
+        B = self.hfwfn.H.cholesky_factors(self.cholesky_threshold)
+        Boo = contract('Ppq,pi,qj->Pij', B, self.C_lmo.conj(), self.C_lmo)
+        Bov = contract('Ppq,pi,qa->Pia', B, self.C_lmo.conj(), Cv)
+        Bvv = contract('Ppq,pa,qb->Pab', B, Cv.conj(), Cv)
+        self.oooo = contract('Pmi,Pnj->mnij', Boo, Boo) # <mn|ij>
+
+        # Significant pairs (i <= j) and their PNOs, or those of the reference
+        if ref is None:
+            # Semicanonical MP2 amplitudes with the diagonal occupied Fock elements, and pair energies
+            self.pairs = []
+            Q_pairs = []
+            for i in range(no):
+                for j in range(i, no):
+                    K = Bov[:,i].T @ Bov[:,j] # <ij|ab>
+                    T2 = K.conj()/(f[i] + f[j] - eps_vir.reshape(-1,1) - eps_vir)
+                    e_pair = contract('ab,ab->', T2, 2.0 * K - K.T).real
+                    if abs(e_pair) * (2 - (i == j)) < self.pair_threshold:
+                        continue
+                    Q, occ = self.pair_natural_orbitals(T2, i == j)
+                    if Q.shape[1] > 0:
+                        self.pairs.append((i, j))
+                        Q_pairs.append(Q)
+        else:
+            self.pairs = list(ref.pairs)
+            Q_pairs = [self.project(Cv, S_mixed @ Q_ao) for Q_ao in ref.Q_ao]
+        self.index = {pair: p for p, pair in enumerate(self.pairs)}
+
+        # Semicanonical PNOs, diagonalizing the virtual-virtual Fock matrix in each pair space
+        self.Q = []
+        self.Q_ao = []
+        self.eps = []
+        self.D = []
+        for (i, j), Q in zip(self.pairs, Q_pairs):
+            eps_pno, R = np.linalg.eigh(Q.conj().T @ F_vir @ Q)
+            Q = Q @ R
+            self.Q.append(Q)
+            self.Q_ao.append(Cv @ Q)
+            self.eps.append(eps_pno)
+            self.D.append(f[i] + f[j] - eps_pno.reshape(-1,1) - eps_pno)
+
+        # Pairs q = mn coupled to each pair p = ij: those with an index in common, which enter through the
+        # Fock matrix and the ovov/ovvo integrals, and those with a non-negligible <mn|ij> or <nm|ij>, which
+        # enter through the oooo integrals.  Only the overlaps of the PNOs of coupled pairs, S[p][q] = Q_p^H Q_q,
+        # are kept, and the oooo couplings are stored as (q, <mn|ij>, <nm|ij>).
+        self.S = []
+        self.hole_couplings = []
+        for (i, j), Qp in zip(self.pairs, self.Q):
+            S = {}
+            holes = []
+            for q, ((m, n), Qq) in enumerate(zip(self.pairs, self.Q)):
+                common = len({i, j} & {m, n}) > 0
+                coupled = max(abs(self.oooo[m,n,i,j]), abs(self.oooo[n,m,i,j])) > self.coupling_threshold
+                if common or coupled:
+                    S[q] = Qp.conj().T @ Qq
+                if coupled:
+                    holes.append((q, self.oooo[m,n,i,j], self.oooo[n,m,i,j]))
+            self.S.append(S)
+            self.hole_couplings.append(holes)
+
+        # PNO-basis integrals of each pair: K_ij = Q_ij^T <ij|ab> Q_ij, for the energy and the
+        # inhomogeneous term, and the particle-particle ladder integrals <ab|ef>, as an (npno^2, npno^2) matrix
+        Bov_pno = [Bov @ Q for Q in self.Q]
+        self.K = []
+        self.W = []
+        for (i, j), Q, X in zip(self.pairs, self.Q, Bov_pno):
+            self.K.append(X[:,i].T @ X[:,j])
+            Y = contract('ap,Pab,bq->Ppq', Q.conj(), Bvv, Q)
+            n = Q.shape[1]
+            self.W.append(contract('Pae,Pbf->abef', Y, Y).reshape(n*n, n*n))
+
+        # Integrals coupling pair ij to the pairs km, for k = i, j and l the other index, in the PNOs of ij
+        # (rows) and km (columns): J = <ma|le> and K = <ma|el>.  Stored as (m, index of km, J, K, F_ml)
+        # for each ordering (k, l) of ij.
+        self.couplings = []
+        for p, ((i, j), Q) in enumerate(zip(self.pairs, self.Q)):
+            Y = contract('ap,Pab->Ppb', Q.conj(), Bvv)
+            orderings = []
+            for k, l in ([(i, j), (j, i)] if i != j else [(i, i)]):
+                Z = contract('Pm,Ppb->mpb', Boo[:,:,l], Y)
+                terms = []
+                for m in range(no):
+                    q = self.index.get((min(k, m), max(k, m)))
+                    if q is None:
+                        continue
+                    J = Z[m] @ self.Q[q]
+                    K = Bov_pno[p][:,l].conj().T @ Bov_pno[q][:,m]
+                    terms.append((m, q, J, K, F_occ[m,l]))
+                orderings.append(((k, l), terms))
+            self.couplings.append(orderings)
+
+        # Offsets of the pair amplitudes in the concatenated amplitude vector
+        self.offsets = np.cumsum([0] + [Q.shape[1]**2 for Q in self.Q])
+
+        # Number of unpacked (i,j) pairs represented by each i <= j pair
+        self.weight = np.array([1.0 if i == j else 2.0 for i, j in self.pairs])
+
+
+    def localize(self, C_occ):
+        """
+        Cholesky localization of the occupied orbitals
+
+        The pivoted Cholesky decomposition of the AO-basis density, D = C_occ C_occ^H = L L^H, with
+        the largest remaining diagonal element as the pivot at each step, gives orthonormal orbitals
+        L = C_occ U localized about the pivot basis functions [Aquilante et al., J. Chem. Phys. 125,
+        174101 (2006)].  The decomposition is carried out in the occupied space, with P the
+        projector onto the orbitals not yet spanned.
+
+        Parameters
+        ----------
+        C_occ: AO-basis coefficients of the occupied orbitals (NumPy array)
+
+        Returns
+        -------
+        U: unitary transformation to the localized orbitals (NumPy array)
+        """
+        no = C_occ.shape[1]
+        U = np.zeros((no, no), dtype=C_occ.dtype)
+        for k in range(no):
+            X = C_occ - (C_occ @ U[:,:k]) @ U[:,:k].conj().T # C_occ P
+            d = np.sum(np.abs(X)**2, axis=1) # diagonal of the remaining density
+            mu = np.argmax(d)
+            U[:,k] = X[mu].conj()/np.sqrt(d[mu])
+
+        return U
+
+
+    def project(self, C, X):
+        """
+        Projection of orbitals onto the space spanned by C, with symmetric orthonormalization
+
+        Parameters
+        ----------
+        C: AO-basis coefficients of the orthonormal orbitals spanning the space (NumPy array)
+        X: overlap-weighted AO-basis coefficients of the orbitals to project, S_mixed @ C_X (NumPy array)
+
+        Returns
+        -------
+        W: orthonormal projected orbitals in the basis of C (NumPy array)
+        """
+        W = C.conj().T @ X
+        s, V = np.linalg.eigh(W.conj().T @ W)
+        return W @ (V * s**(-0.5)) @ V.conj().T
+
+
+    def pair_natural_orbitals(self, T, diagonal):
+        """
+        PNOs of a pair from its MP2 amplitudes
+
+        The pair density, D = 2/(1 + delta_ij) (Tt^H T + Tt T^H) with Tt = 2 T - T^T, is
+        diagonalized, and its eigenvectors with occupations above pno_threshold are kept.
+
+        Parameters
+        ----------
+        T: MP2 amplitudes T[a,b] of the pair in the canonical virtual orbitals (NumPy array)
+        diagonal: True for an i = j pair
+
+        Returns
+        -------
+        Q: PNOs in the basis of the canonical virtual orbitals (NumPy array)
+        occ: their occupation numbers
+        """
+        Tt = 2.0 * T - T.T
+        D = (2.0/(1 + diagonal)) * (Tt.conj().T @ T + Tt @ T.conj().T)
+        occ, X = np.linalg.eigh(0.5 * (D + D.conj().T))
+        occ = occ[::-1]; X = X[:,::-1]
+        keep = occ > self.pno_threshold
+
+        return X[:,keep], occ[keep]
+
+
+    def solve(self, **kwargs):
+
+        # Extract kwargs
+        e_conv = kwargs.pop('e_conv', 1e-7)
+        r_conv = kwargs.pop('r_conv', 1e-7)
+        maxiter = kwargs.pop('maxiter', 100)
+        max_diis = kwargs.pop('max_diis', 8)
+        start_diis = kwargs.pop('start_diis', 1)
+        print_level = kwargs.pop('print_level', 0)
+        guess = kwargs.pop('guess', None) # converged ciwfn or pnociwfn object for the initial amplitudes
+
+        no = self.no
+        E0 = self.hfwfn.escf + self.hfwfn.H.enuc
+
+        if print_level > 2:
+            npno = [Q.shape[1] for Q in self.Q]
+            print("\nNMO = %d; NACT = %d; NO = %d; NV = %d" % (self.hfwfn.nmo, self.nt, self.no, self.nv))
+            print("PNO pairs = %d of %d; PNOs per pair = %.1f (max %d)" % (len(self.pairs), no*(no+1)//2,
+                np.mean(npno) if npno else 0.0, max(npno, default=0)))
+            print("\nSolving projected PNO-CID equations.")
+
+        # No significant pairs: the reference determinant alone
+        if len(self.pairs) == 0:
+            self.T = np.zeros(0, dtype=self.hfwfn.C.dtype)
+            self.C0 = 1.0
+            self.C2 = self.canonical(self.unpack(self.T))
+            return 0.0, self.C0, self.C2
+
+        # initial guess amplitudes
+        C0 = 1.0
+        if guess is None:
+            T = np.concatenate([(K.conj()/D).ravel() for K, D in zip(self.K, self.D)])
+        else:
+            T = self.guess_amplitudes(guess)
+
+        # initial CI energy (= semicanonical PNO-MP2 energy)
+        eci = self.compute_cid_energy(T)
+
+        # Setup DIIS object
+        diis = DIIS(T, max_diis)
+
+        if print_level > 2:
+            print("CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  MP2" % (0, eci, -eci))
+
+        for niter in range(1, maxiter+1):
+            eci_last = eci
+
+            r2 = self.r_T2(eci, T)
+            dT = np.concatenate([(R/D).ravel() for R, D in zip(self.pairs_of(r2), self.D)])
+            T += dT
+
+            rms = np.sqrt(sum(w * np.sum(np.abs(X)**2) for w, X in zip(self.weight, self.pairs_of(dT))))
+
+            eci = self.compute_cid_energy(T)
+
+            ediff = eci - eci_last
+
+            if print_level > 2:
+                print('CID Iter %3d: CID Ecorr = %.15f  dE = %.5E  rms = %.5E' % (niter, eci, ediff, rms))
+
+            if ((abs(ediff) < e_conv) and (abs(rms) < r_conv)):
+                if print_level > 2:
+                    print("\nCID Equations converged.")
+                    print("CID Correlation Energy = ", eci)
+                    print("CID Total Energy       = ", eci + E0)
+
+                self.T = T
+
+                # Re-normalize if necessary
+                if self.normalization == 'FULL':
+                    C0, T = self.normalize(T)
+
+                self.C0 = C0
+                self.C2 = self.canonical(self.unpack(T))
+
+                return eci, self.C0, self.C2
+
+            diis.add_error_vector(T, dT)
+            if niter >= start_diis:
+                T = diis.extrapolate(T)
+
+        raise Exception("PNO-CID iterations failed to converge in %d cycles." % (maxiter))
+
+
+    def r_T2(self, E, T):
+        """
+        Doubles residual of the significant pairs in their PNO bases
+
+        The residual of each pair ij is built in its own PNOs: the amplitudes of the pairs km to which it
+        is coupled enter as S T_km S^T, with S the overlap of the PNOs of ij and km, and the integrals
+        are those of the PNOs of ij (and km).  Those terms of the canonical residual that are not
+        symmetric in the pair, X_ij, are computed for both orderings of ij and added as X_ij + X_ji^T.
+
+        Parameters
+        ----------
+        E: current correlation energy
+        T: concatenated PNO-basis amplitudes of the significant pairs (NumPy array)
+
+        Returns
+        -------
+        r2: concatenated PNO-basis residuals of the significant pairs (NumPy array)
+        """
+        Ts = self.pairs_of(T)
+
+        # Amplitudes of the pair (k, l) in the PNOs of k <= l
+        def amplitudes(k, l, q):
+            return Ts[q] if k <= l else Ts[q].T
+
+        r2 = np.zeros_like(T)
+        for p, ((i, j), R) in enumerate(zip(self.pairs, self.pairs_of(r2))):
+            Tij = Ts[p]
+            S = self.S[p]
+
+            R += self.K[p].conj()
+            R += self.eps[p].reshape(-1,1) * Tij + Tij * self.eps[p]
+            R -= E * Tij
+            R += (self.W[p] @ Tij.ravel()).reshape(Tij.shape)
+
+            for q, mnij, nmij in self.hole_couplings[p]:
+                X = Ts[q] * mnij
+                if self.pairs[q][0] != self.pairs[q][1]:
+                    X = X + Ts[q].T * nmij
+                R += S[q] @ X @ S[q].T
+
+            for (k, l), terms in self.couplings[p]:
+                X = np.zeros_like(R)
+                for m, q, J, K, F in terms:
+                    Tkm = amplitudes(k, m, q)
+                    X -= F * (S[q] @ Tkm @ S[q].T)
+                    X -= J @ Tkm @ S[q].T
+                    X += S[q] @ (2.0 * Tkm - Tkm.T) @ K.T
+                    X -= S[q] @ Tkm @ J.T
+                if (k, l) == (i, j):
+                    R += X
+                if (k, l) == (j, i):
+                    R += X.T
+
+        return r2
+
+
+    def pairs_of(self, T):
+        """
+        Views of the amplitudes (or residuals) of each significant pair in a concatenated vector
+
+        Parameters
+        ----------
+        T: concatenated PNO-basis amplitudes of the significant pairs (NumPy array)
+
+        Returns
+        -------
+        list of the (npno, npno) amplitudes of each pair (NumPy arrays)
+        """
+        return [T[p:q].reshape(Q.shape[1], Q.shape[1]) for p, q, Q in zip(self.offsets[:-1], self.offsets[1:], self.Q)]
+
+
+    def project_pairs(self, X):
+        """
+        Projection of the significant pairs of X[i,j,a,b] onto their PNOs, X_ij -> Q_ij^H X_ij Q_ij^*
+
+        Parameters
+        ----------
+        X: amplitudes (or residual) in the localized occupied and canonical virtual orbitals (NumPy array)
+
+        Returns
+        -------
+        T: concatenated PNO-basis amplitudes of the significant pairs (NumPy array)
+        """
+        return np.concatenate([np.zeros(0, dtype=X.dtype)] + [(Q.conj().T @ X[i,j] @ Q.conj()).ravel() for (i, j), Q in zip(self.pairs, self.Q)])
+
+
+    def unpack(self, T):
+        """
+        Amplitudes in the localized occupied and canonical virtual orbitals, C2[i,j] = Q_ij T_ij Q_ij^T,
+        with C2[j,i,b,a] = C2[i,j,a,b] and zero for the pairs that were dropped
+
+        Parameters
+        ----------
+        T: concatenated PNO-basis amplitudes of the significant pairs (NumPy array)
+
+        Returns
+        -------
+        C2: doubles amplitudes (NumPy array)
+        """
+        C2 = np.zeros((self.no, self.no, self.nv, self.nv), dtype=np.result_type(T, self.Cv))
+        for (i, j), Tij, Q in zip(self.pairs, self.pairs_of(T), self.Q):
+            C2[i,j] = Q @ Tij @ Q.T
+            C2[j,i] = C2[i,j].T
+
+        return C2
+
+
+    def canonical(self, C2):
+        """
+        Back-transformation of the amplitudes from the localized to the canonical occupied orbitals
+
+        Parameters
+        ----------
+        C2: doubles amplitudes in the localized occupied and canonical virtual orbitals (NumPy array)
+
+        Returns
+        -------
+        C2: doubles amplitudes in the canonical orbitals (NumPy array)
+        """
+        return contract('klab,ik,jl->ijab', C2, self.U.conj(), self.U.conj())
+
+
+    def guess_amplitudes(self, guess):
+        """
+        Initial PNO-basis amplitudes from the converged solution of another (canonical or PNO) CID
+        wave function, transformed to the orbitals of this one (see ciwfn.guess_amplitudes()) and
+        projected onto the PNOs of the significant pairs
+
+        Parameters
+        ----------
+        guess: converged ciwfn or pnociwfn object with the same numbers of active orbitals
+
+        Returns
+        -------
+        T: concatenated PNO-basis amplitudes in intermediate normalization (NumPy array)
+        """
+        if (guess.no, guess.nv) != (self.no, self.nv):
+            raise Exception("Guess and current wave functions do not have the same numbers of active orbitals: (%d,%d) vs. (%d,%d)." %
+                    (guess.no, guess.nv, self.no, self.nv))
+
+        # Active-orbital overlaps across the (possibly different) basis sets
+        C_guess = guess.hfwfn.C[:,guess.nfzc:]
+        C = self.hfwfn.C[:,self.nfzc:]
+        S = C_guess.conj().T @ ao_overlap(guess.hfwfn.H.basisset, self.hfwfn.H.basisset) @ C
+
+        # Canonical occupied orbitals of the guess to the localized ones of this wave function
+        Soo = S[self.o,self.o] @ self.U
+        Svv = S[self.v,self.v].conj()
+
+        C2 = contract('ijab,ik,jl,ac,bd->klcd', guess.C2/guess.C0, Soo, Soo, Svv, Svv)
+        if not np.iscomplexobj(self.Cv):
+            C2 = C2.real.copy()
+
+        return self.project_pairs(C2)
+
+
+    def compute_cid_energy(self, T):
+        """
+        CID correlation energy from the PNO-basis amplitudes, sum_ij sum_ab T_ij[a,b] (2 K_ij - K_ij^T)[a,b]
+        """
+        eci = sum(w * contract('ab,ab->', Tij, 2.0 * K - K.T) for w, Tij, K in zip(self.weight, self.pairs_of(T), self.K))
+        return eci
+
+    def normalize(self, T):
+        N = 1.0/np.sqrt(1.0 + sum(w * contract('ab,ab->', (2*Tij-Tij.T).conj(), Tij) for w, Tij in zip(self.weight, self.pairs_of(T))))
+        C0 = N; T = N * T
+        return C0, T
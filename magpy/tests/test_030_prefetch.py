@@ -0,0 +1,100 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import Prefetcher, displaced_hamiltonian
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_APT_prefetch_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-13,
+                      'd_convergence': 1e-13,
+                      'r_convergence': 1e-13})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    R_disp = 0.0005
+    F_disp = 0.0001
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    # Displaced Hamiltonians built on demand
+    apt = magpy.APT(mol)
+    dipder_ref = apt.compute('HF', R_disp, F_disp, e_conv=e_conv, r_conv=r_conv, prefetch=0)
+
+    # ERIs of the displaced Hamiltonians computed ahead in a helper process
+    apt = magpy.APT(mol)
+    dipder = apt.compute('HF', R_disp, F_disp, e_conv=e_conv, r_conv=r_conv, prefetch=2)
+    print(dipder)
+
+    assert(np.max(np.abs(dipder-dipder_ref)) < 1e-10)
+
+def test_Hessian_prefetch_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-13,
+                      'd_convergence': 1e-13,
+                      'r_convergence': 1e-13})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    disp = 0.001
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    hessian = magpy.Hessian(mol)
+    hess_ref = hessian.compute('HF', disp, e_conv=e_conv, r_conv=r_conv, prefetch=0)
+
+    hessian = magpy.Hessian(mol)
+    hess = hessian.compute('HF', disp, e_conv=e_conv, r_conv=r_conv, prefetch=1)
+    print(hess)
+
+    assert(np.max(np.abs(hess-hess_ref)) < 1e-10)
+
+def test_prefetch_helper_process_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk', 'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    tasks = [((), None, None),
+             ((), 'MAGNETIC-DIPOLE', (0.0, 0.0, 0.0001)),
+             (((0, 0.001),), None, None),
+             (((0, 0.001), (4, -0.001)), 'ELECTRIC-DIPOLE', (0.0001, 0.0, 0.0))]
+    hamiltonians = Prefetcher(mol, tasks, depth=2)
+    assert(hamiltonians.process.pid != os.getpid())
+    assert(hamiltonians.requested == 2)
+
+    H = [hamiltonians.get(task) for task in tasks]
+    assert(hamiltonians.received == 3) # one ERI array for the two tasks at the reference geometry
+    assert(H[1].ERI is H[0].ERI)
+    for task, H_task in zip(tasks, H):
+        H_ref = displaced_hamiltonian(mol, *task)
+        assert(np.max(np.abs(H_task.ERI - H_ref.ERI)) < 1e-14)
+        assert(np.max(np.abs(H_task.V - H_ref.V)) < 1e-14)
+
+    process = hamiltonians.process
+    hamiltonians.close()
+    assert(not process.is_alive())
+    with pytest.raises(Exception, match="out of order"):
+        hamiltonians.get(tasks[0])
+
+    # The helper is stopped on leaving a with block, also by an exception
+    with pytest.raises(Exception, match="out of order"):
+        with Prefetcher(mol, tasks, depth=3) as hamiltonians:
+            process = hamiltonians.process
+            H = hamiltonians.get(tasks[0])
+            assert(np.max(np.abs(H.ERI - displaced_hamiltonian(mol).ERI)) < 1e-14)
+            hamiltonians.get(tasks[2])
+    assert(not process.is_alive())
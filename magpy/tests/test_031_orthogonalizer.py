@@ -0,0 +1,56 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_orthogonalizer_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-13,
+                      'd_convergence': 1e-13,
+                      'r_convergence': 1e-13})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+    rhf_e, rhf_wfn = psi4.energy('SCF', return_wfn=True)
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    H = magpy.Hamiltonian(mol)
+    for X in [H.orthogonalizer('SYMMETRIC'), H.orthogonalizer('CANONICAL')]:
+        assert(np.max(np.abs(X.T @ H.S @ X - np.eye(X.shape[1]))) < 1e-12)
+
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, orthogonalizer='CANONICAL')
+    assert(abs(escf - rhf_e) < 1e-11)
+
+    # Field-perturbed Hamiltonians at the same geometry share the basis set and orthogonalizers
+    H_B = magpy.Hamiltonian(mol)
+    H_B.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+    assert(H_B.basisset is H.basisset)
+    assert(H_B.orthogonalizer('SYMMETRIC') is H.orthogonalizer('SYMMETRIC'))
+
+
+def test_geometry_cache_fresh_molecules():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk', 'basis': 'STO-3G'})
+
+    # Hamiltonians built directly on new (not yet updated) molecules get their own basis sets
+    H_h2o = magpy.Hamiltonian(psi4.geometry(moldict["H2O"]))
+    H_h2o2 = magpy.Hamiltonian(psi4.geometry(moldict["H2O2"]))
+    assert(H_h2o.molecule.natom() == 3)
+    assert(H_h2o2.molecule.natom() == 4)
+    assert(H_h2o2.basisset is not H_h2o.basisset)
+    assert(H_h2o.basisset.nbf() == 7)
+    assert(H_h2o2.basisset.nbf() == 12)
+    assert(H_h2o.orthogonalizer('SYMMETRIC').shape == (7, 7))
+    assert(H_h2o2.orthogonalizer('SYMMETRIC').shape == (12, 12))
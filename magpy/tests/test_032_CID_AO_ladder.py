@@ -0,0 +1,41 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_CID_AO_ladder_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    psi4.set_options({'freeze_core': 'true'})
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+    scf = magpy.hfwfn(H, 0, 1)
+    e_conv = 1e-13
+    r_conv = 1e-13
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, print_level=1)
+
+    # AO-direct ladder vs. MO-basis vvvv integrals
+    for ciwfn in [magpy.ciwfn, magpy.ciwfn_so]:
+        cid = ciwfn(scf, normalization='full', ladder='MO')
+        eci_ref, C0_ref, C2_ref = cid.solve(e_conv=e_conv, r_conv=r_conv, print_level=1)
+
+        cid = ciwfn(scf, normalization='full', ladder='AO')
+        assert('vvvv' not in cid.ERI)
+        eci, C0, C2 = cid.solve(e_conv=e_conv, r_conv=r_conv, print_level=1)
+
+        assert(abs(eci - eci_ref) < 1e-11)
+        assert(abs(C0 - C0_ref) < 1e-11)
+        assert(np.max(np.abs(C2 - C2_ref)) < 1e-11)
@@ -0,0 +1,48 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import shift_geom
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_SCF_guess_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-10
+    r_conv = 1e-10
+
+    H = magpy.Hamiltonian(mol)
+    scf0 = magpy.hfwfn(H)
+    scf0.solve(e_conv=e_conv, r_conv=r_conv)
+
+    # Displaced geometry (projection through the mixed-basis overlap) and applied field
+    H_R = magpy.Hamiltonian(shift_geom(mol, 2, 0.001))
+    H_B = magpy.Hamiltonian(mol)
+    H_B.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    for H in [H_R, H_B]:
+        scf = magpy.hfwfn(H)
+        escf_ref, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+        niter_ref = scf.niter
+
+        scf = magpy.hfwfn(H)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, guess=scf0)
+        assert(abs(escf - escf_ref) < 1e-9)
+        assert(scf.niter < niter_ref)
+
+        C_occ = scf0.C[:,:scf0.ndocc]
+        scf = magpy.hfwfn(H)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, guess_D=C_occ @ C_occ.T, guess_basis=scf0.H.basisset)
+        assert(abs(escf - escf_ref) < 1e-9)
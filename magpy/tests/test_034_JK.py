@@ -0,0 +1,50 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import JK
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_JK_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf = magpy.hfwfn(H)
+    escf_ref, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+
+    # J and K against the direct contractions
+    C_occ = C[:,:scf.ndocc]
+    D = C_occ @ C_occ.T.conj()
+    J, K = JK(H.ERI).jk(D)
+    assert(np.max(np.abs(J - np.einsum('ijkl,kl->ij', H.ERI, D))) < 1e-12)
+    assert(np.max(np.abs(K - np.einsum('ikjl,kl->ij', H.ERI, D))) < 1e-12)
+
+    # K from one row of the integrals at a time, for a real and a complex density
+    jk = JK(H.ERI, block_memory=1e-6)
+    assert(jk.block == 1)
+    for X in [D, D + 0.1j * (D @ H.S @ D)]:
+        J_b, K_b = jk.jk(X)
+        assert(np.max(np.abs(J_b - np.einsum('ijkl,kl->ij', H.ERI, X))) < 1e-12)
+        assert(np.max(np.abs(K_b - np.einsum('ikjl,kl->ij', H.ERI, X))) < 1e-12)
+
+    # Incremental Fock builds
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, incfock=True, incfock_rebuild=4)
+    assert(abs(escf - escf_ref) < 1e-11)
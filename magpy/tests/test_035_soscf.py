@@ -0,0 +1,37 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_SOSCF_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    # Real orbitals, then complex orbital rotations in a magnetic field
+    for strength in [np.array([0.0, 0.0, 0.0]), np.array([0.0, 0.0, 0.01])]:
+        H = magpy.Hamiltonian(mol)
+        H.add_field(field='magnetic-dipole', strength=strength)
+
+        scf = magpy.hfwfn(H)
+        escf_ref, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+        eps_ref = scf.eps
+
+        scf = magpy.hfwfn(H)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, soscf=True, soscf_start=1e-3)
+        assert(abs(escf - escf_ref) < 1e-11)
+        assert(np.max(np.abs(scf.eps - eps_ref)) < 1e-9)
@@ -0,0 +1,69 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_batch_SCF_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    # +/- magnetic fields along each axis
+    H_list = []
+    for B in range(3):
+        for sign in [1.0, -1.0]:
+            strength = np.zeros(3)
+            strength[B] = sign * 0.0001
+            H = magpy.Hamiltonian(mol)
+            H.add_field(field='magnetic-dipole', strength=strength)
+            H_list.append(H)
+
+    escf_ref = []
+    for H in H_list:
+        scf = magpy.hfwfn(H)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+        escf_ref.append(escf)
+
+    wfns = [magpy.hfwfn(H) for H in H_list]
+    results = magpy.hfwfn.solve_batch(wfns, e_conv=e_conv, r_conv=r_conv)
+    for (escf, C), E in zip(results, escf_ref):
+        assert(abs(escf - E) < 1e-11)
+
+def test_APT_batch_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-13,
+                      'd_convergence': 1e-13,
+                      'r_convergence': 1e-13})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    R_disp = 0.0005
+    F_disp = 0.0001
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    apt = magpy.APT(mol)
+    dipder_ref = apt.compute('HF', R_disp, F_disp, e_conv=e_conv, r_conv=r_conv)
+
+    apt = magpy.APT(mol)
+    dipder = apt.compute('HF', R_disp, F_disp, e_conv=e_conv, r_conv=r_conv, batch_scf=True)
+
+    assert(np.max(np.abs(dipder-dipder_ref)) < 1e-6)
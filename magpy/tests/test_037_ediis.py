@@ -0,0 +1,36 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_EDIIS_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+    rhf_e, rhf_wfn = psi4.energy('SCF', return_wfn=True)
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    H = magpy.Hamiltonian(mol)
+
+    # EDIIS/DIIS blend
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, ediis=True)
+    assert(abs(escf - rhf_e) < 1e-11)
+
+    # EDIIS alone until tight convergence
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, ediis=True, ediis_start=1e-8, ediis_stop=1e-9, maxiter=200)
+    assert(abs(escf - rhf_e) < 1e-11)
@@ -0,0 +1,55 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import DIIS
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_DIIS_ring_buffer():
+    # Incrementally updated B matrix vs. a full rebuild after the ring buffer wraps around
+    np.random.seed(0)
+    C = np.random.rand(6,4) + 1j * np.random.rand(6,4)
+    diis = DIIS(C, 3)
+    vecs = []
+    for n in range(5):
+        C = np.random.rand(6,4) + 1j * np.random.rand(6,4)
+        e = np.random.rand(6,4) + 1j * np.random.rand(6,4)
+        diis.add_error_vector(C, e)
+        vecs.append((n, C.ravel(), e.ravel()))
+    assert(diis.diis_size == 3)
+
+    for n, C, e in vecs[2:]:
+        assert(np.allclose(diis.diis_C[n % 3], C))
+        for m, C_m, e_m in vecs[2:]:
+            ref = np.dot(e.conj(), e_m) if n <= m else np.dot(e_m.conj(), e)
+            assert(abs(diis.B[n % 3, m % 3] - ref) < 1e-12)
+
+def test_DIIS_regularization_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    # Rescaling leaves the DIIS coefficients unchanged, and a small Tikhonov shift barely changes them
+    F = H.T + H.V
+    results = []
+    for kwargs in [{}, {'rescale': True}, {'regularization': 1e-12}]:
+        diis = DIIS(F, 8, **kwargs)
+        np.random.seed(0)
+        for n in range(4):
+            diis.add_error_vector(F + 0.01*n*np.random.rand(*F.shape), np.random.rand(*F.shape))
+        results.append(diis.extrapolate(F.copy()))
+    assert(np.max(np.abs(results[1] - results[0])) < 1e-10)
+    assert(np.max(np.abs(results[2] - results[0])) < 1e-6)
@@ -0,0 +1,40 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_DIIS_storage_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf = magpy.hfwfn(H)
+    escf_ref, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+    eci_ref = [ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv)[0] for ciwfn in [magpy.ciwfn, magpy.ciwfn_so]]
+
+    # Memory-mapped and single-precision DIIS subspaces
+    for storage, precision in [('DISK', 'DOUBLE'), ('MEMORY', 'SINGLE'), ('DISK', 'SINGLE')]:
+        scf = magpy.hfwfn(H)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv, diis_storage=storage, diis_precision=precision)
+        assert(abs(escf - escf_ref) < 1e-11)
+
+        for ciwfn, eci_r in zip([magpy.ciwfn, magpy.ciwfn_so], eci_ref):
+            eci, C0, C2 = ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv, diis_storage=storage, diis_precision=precision)
+            assert(abs(eci - eci_r) < 1e-11)
@@ -0,0 +1,50 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import mo_overlap, shift_geom
+import numpy as np
+import copy
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_match_phase_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf0 = magpy.hfwfn(magpy.Hamiltonian(mol))
+    scf0.solve(e_conv=e_conv, r_conv=r_conv)
+
+    # Phases of displaced orbitals against the original column-by-column loop
+    scf = magpy.hfwfn(magpy.Hamiltonian(shift_geom(mol, 2, 0.0001)))
+    scf.solve(e_conv=e_conv, r_conv=r_conv)
+    C = scf.C.copy()
+    S = mo_overlap(scf0.C, scf0.H.basisset, C, scf.H.basisset)
+    for p in range(C.shape[1]):
+        C[:, p] *= (S[p][p]/np.abs(S[p][p]))**(-1)
+    scf.match_phase(scf0)
+    assert(np.max(np.abs(scf.C - C)) < 1e-12)
+    assert(np.min(np.real(np.diag(mo_overlap(scf0.C, scf0.H.basisset, scf.C, scf.H.basisset)))) > 0)
+
+    # Procrustes alignment of an artificially mixed pair of (made) degenerate orbitals
+    scf = copy.copy(scf0)
+    scf.C = scf0.C.copy()
+    scf.eps = scf0.eps.copy()
+    scf.eps[3] = scf.eps[2]
+    theta = 0.4
+    U = np.array([[np.cos(theta), np.sin(theta)], [-np.sin(theta), np.cos(theta)]])
+    scf.C[:, 2:4] = scf.C[:, 2:4] @ U
+    scf.match_phase(scf0, degeneracy_tol=1e-6)
+    assert(np.max(np.abs(scf.C - scf0.C)) < 1e-12)
@@ -0,0 +1,39 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import auto_convergence
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_auto_convergence_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-13,
+                      'd_convergence': 1e-13,
+                      'r_convergence': 1e-13})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    # Central-difference error propagation
+    e_conv, r_conv = auto_convergence(1e-5, 1/(0.001*0.0001), variational=True)
+    assert(abs(e_conv - 1e-12) < 1e-20)
+    assert(abs(r_conv - 1e-6) < 1e-14)
+    assert(auto_convergence(1e-5, 1e10) == (1e-13, 1e-13))
+
+    R_disp = 0.001
+    F_disp = 0.0001
+    precision = 1e-5
+    for method in ['HF', 'CID']:
+        apt_ref = magpy.APT(mol).compute(method, R_disp, F_disp, e_conv=1e-13, r_conv=1e-13)
+        apt = magpy.APT(mol).compute(method, R_disp, F_disp, convergence='AUTO', precision=precision)
+        assert(np.max(np.abs(apt - apt_ref)) < precision)
+
+    hess_ref = magpy.Hessian(mol).compute('HF', R_disp, e_conv=1e-13, r_conv=1e-13)
+    hess = magpy.Hessian(mol).compute('HF', R_disp, convergence='AUTO', precision=precision)
+    assert(np.max(np.abs(hess - hess_ref)) < precision)
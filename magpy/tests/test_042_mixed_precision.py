@@ -0,0 +1,49 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_mixed_precision_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf = magpy.hfwfn(H)
+    escf_ref, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+    escf, C = magpy.hfwfn(H).solve(e_conv=e_conv, r_conv=r_conv, mixed_precision=True)
+    assert(abs(escf - escf_ref) < 1e-11)
+
+    # Single-precision early iterations, finished in double precision
+    for ciwfn in [magpy.ciwfn, magpy.ciwfn_so]:
+        for ladder in ['AO', 'MO']:
+            eci_ref, C0_ref, C2_ref = ciwfn(scf, ladder=ladder).solve(e_conv=e_conv, r_conv=r_conv)
+            eci, C0, C2 = ciwfn(scf, ladder=ladder).solve(e_conv=e_conv, r_conv=r_conv, mixed_precision=True)
+            assert(C2.dtype == C2_ref.dtype)
+            assert(abs(eci - eci_ref) < 1e-11)
+            assert(np.max(np.abs(C2 - C2_ref)) < 1e-10)
+
+    # A switch threshold that single precision cannot reach: double precision once the error stops improving
+    escf, C = magpy.hfwfn(H).solve(e_conv=e_conv, r_conv=r_conv, mixed_precision=True, precision_switch=1e-12)
+    assert(abs(escf - escf_ref) < 1e-11)
+    for ciwfn in [magpy.ciwfn, magpy.ciwfn_so]:
+        eci_ref, C0_ref, C2_ref = ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv)
+        eci, C0, C2 = ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv, mixed_precision=True, precision_switch=1e-12)
+        assert(abs(eci - eci_ref) < 1e-11)
+        assert(np.max(np.abs(C2 - C2_ref)) < 1e-10)
@@ -0,0 +1,47 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import MOIntegrals, mo_eri, so_eri
+import numpy as np
+import itertools
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_MO_integrals_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    # Real and complex orbitals
+    H = magpy.Hamiltonian(mol)
+    H_B = magpy.Hamiltonian(mol)
+    H_B.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    for H in [H, H_B]:
+        scf = magpy.hfwfn(H)
+        escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+        no = scf.ndocc
+        spaces = {'o': C[:,:no], 'v': C[:,no:], 'a': C}
+
+        # Every block, whether transformed, sliced, or obtained by permutational symmetry
+        mo = MOIntegrals(H.ERI, C, no)
+        for key in [''.join(key) for key in itertools.product('ova', repeat=4)]:
+            Cs = [spaces[s] for s in key]
+            assert(np.max(np.abs(mo.block(key) - mo_eri(H.ERI, *Cs))) < 1e-12)
+            assert(np.max(np.abs(mo.so_block(key) - so_eri(H.ERI, *Cs))) < 1e-12)
+
+        ERI = mo_eri(H.ERI, C, C, C, C)
+        L = 2.0 * ERI - ERI.swapaxes(2,3)
+        assert(np.max(np.abs(mo.L('ovvo') - L[:no,no:,no:,:no])) < 1e-12)
@@ -0,0 +1,47 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import mo_eri
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_packed_CID_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+
+    for ladder in ['AO', 'MO']:
+        cid = magpy.ciwfn(scf, ladder=ladder, normalization='intermediate')
+        eci, C0, C2 = cid.solve(e_conv=e_conv, r_conv=r_conv)
+
+        # The unpacked amplitudes have the pair symmetry and round-trip through the packed form
+        assert(np.max(np.abs(C2 - C2.swapaxes(0,1).swapaxes(2,3))) < 1e-14)
+        assert(np.max(np.abs(cid.unpack(cid.pack(C2)) - C2)) < 1e-14)
+
+        # Packed ladder against the unpacked MO-basis contraction
+        Cv = C[:,scf.ndocc:]
+        X = np.einsum('ijef,abef->ijab', C2, mo_eri(H.ERI, Cv, Cv, Cv, Cv))
+        assert(np.max(np.abs(cid.pp_ladder(cid.ERI, C2, cid.pack(C2)) - cid.pack(X))) < 1e-12)
+
+    # Spin-orbital CID energy
+    eci_so, C0, C2 = magpy.ciwfn_so(scf).solve(e_conv=e_conv, r_conv=r_conv)
+    assert(abs(eci - eci_so) < 1e-11)
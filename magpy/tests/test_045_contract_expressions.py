@@ -0,0 +1,52 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import JK
+from opt_einsum import contract
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_contract_expressions_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=1e-12, r_conv=1e-12)
+
+    # Precompiled J and K for single and stacked (complex) densities
+    jk = JK(H.ERI)
+    D = C[:,:scf.ndocc] @ C[:,:scf.ndocc].conj().T
+    for X in [D, np.array([D, D.conj()])]:
+        J, K = jk.jk(X)
+        assert(np.max(np.abs(J - contract('ijkl,...kl->...ij', H.ERI, X))) < 1e-13)
+        assert(np.max(np.abs(K - contract('ikjl,...kl->...ij', H.ERI, X))) < 1e-13)
+
+    # Spin-orbital residual against the explicit terms
+    cid = magpy.ciwfn_so(scf, ladder='MO')
+    eci, C0, C2 = cid.solve(e_conv=1e-10, r_conv=1e-10)
+    o = cid.o; v = cid.v; F = cid.F; ERI = cid.ERI
+    r2 = ERI['oovv'].conj().copy()
+    r2 += contract('ijae,be->ijab', C2, F[v,v]) - contract('ijbe,ae->ijab', C2, F[v,v])
+    r2 -= contract('imab,mj->ijab', C2, F[o,o]) - contract('jmab,mi->ijab', C2, F[o,o])
+    r2 += 0.5 * contract('mnab,mnij->ijab', C2, ERI['oooo'])
+    r2 += 0.5 * contract('ijef,abef->ijab', C2, ERI['vvvv'])
+    r2 += contract('mjeb,amie->ijab', C2, ERI['voov'])
+    r2 -= contract('mieb,amje->ijab', C2, ERI['voov'])
+    r2 -= contract('mjea,bmie->ijab', C2, ERI['voov'])
+    r2 += contract('miea,bmje->ijab', C2, ERI['voov'])
+    r2 -= eci*C2
+    assert(np.max(np.abs(cid.r_T2(o, v, eci, F, ERI, C2) - r2)) < 1e-13)
@@ -0,0 +1,40 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_davidson_CID_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf = magpy.hfwfn(H)
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+
+    for normalization in ['FULL', 'INTERMEDIATE']:
+        cid = magpy.ciwfn(scf, normalization=normalization)
+        eci_ref, C0_ref, C2_ref = cid.solve(e_conv=e_conv, r_conv=r_conv)
+
+        # Small subspace, to exercise the collapse
+        for max_space, collapse in [(16, 2), (4, 1), (4, 2)]:
+            eci, C0, C2 = cid.solve(e_conv=e_conv, r_conv=r_conv, solver='davidson', max_space=max_space, collapse=collapse)
+            assert(abs(eci - eci_ref) < 1e-11)
+            assert(abs(C0 - C0_ref) < 1e-10)
+            assert(np.max(np.abs(C2 - C2_ref)) < 1e-10)
@@ -0,0 +1,50 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import displaced_hamiltonian
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_warm_start_CID_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf0 = magpy.hfwfn(displaced_hamiltonian(mol))
+    scf0.solve(e_conv=e_conv, r_conv=r_conv)
+
+    for wfn in [magpy.ciwfn, magpy.ciwfn_so]:
+        ci0 = wfn(scf0)
+        ci0.solve(e_conv=e_conv, r_conv=r_conv)
+
+        # The guess from the same orbitals, with arbitrary phases, is the solution itself
+        scf = magpy.hfwfn(displaced_hamiltonian(mol))
+        scf.solve(e_conv=e_conv, r_conv=r_conv, guess=scf0)
+        scf.C = scf.C * np.exp(1j * np.linspace(0, 2*np.pi, scf.C.shape[1], endpoint=False))
+        ci = wfn(scf)
+        C2 = ci.guess_amplitudes(ci0)
+        eci, C0, C2_ref = ci.solve(e_conv=e_conv, r_conv=r_conv)
+        assert(np.max(np.abs(C2 - C2_ref/C0)) < 1e-10)
+
+        # Displaced geometry and magnetic field
+        for task in [(((2, 0.001),), None, None), ((), 'MAGNETIC-DIPOLE', (0.0, 0.0, 0.0001))]:
+            scf = magpy.hfwfn(displaced_hamiltonian(mol, *task))
+            scf.solve(e_conv=e_conv, r_conv=r_conv, guess=scf0)
+            ci = wfn(scf)
+            eci_ref, C0_ref, C2_ref = ci.solve(e_conv=e_conv, r_conv=r_conv)
+            eci, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv, guess=ci0)
+            assert(abs(eci - eci_ref) < 1e-11)
+            assert(np.max(np.abs(C2 - C2_ref)) < 1e-10)
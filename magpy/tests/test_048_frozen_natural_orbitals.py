@@ -0,0 +1,60 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import displaced_hamiltonian
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_FNO_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf0 = magpy.hfwfn(displaced_hamiltonian(mol))
+    scf0.solve(e_conv=e_conv, r_conv=r_conv)
+    nv = scf0.nmo - scf0.ndocc
+
+    mp = magpy.mpwfn(scf0)
+    emp2, C0, C2 = mp.solve()
+    eci, C0, C2 = magpy.ciwfn(scf0).solve(e_conv=e_conv, r_conv=r_conv)
+
+    # All natural virtual orbitals: the correlation energies are invariant
+    C_no, occ = mp.natural_virtuals(-1.0)
+    assert(C_no.shape[1] == nv)
+    assert(np.all(np.diff(occ) <= 0.0))
+
+    for task in [((), None, None), (((2, 0.001),), None, None)]:
+        scf = magpy.hfwfn(displaced_hamiltonian(mol, *task))
+        scf.solve(e_conv=e_conv, r_conv=r_conv, guess=scf0)
+        emp2_ref = magpy.mpwfn(scf).solve()[0]
+        eci_ref = magpy.ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv)[0]
+
+        scf.truncate_virtuals(C_no, scf0.H.basisset)
+        assert(scf.nmo == scf.ndocc + nv)
+        assert(np.max(np.abs(scf.C.conj().T @ scf.H.S @ scf.C - np.eye(scf.nmo))) < 1e-12)
+        assert(abs(magpy.mpwfn(scf).solve()[0] - emp2_ref) < 1e-11)
+        assert(abs(magpy.ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv)[0] - eci_ref) < 1e-11)
+
+    # Truncated virtual space
+    C_no, occ = mp.natural_virtuals(1e-3)
+    nno = np.count_nonzero(occ > 1e-3)
+    assert(0 < nno < nv)
+    scf0.truncate_virtuals(C_no)
+    assert(scf0.nmo == scf0.ndocc + nno)
+    ci = magpy.ciwfn(scf0)
+    eci_fno, C0, C2 = ci.solve(e_conv=e_conv, r_conv=r_conv)
+    assert(C2.shape[2] == nno)
+    assert(eci < eci_fno < 0.0)
@@ -0,0 +1,70 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import displaced_hamiltonian
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_PNO_CID_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    for field in [None, 'magnetic-dipole']:
+        H = magpy.Hamiltonian(mol)
+        if field is not None:
+            H.add_field(field=field, strength=np.array([0.0, 0.0, 0.0001]))
+
+        scf = magpy.hfwfn(H)
+        scf.solve(e_conv=e_conv, r_conv=r_conv)
+
+        # No truncation: the canonical CID wave function
+        eci, C0, C2 = magpy.ciwfn(scf).solve(e_conv=e_conv, r_conv=r_conv)
+        pno = magpy.pnociwfn(scf, pno_threshold=-1.0, pair_threshold=-1.0, cholesky_threshold=1e-12)
+        assert(np.max(np.abs(pno.U.conj().T @ pno.U - np.eye(pno.no))) < 1e-12)
+        eci_pno, C0_pno, C2_pno = pno.solve(e_conv=e_conv, r_conv=r_conv)
+        assert(abs(eci_pno - eci) < 1e-11)
+        assert(abs(C0_pno - C0) < 1e-11)
+        assert(np.max(np.abs(C2_pno - C2)) < 1e-10)
+
+    # Truncated pair and PNO spaces
+    pno = magpy.pnociwfn(scf, pno_threshold=1e-5, pair_threshold=1e-5)
+    eci_pno, C0, C2 = pno.solve(e_conv=e_conv, r_conv=r_conv)
+    assert(len(pno.pairs) <= pno.no*(pno.no+1)//2)
+    assert(max(Q.shape[1] for Q in pno.Q) < pno.nv)
+    assert(abs(eci_pno - eci) < 1e-3)
+
+    # All pairs dropped: the reference determinant alone
+    pno = magpy.pnociwfn(scf, pair_threshold=1.0)
+    assert(len(pno.pairs) == 0)
+    eci_pno, C0, C2 = pno.solve(e_conv=e_conv, r_conv=r_conv)
+    assert(eci_pno == 0.0 and C0 == 1.0)
+    assert(C2.shape == (pno.no, pno.no, pno.nv, pno.nv) and not np.any(C2))
+
+    # Reference spaces projected onto those of a displaced geometry
+    scf0 = magpy.hfwfn(displaced_hamiltonian(mol))
+    scf0.solve(e_conv=e_conv, r_conv=r_conv)
+    ref = magpy.pnociwfn(scf0, pno_threshold=1e-5, pair_threshold=1e-5)
+    eci0 = ref.solve(e_conv=e_conv, r_conv=r_conv)[0]
+
+    scf = magpy.hfwfn(displaced_hamiltonian(mol, ((2, 0.001),)))
+    scf.solve(e_conv=e_conv, r_conv=r_conv, guess=scf0)
+    pno = magpy.pnociwfn(scf, ref=ref)
+    assert(pno.pairs == ref.pairs)
+    assert([Q.shape[1] for Q in pno.Q] == [Q.shape[1] for Q in ref.Q])
+    eci_pno = pno.solve(e_conv=e_conv, r_conv=r_conv)[0]
+    assert(abs(pno.solve(e_conv=e_conv, r_conv=r_conv, guess=ref)[0] - eci_pno) < 1e-11)
+    assert(abs(eci_pno - eci0) < 1e-3)
@@ -0,0 +1,50 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_DF_MP2_H2O_CCPVDZ():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'cc-pVDZ',
+                      'df_basis_mp2': 'cc-pVDZ-RI',
+                      'mp2_type': 'df',
+                      'freeze_core': 'false'})
+    mol = psi4.geometry(moldict["H2O"])
+    psi4.energy('MP2')
+    c4mp2 = psi4.variable('MP2 CORRELATION ENERGY')
+
+    H = magpy.Hamiltonian(mol)
+    scf = magpy.hfwfn(H, 0, 1)
+    e_conv = 1e-13
+    r_conv = 1e-13
+    escf, C = scf.solve(e_conv=e_conv, r_conv=r_conv)
+
+    # Conventional amplitudes for comparison
+    emp2_conv, C0_conv, C2_conv = magpy.mpwfn(scf).solve(normalization='full')
+
+    # One batch of occupied pairs, or one occupied orbital per batch
+    for batch_memory in [500, 1e-6]:
+        mp2 = magpy.mpwfn(scf, mp2_type='DF', batch_memory=batch_memory)
+        with pytest.raises(Exception, match="before solve"):
+            mp2.C2
+        emp2, C0, C2 = mp2.solve(normalization='full', amplitudes=False)
+        assert(C2 is None)
+        assert(abs(emp2 - c4mp2) < 1e-10)
+        assert(abs(emp2 - emp2_conv) < 1e-3)
+
+        # Amplitudes built on first use
+        assert(mp2.C2.shape == C2_conv.shape)
+        assert(np.max(np.abs(mp2.C2 - C2_conv)) < 1e-2)
+        assert(abs(mp2.C0 - C0) < 1e-14)
+    assert(mp2.batch_size == 1)
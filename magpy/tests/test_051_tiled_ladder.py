@@ -0,0 +1,46 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_tiled_ladder_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    H = magpy.Hamiltonian(mol)
+    H.add_field(field='magnetic-dipole', strength=np.array([0.0, 0.0, 0.0001]))
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    scf = magpy.hfwfn(H)
+    scf.solve(e_conv=e_conv, r_conv=r_conv)
+
+    eci_ao, C0, C2 = magpy.ciwfn(scf, ladder='AO').solve(e_conv=e_conv, r_conv=r_conv)
+
+    # A single tile, and one block of a per tile, in memory and memory-mapped to scratch files
+    cid = magpy.ciwfn(scf, ladder='MO')
+    assert(len(cid.ladder_tiles) == 1)
+    T = cid.pack(C2)
+    r2 = cid.r_T2(cid.o, cid.v, eci_ao, cid.F, cid.ERI, cid.L, C2, T)
+    for storage in ['MEMORY', 'DISK']:
+        tiled = magpy.ciwfn(scf, ladder='MO', ladder_memory=1e-6, ladder_storage=storage)
+        assert(len(tiled.ladder_tiles) == tiled.nv)
+        assert(isinstance(tiled.ERI['vvvv+'], np.memmap) == (storage == 'DISK'))
+        assert(np.max(np.abs(tiled.r_T2(tiled.o, tiled.v, eci_ao, tiled.F, tiled.ERI, tiled.L, C2, T) - r2)) < 1e-14)
+
+        eci, C0, C2_tiled = tiled.solve(e_conv=e_conv, r_conv=r_conv)
+        assert(abs(eci - eci_ao) < 1e-12)
+        assert(np.max(np.abs(C2_tiled - C2)) < 1e-12)
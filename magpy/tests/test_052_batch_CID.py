@@ -0,0 +1,73 @@
+import psi4
+import magpy
+import pytest
+from ..data.molecules import *
+from ..utils import displaced_hamiltonian
+import numpy as np
+import os
+
+np.set_printoptions(precision=10, linewidth=200, threshold=200, suppress=True)
+
+def test_batch_CID_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    # Magnetic-field displacements and the (real) unperturbed wave function in one batch
+    scf0 = magpy.hfwfn(displaced_hamiltonian(mol))
+    scf0.solve(e_conv=e_conv, r_conv=r_conv)
+    scfs = [scf0]
+    for B in range(3):
+        for disp in [0.0001, -0.0001]:
+            scf = magpy.hfwfn(displaced_hamiltonian(mol, field='MAGNETIC-DIPOLE', strength=np.eye(3)[B]*disp))
+            scf.solve(e_conv=e_conv, r_conv=r_conv, guess=scf0)
+            scfs.append(scf)
+
+    ci0 = magpy.ciwfn(scf0)
+    ci0.solve(e_conv=e_conv, r_conv=r_conv)
+
+    for ladder in ['AO', 'MO']:
+        for guess in [None, ci0]:
+            cis = [magpy.ciwfn(scf, ladder=ladder) for scf in scfs]
+            results = magpy.ciwfn.solve_batch(cis, e_conv=e_conv, r_conv=r_conv, guess=guess)
+            for scf, ci, (eci, C0, C2) in zip(scfs, cis, results):
+                eci_ref, C0_ref, C2_ref = magpy.ciwfn(scf, ladder=ladder).solve(e_conv=e_conv, r_conv=r_conv, guess=guess)
+                assert(ci.C2 is C2)
+                assert(np.iscomplexobj(C2) == np.iscomplexobj(C2_ref))
+                assert(abs(eci - eci_ref) < 1e-12)
+                assert(abs(C0 - C0_ref) < 1e-12)
+                assert(np.max(np.abs(C2 - C2_ref)) < 1e-12)
+
+
+def test_batch_CID_AAT_H2O_STO3G():
+    psi4.core.clean_options()
+    psi4.set_memory('2 GB')
+    psi4.set_output_file('output.dat', False)
+    psi4.set_options({'scf_type': 'pk',
+                      'e_convergence': 1e-12,
+                      'd_convergence': 1e-12,
+                      'r_convergence': 1e-12})
+
+    psi4.set_options({'basis': 'STO-3G'})
+    mol = psi4.geometry(moldict["H2O"])
+
+    r_disp = 0.0001
+    b_disp = 0.0001
+    e_conv = 1e-12
+    r_conv = 1e-12
+
+    AAT = magpy.AAT(mol, 0, 1)
+    ref = AAT.compute('CID', r_disp, b_disp, e_conv=e_conv, r_conv=r_conv)
+    batch = AAT.compute('CID', r_disp, b_disp, e_conv=e_conv, r_conv=r_conv, batch_ci=True)
+    for I_ref, I in zip(ref, batch):
+        assert(np.max(np.abs(I - I_ref)) < 1e-8)
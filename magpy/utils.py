@@ -1,10 +1,16 @@
 import psi4
 import numpy as np
 from itertools import permutations
-from opt_einsum import contract
+from opt_einsum import contract, contract_expression
 import re
 from ast import literal_eval
 from multiprocessing import Pool
+import multiprocessing
+import threading
+import queue
+import tempfile
+import scipy.optimize
+from .hamiltonian import Hamiltonian, ao_overlap
 
 def levi(indexes):
     """
@@ -61,6 +67,59 @@ def shift_geom(molecule, R, R_disp):
 
     return this_mol
 
+def displaced_hamiltonian(molecule, shifts=(), field=None, strength=None, ERI=None):
+    """
+    Build the Hamiltonian for a (possibly) displaced geometry in a (possibly) applied external field
+
+    Parameters
+    ----------
+    molecule: Psi4 Molecule object at the reference geometry
+    shifts: sequence of (R, R_disp) Cartesian displacements, applied in order using shift_geom()
+    field: external field type passed to Hamiltonian.add_field(), or None for no field
+    strength: length-3 sequence of field strengths
+    ERI: AO-basis two-electron integrals at the displaced geometry, or None to compute them
+
+    Returns
+    -------
+    H: MagPy Hamiltonian object
+    """
+    for R, R_disp in shifts:
+        molecule = shift_geom(molecule, R, R_disp)
+
+    H = Hamiltonian(molecule, ERI)
+    if field is not None:
+        H.add_field(field=field, strength=np.array(strength, dtype='float64'))
+
+    return H
+
+def auto_convergence(precision, weight, variational=False, floor=1e-13):
+    """
+    Derive SCF/CI convergence thresholds from the target precision of a finite-difference tensor element
+
+    A finite-difference formula sum_k c_k f(x_k) amplifies independent errors |df| in each f(x_k) by at
+    most weight = sum_k |c_k| (e.g., 1/(R_disp F_disp) for a dipole derivative from central differences
+    of energies in fields), so each displaced quantity must be converged to precision/weight.  For
+    variational (SCF) energies the energy error is quadratic in the error of the wave function, so the
+    residual threshold may be taken as the square root of the energy threshold.
+
+    Parameters
+    ----------
+    precision: target absolute precision of each tensor element
+    weight: sum of the absolute values of the finite-difference coefficients
+    variational: if True, the tensor is computed from energies that are stationary in the wave function
+    floor: smallest threshold returned, below which the iterations cannot converge in double precision
+
+    Returns
+    -------
+    e_conv: energy convergence threshold
+    r_conv: residual convergence threshold
+    """
+    tol = precision/weight
+    e_conv = max(tol, floor)
+    r_conv = max(np.sqrt(tol) if variational else tol, floor)
+
+    return e_conv, r_conv
+
 def mo_overlap(bra, bra_basis, ket, ket_basis):
     """
     Compute the MO overlap matrix between two (possibly different) basis sets
@@ -81,25 +140,751 @@ def mo_overlap(bra, bra_basis, ket, ket_basis):
         raise Exception("Bra and Ket States do not have the same dimensions: (%d,%d) vs. (%d,%d)." % 
                 (bra.shape[0], bra.shape[1], ket.shape[0], ket.shape[1]))
 
-    # Get AO-basis overlap integrals
-    mints = psi4.core.MintsHelper(bra_basis)
-    if bra_basis == ket_basis:
-        S_ao = mints.ao_overlap().np
-    else:
-        S_ao = mints.ao_overlap(bra_basis, ket_basis).np
+    # Get (cached) AO-basis overlap integrals
+    S_ao = ao_overlap(bra_basis, ket_basis)
 
     # Transform to MO basis
     S = bra.T @ S_ao @ ket
 
     return S
 
+def split_contract(subscripts, A, B):
+    """
+    Contract a real tensor with a (possibly complex) tensor using only real arithmetic
+
+    Mixed real/complex contractions are otherwise promoted to complex, which makes a complex
+    copy of the real operand (typically the AO-basis ERIs) and runs a complex GEMM.  Here the
+    real and imaginary parts of the complex operand are contracted separately with the real one.
+
+    Parameters
+    ----------
+    subscripts: opt_einsum subscript string for the contraction of A and B
+    A: first operand (NumPy array)
+    B: second operand (NumPy array)
+
+    Returns
+    -------
+    The contracted tensor (NumPy array), complex if either operand is complex
+    """
+    if np.iscomplexobj(A) and np.iscomplexobj(B):
+        return contract(subscripts, A, B)
+    elif np.iscomplexobj(B):
+        return contract(subscripts, A, B.real) + 1j * contract(subscripts, A, B.imag)
+    elif np.iscomplexobj(A):
+        return contract(subscripts, A.real, B) + 1j * contract(subscripts, A.imag, B)
+    else:
+        return contract(subscripts, A, B)
+
+
+def batch_contract(subscripts, A, B):
+    """
+    Contract two tensors that share a leading batch index with one batched matrix multiplication
+
+    The remaining indices of each operand are transposed into (kept, summed) and (summed, kept)
+    groups and flattened, so that the contraction for every member of the batch is a single
+    np.matmul call, rather than the einsum fallback otherwise used for indices kept on both operands.
+
+    Parameters
+    ----------
+    subscripts: subscript string for the contraction of A and B, with the batch index first in both
+        operands and in the result (e.g., 'xijae,xbe->xijab')
+    A: first operand (NumPy array)
+    B: second operand (NumPy array)
+
+    Returns
+    -------
+    The contracted tensor (NumPy array)
+    """
+    inputs, out = subscripts.replace(' ', '').split('->')
+    a, b = inputs.split(',')
+    if not (a[0] == b[0] == out[0]):
+        raise Exception(f"{subscripts:s} does not have a common leading batch index.")
+    summed = [c for c in a[1:] if c in b and c not in out]
+    left = [c for c in a[1:] if c not in summed]
+    right = [c for c in b[1:] if c not in summed]
+    if set(left) & set(right) or sorted(left + right) != sorted(out[1:]):
+        raise Exception(f"{subscripts:s} is not a batched matrix product.")
+
+    dims = dict(zip(a, A.shape))
+    dims.update(zip(b, B.shape))
+    M = int(np.prod([dims[c] for c in left]))
+    K = int(np.prod([dims[c] for c in summed]))
+    N = int(np.prod([dims[c] for c in right]))
+
+    A = A.transpose([0] + [a.index(c) for c in left + summed]).reshape(-1, M, K)
+    B = B.transpose([0] + [b.index(c) for c in summed + right]).reshape(-1, K, N)
+    X = np.matmul(A, B).reshape([-1] + [dims[c] for c in left + right])
+
+    return X.transpose([0] + [(left + right).index(c) + 1 for c in out[1:]])
+
+
+def single_precision(X):
+    """
+    Convert an array, or a dict of arrays, to single precision (float32 or complex64)
+
+    A memory-mapped array is copied to a new memory-mapped array in a scratch file, so that it is
+    not loaded into memory.
+
+    Parameters
+    ----------
+    X: NumPy array or dict of NumPy arrays
+
+    Returns
+    -------
+    X: single-precision copy of X (NumPy array or dict of NumPy arrays)
+    """
+    if isinstance(X, dict):
+        return {key: single_precision(value) for key, value in X.items()}
+
+    dtype = np.complex64 if np.iscomplexobj(X) else np.float32
+    if isinstance(X, np.memmap):
+        Y = np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+', shape=X.shape)
+        for k in range(X.shape[0]):
+            Y[k] = X[k]
+        return Y
+
+    return X.astype(dtype)
+
+def double_precision(X):
+    """
+    Convert an array to double precision (float64 or complex128)
+
+    Parameters
+    ----------
+    X: NumPy array
+
+    Returns
+    -------
+    X: double-precision copy of X (NumPy array)
+    """
+    return X.astype(np.complex128 if np.iscomplexobj(X) else np.float64)
+
+
+class PrecisionSwitch(object):
+    """
+    Test for the end of the single-precision iterations of a mixed-precision solver
+
+    The switch to double precision is made when the error falls below the threshold, or when it has
+    not improved on its smallest single-precision value for a number of iterations, since single-
+    precision round-off may keep it from ever reaching the threshold.
+    """
+    def __init__(self, threshold, patience=3):
+        """
+        Parameters
+        ----------
+        threshold: error below which double precision is used
+        patience: number of iterations without improvement after which double precision is used
+        """
+        self.threshold = threshold
+        self.patience = patience
+        self.best = np.inf
+        self.stalled = 0
+
+    def __call__(self, error):
+        """
+        Return True if the iterations should continue in double precision.
+
+        Parameters
+        ----------
+        error: error (e.g., RMS residual) of the current single-precision iteration
+        """
+        if error < self.best:
+            self.best = error
+            self.stalled = 0
+        else:
+            self.stalled += 1
+
+        return error < self.threshold or self.stalled >= self.patience
+
+
+def mo_eri(ERI, C1, C2, C3, C4):
+    """
+    Transform a block of the AO-basis electron repulsion integrals to the MO basis
+
+    Parameters
+    ----------
+    ERI: AO-basis two-electron integrals in chemist's notation, (pr|qs) (NumPy array)
+    C1, C2, C3, C4: MO coefficients (NumPy arrays) for the four indices of the MO block
+
+    Returns
+    -------
+    ERI: MO-basis two-electron integrals <pq|rs> in Dirac ordering for p, q, r, s in C1, C2, C3, C4 (NumPy array)
+    """
+    ERI = split_contract('pqrs,sl->pqrl', ERI, C4)
+    ERI = contract('pqrl,rk->pqkl', ERI, C2.conj())
+    ERI = contract('pqkl,qj->pjkl', ERI, C3)
+    ERI = contract('pjkl,pi->ijkl', ERI, C1.conj())
+
+    return ERI.swapaxes(1,2)
+
+def spin_block(X):
+    """
+    Expand spatial-orbital integrals <pq|rs> to spin orbitals, <pq|rs> delta(spin p, spin r) delta(spin q, spin s)
+
+    Spin orbitals are ordered alpha, beta, alpha, beta, ... for successive spatial orbitals.
+
+    Parameters
+    ----------
+    X: spatial-orbital integrals <pq|rs> in Dirac ordering (NumPy array)
+
+    Returns
+    -------
+    X: spin-orbital integrals, with each dimension doubled (NumPy array)
+    """
+    M = contract('pr,qs->pqrs', np.eye(2), np.eye(2))
+    n1, n2, n3, n4 = X.shape
+    return (X[:,None,:,None,:,None,:,None] * M[None,:,None,:,None,:,None,:]).reshape(2*n1, 2*n2, 2*n3, 2*n4)
+
+def so_eri(ERI, C1, C2, C3, C4):
+    """
+    Transform a block of the AO-basis electron repulsion integrals to antisymmetrized spin-orbital form
+
+    Spin orbitals are ordered alpha, beta, alpha, beta, ... for successive spatial orbitals.
+
+    Parameters
+    ----------
+    ERI: AO-basis two-electron integrals in chemist's notation, (pr|qs) (NumPy array)
+    C1, C2, C3, C4: spatial MO coefficients (NumPy arrays) for the four indices of the MO block
+
+    Returns
+    -------
+    ERI: spin-orbital integrals <pq||rs> for p, q, r, s in C1, C2, C3, C4 (NumPy array)
+    """
+    direct = mo_eri(ERI, C1, C2, C3, C4)
+    if C3 is C4:
+        exchange = direct
+    else:
+        exchange = mo_eri(ERI, C1, C2, C4, C3)
+
+    return spin_block(direct) - spin_block(exchange).swapaxes(2,3)
+
+def pair_index(n):
+    """
+    Index of each pair (p,q) in the packed (p <= q) pairs of np.triu_indices(n), and the sign of its antisymmetric part
+
+    Parameters
+    ----------
+    n: number of orbitals
+
+    Returns
+    -------
+    P: packed index of (min(p,q), max(p,q)) for each p and q (NumPy integer array)
+    S: +1 for p <= q and -1 for p > q (NumPy int8 array)
+    """
+    P = np.zeros((n, n), dtype=int)
+    P[np.triu_indices(n)] = np.arange(n*(n+1)//2)
+    P = P + P.T - np.diag(np.diag(P))
+    S = np.where(np.arange(n).reshape(-1,1) <= np.arange(n), 1, -1).astype(np.int8)
+
+    return P, S
+
+class MOIntegrals(object):
+    """
+    Block-selective AO->MO transformation of the two-electron integrals.
+
+    Blocks <pq|rs> are requested by the orbital spaces of their indices, e.g., 'oovv', with 'o', 'v',
+    and 'a' for the occupied, virtual, and all (active) orbitals.  Only the requested blocks are
+    transformed, the first half-transformation is cached and shared among blocks, and a block that
+    follows from one already built, by slicing or by the permutational symmetries
+
+        <pq|rs> = <qp|sr> = <rs|pq>^*   (and <pq|rs> = <rq|ps> = <ps|rq> for real orbitals),
+
+    is returned as a view (or conjugate) of it rather than transformed again.
+    """
+    def __init__(self, ERI, C, no):
+        """
+        Constructor for the MO integral engine.
+
+        Parameters
+        ----------
+        ERI: AO-basis two-electron integrals in chemist's notation, (pq|rs) (NumPy array)
+        C: active MO coefficients, occupied orbitals first (NumPy array)
+        no: number of active occupied orbitals
+
+        Returns
+        -------
+        MOIntegrals object
+        """
+        self.ERI = ERI
+        self.C = {'o': C[:,:no], 'v': C[:,no:], 'a': C}
+        self.no = no
+        self.real = not np.iscomplexobj(C)
+
+        self.half = {} # Half-transformed integrals, keyed by the spaces of the transformed (bra, ket) pair
+        self.blocks = {} # <pq|rs>
+        self.so_blocks = {} # <pq||rs> in spin orbitals
+        self.L_blocks = {} # 2 <pq|rs> - <pq|sr>
+
+    def half_transform(self, s1, s2):
+        """
+        First half-transformation, (ij|ls) = sum_mn C1[m,i]^* C2[n,j] (mn|ls), for one pair of indices
+
+        Parameters
+        ----------
+        s1, s2: orbital spaces of the transformed pair
+
+        Returns
+        -------
+        X: half-transformed integrals (NumPy array)
+        """
+        if (s1, s2) not in self.half:
+            X = split_contract('mnls,nj->mjls', self.ERI, self.C[s2])
+            self.half[(s1, s2)] = contract('mjls,mi->ijls', X, self.C[s1].conj())
+        return self.half[(s1, s2)]
+
+    def find(self, key, blocks, n):
+        """
+        Look for the requested block among those already built, using slicing and the permutational symmetries
+
+        Parameters
+        ----------
+        key: orbital spaces of the requested block
+        blocks: dict of blocks already built
+        n: number of (spin) orbitals per spatial orbital, 1 or 2
+
+        Returns
+        -------
+        X: the requested block (NumPy array), or None if it does not follow from those in blocks
+        """
+        # (axes, conjugate): block[key] = stored.transpose(axes) (conjugated), with stored key[axes[t]] at position t
+        symmetries = [((0,1,2,3), False), ((1,0,3,2), False), ((2,3,0,1), True), ((3,2,1,0), True)]
+        if self.real:
+            symmetries += [((2,1,0,3), False), ((0,3,2,1), False)]
+
+        no = n*self.no
+        subspace = {'o': slice(0, no), 'v': slice(no, None)}
+        for axes, conjugate in symmetries:
+            want = ''.join(key[t] for t in axes)
+            for have, X in blocks.items():
+                if all(h == w or h == 'a' for h, w in zip(have, want)):
+                    slices = tuple(slice(None) if h == w else subspace[w] for h, w in zip(have, want))
+                    X = X[slices].transpose(axes)
+                    return X.conj() if conjugate and not self.real else X
+
+        return None
+
+    def block(self, key):
+        """
+        MO-basis integrals <pq|rs> in Dirac ordering for the given orbital spaces
+
+        Parameters
+        ----------
+        key: orbital spaces of p, q, r, s, e.g., 'oovv'
+
+        Returns
+        -------
+        ERI: MO-basis two-electron integrals (NumPy array)
+        """
+        X = self.find(key, self.blocks, 1)
+        if X is not None:
+            return X
+
+        # <pq|rs> = (pr|qs): start from a cached half-transformation if there is one, else from the smaller pair
+        p, q, r, s = key
+        dim = {t: self.C[t].shape[1] for t in 'ova'}
+        if (p, r) in self.half or ((q, s) not in self.half and dim[p]*dim[r] <= dim[q]*dim[s]):
+            X = contract('ikls,lj,sm->ijkm', self.half_transform(p, r), self.C[q].conj(), self.C[s])
+        else:
+            X = contract('jmls,li,sk->ijkm', self.half_transform(q, s), self.C[p].conj(), self.C[r])
+
+        self.blocks[key] = X
+        return X
+
+    def L(self, key):
+        """
+        Spin-adapted integrals L = 2 <pq|rs> - <pq|sr>
+
+        Parameters
+        ----------
+        key: orbital spaces of p, q, r, s
+
+        Returns
+        -------
+        L: spin-adapted MO-basis integrals (NumPy array)
+        """
+        if key not in self.L_blocks:
+            self.L_blocks[key] = 2.0 * self.block(key) - self.block(key[:2] + key[3] + key[2]).swapaxes(2,3)
+        return self.L_blocks[key]
+
+    def so_block(self, key):
+        """
+        Antisymmetrized spin-orbital integrals <pq||rs> (spin orbitals alpha, beta, alpha, beta, ...)
+
+        Parameters
+        ----------
+        key: orbital spaces of p, q, r, s
+
+        Returns
+        -------
+        ERI: spin-orbital integrals (NumPy array)
+        """
+        X = self.find(key, self.so_blocks, 2)
+        if X is not None:
+            return X
+
+        direct = spin_block(self.block(key))
+        if key[2] == key[3]:
+            X = direct - direct.swapaxes(2,3)
+        else:
+            X = direct - spin_block(self.block(key[:2] + key[3] + key[2])).swapaxes(2,3)
+
+        self.so_blocks[key] = X
+        return X
+
+
+def ao_ladder(ERI, C2, Cv):
+    """
+    Compute the particle-particle ladder contraction sum_ef C2[...,e,f] <ab|ef> in the AO basis
+
+    The amplitudes are back-transformed to the AO basis, contracted with the AO-basis two-electron integrals,
+    and transformed back to the MO basis, so the MO-basis vvvv integrals are never built.
+
+    Parameters
+    ----------
+    ERI: AO-basis two-electron integrals in chemist's notation, (pr|qs) (NumPy array)
+    C2: amplitudes with two trailing virtual indices (NumPy array)
+    Cv: virtual MO coefficients (NumPy array)
+
+    Returns
+    -------
+    r2: the contracted amplitudes, with the same shape as C2 (NumPy array)
+    """
+    # Work in the precision of the amplitudes
+    if C2.dtype in (np.float32, np.complex64):
+        Cv = single_precision(Cv)
+
+    T = contract('...ef,le,sf->...ls', C2, Cv, Cv)
+    Z = split_contract('mlns,...ls->...mn', ERI, T)
+    return contract('...mn,ma,nb->...ab', Z, Cv.conj(), Cv.conj())
+
+
+def _eri_sender(conn, results):
+    """
+    Sender thread of the helper process of Prefetcher: send the results queued by _eri_worker() to
+    the calling process, until the pipe is closed
+    """
+    while True:
+        result = results.get()
+        try:
+            if isinstance(result, str):
+                conn.send(result)
+            else:
+                conn.send((result.shape, result.dtype.str))
+                conn.send_bytes(result.reshape(-1).view(np.uint8))
+        except OSError: # the calling process closed the pipeline
+            break
+
+
+def _eri_worker(conn, atoms, options, memory, depth):
+    """
+    Helper process of Prefetcher: compute the AO-basis ERIs for each geometry received on conn
+    and send them back, until None is received
+
+    The integrals are sent by a separate thread from a queue of up to depth finished arrays, so that
+    the next geometry is computed while the caller has yet to receive the last one.
+
+    Parameters
+    ----------
+    conn: multiprocessing Connection to the calling process
+    atoms: (element symbols, nuclear charges, molecular charge, multiplicity) of the molecule
+    options: dict of the Psi4 options that determine the basis set and integrals
+    memory: Psi4 memory (bytes)
+    depth: maximum number of finished ERI arrays held for the caller (integer)
+    """
+    psi4.core.be_quiet()
+    psi4.set_memory(memory)
+    psi4.set_options(options)
+    elem, elez, charge, multiplicity = atoms
+
+    results = queue.Queue(maxsize=depth)
+    sender = threading.Thread(target=_eri_sender, args=(conn, results), daemon=True)
+    sender.start()
+
+    while True:
+        try:
+            geom = conn.recv()
+        except EOFError: # the calling process closed the pipeline
+            break
+        if geom is None:
+            break
+
+        try:
+            molecule = psi4.core.Molecule.from_arrays(geom=geom, elem=elem, elez=elez, units='Bohr',
+                    fix_com=True, fix_orientation=True, fix_symmetry='c1',
+                    molecular_charge=charge, molecular_multiplicity=multiplicity)
+            molecule.update_geometry()
+            results.put(np.ascontiguousarray(psi4.core.MintsHelper(psi4.core.BasisSet.build(molecule)).ao_eri().np))
+        except Exception as err:
+            results.put(f"{type(err).__name__}: {err}")
+
+    # The caller no longer reads the results, so any still queued are dropped with the (daemon) sender
+    conn.close()
+
+
+class Prefetcher(object):
+    """
+    Pipeline that builds the displaced Hamiltonians (see displaced_hamiltonian()) for an ordered
+    list of tasks, with their AO-basis ERIs computed ahead of their use.
+
+    The ERIs, which dominate the cost of each Hamiltonian, are computed by Psi4 in a helper process,
+    so that they overlap with the work of the caller (rather than being serialized with it by the
+    GIL) and Psi4 is never called from two threads of one process.  The helper is sent the atoms,
+    the basis-set options, and the Cartesian geometry of each displacement, and returns the integrals
+    through a pipe; the basis set and one-electron integrals are built in the calling process.
+    Consecutive tasks at the same geometry (e.g., field displacements) share one ERI array, and the
+    ERIs of at most depth geometries are requested ahead of their use; the helper holds those it has
+    finished until they are received, so up to depth geometries are computed ahead.  With depth = 0
+    each Hamiltonian is built in the calling process when it is requested.
+
+    Basis sets defined in the calling process (e.g., by psi4.basis_helper()) are not available
+    to the helper, which builds the basis set from the BASIS and PUREAM options.
+
+    The helper is started with the 'spawn' method of multiprocessing, which imports the main module
+    of the calling process again in the helper.  A script that uses a Prefetcher with depth > 0
+    (e.g., through the prefetch option of AAT, APT, or Hessian) must therefore guard its top-level
+    code with if __name__ == "__main__":, or the helper fails as it starts.
+
+    The helper is stopped by close(), or on leaving a with block:
+
+        with Prefetcher(molecule, tasks, depth) as hamiltonians:
+            H = hamiltonians.get(tasks[0])
+    """
+    options = ['BASIS', 'PUREAM', 'INTS_TOLERANCE']
+
+    def __init__(self, molecule, tasks, depth=1):
+        """
+        Constructor for the prefetch pipeline.
+
+        Parameters
+        ----------
+        molecule: Psi4 Molecule object at the reference geometry
+        tasks: list of tasks, (shifts, field, strength) arguments of displaced_hamiltonian(), in the
+            order in which they will be requested
+        depth: maximum number of geometries whose ERIs are requested ahead of their use (integer)
+
+        Returns
+        -------
+        Prefetcher object
+        """
+        self.molecule = molecule
+        self.tasks = list(tasks)
+        self.depth = depth
+        self.next = 0 # Index of the next task to be requested
+        self.ERI = None # (shifts, ERI) of the last geometry received
+        self.process = None
+
+        if self.depth > 0:
+            # Distinct geometries in the order they are needed
+            self.geometries = []
+            for shifts, field, strength in self.tasks:
+                if len(self.geometries) == 0 or self.geometries[-1] != shifts:
+                    self.geometries.append(shifts)
+            self.requested = 0
+            self.received = 0
+
+            molecule.update_geometry()
+            atoms = ([molecule.symbol(i) for i in range(molecule.natom())], [molecule.Z(i) for i in range(molecule.natom())],
+                     molecule.molecular_charge(), molecule.multiplicity())
+            options = {name: psi4.core.get_global_option(name) for name in self.options if psi4.core.has_global_option_changed(name)}
+
+            context = multiprocessing.get_context('spawn')
+            self.conn, child = context.Pipe()
+            self.process = context.Process(target=_eri_worker, args=(child, atoms, options, psi4.get_memory(), self.depth), daemon=True)
+            self.process.start()
+            child.close()
+            self._request()
+
+    def _request(self):
+        """
+        Send the geometries of the next tasks to the helper process, up to depth ahead of those received
+        """
+        while self.requested < min(self.received + self.depth, len(self.geometries)):
+            molecule = self.molecule
+            for R, R_disp in self.geometries[self.requested]:
+                molecule = shift_geom(molecule, R, R_disp)
+            molecule.update_geometry()
+            self.conn.send(np.array(molecule.geometry().np))
+            self.requested += 1
+
+    def _receive(self):
+        """
+        Receive the ERIs of the next geometry from the helper process
+        """
+        try:
+            message = self.conn.recv()
+        except (EOFError, OSError):
+            self.close()
+            raise Exception("Helper process for the ERIs exited unexpectedly (a script that uses prefetching "
+                            "must guard its top-level code with if __name__ == \"__main__\":).")
+        if isinstance(message, str):
+            self.close()
+            raise Exception(f"Helper process failed to compute the ERIs: {message:s}")
+        shape, dtype = message
+        ERI = np.empty(shape, dtype=dtype)
+        self.conn.recv_bytes_into(ERI.reshape(-1).view(np.uint8))
+        self.received += 1
+        self._request()
+
+        return ERI
+
+    def get(self, task):
+        """
+        Return the Hamiltonian built for the next task.
+
+        Parameters
+        ----------
+        task: the task being requested, which must be the next one in the list given to the constructor
+
+        Returns
+        -------
+        H: MagPy Hamiltonian object
+        """
+        if self.next >= len(self.tasks) or task != self.tasks[self.next]:
+            raise Exception(f"Task {task} was requested out of order from the prefetch pipeline.")
+        self.next += 1
+
+        if self.depth == 0:
+            return displaced_hamiltonian(self.molecule, *task)
+
+        shifts, field, strength = task
+        if self.ERI is None or self.ERI[0] != shifts:
+            self.ERI = (shifts, self._receive())
+
+        return displaced_hamiltonian(self.molecule, shifts, field, strength, ERI=self.ERI[1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop the helper process and release any integrals computed but not yet requested.
+        """
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+        self.ERI = None
+
+
+class JK(object):
+    """
+    Builder for the Coulomb (J) and exchange (K) matrices of a density D from AO-basis
+    two-electron integrals,
+
+        J[i,j] = sum_kl (ij|kl) D[k,l]   and   K[i,j] = sum_kl (ik|jl) D[k,l],
+
+    so that the closed-shell Fock matrix is F = h + 2J - K.
+
+    K is built from blocks of rows i of the integrals, so that only the exchange-ordered copy of
+    one block (block_memory MB), rather than a second copy of all nbf^4 integrals, is ever held.
+    Within an SCF, update() builds J and K incrementally from the change in the density since
+    its last call, with a full rebuild every rebuild calls to limit the accumulation of
+    round-off error.
+    """
+    def __init__(self, ERI, incremental=False, rebuild=8, block_memory=100):
+        """
+        Constructor for the JK builder.
+
+        Parameters
+        ----------
+        ERI: AO-basis two-electron integrals in chemist's notation, (pq|rs) (NumPy array)
+        incremental: if True, update() builds J and K from the change in the density
+        rebuild: number of update() calls between full (non-incremental) builds
+        block_memory: memory (MB) for the exchange-ordered integrals of each block of K
+
+        Returns
+        -------
+        JK object
+        """
+        self.ERI = ERI
+        nbf = ERI.shape[0]
+        self.block = int(min(nbf, max(1, block_memory * 1024**2 // (ERI.itemsize * nbf**3))))
+        self.incremental = incremental
+        self.rebuild = rebuild
+
+        self.D = None # Density of the last update()
+        self.J = None
+        self.K = None
+        self.nupdate = 0 # Number of update() calls
+        self.expressions = {} # Precompiled J and K contractions for each shape of density
+
+    def jk(self, D):
+        """
+        Build J and K for the given density.
+
+        Parameters
+        ----------
+        D: AO-basis density, or a stack of densities with the AO indices last (NumPy array)
+
+        Returns
+        -------
+        J, K: AO-basis Coulomb and exchange matrices, stacked like D (NumPy arrays)
+        """
+        if D.shape not in self.expressions:
+            # The integrals are a constant operand of the expression, built once per shape of D
+            self.expressions[D.shape] = contract_expression('ijkl,...kl->...ij', self.ERI, D.shape, constants=[0])
+        J_expr = self.expressions[D.shape]
+
+        # Real and imaginary parts separately, as in split_contract()
+        if np.iscomplexobj(D) and not np.iscomplexobj(self.ERI):
+            J = J_expr(D.real) + 1j * J_expr(D.imag)
+        else:
+            J = J_expr(D)
+
+        nbf = self.ERI.shape[0]
+        K = np.zeros(J.shape, dtype=J.dtype)
+        for i0 in range(0, nbf, self.block):
+            i1 = min(i0 + self.block, nbf)
+            K[...,i0:i1,:] = split_contract('ikjl,...kl->...ij', self.ERI[i0:i1], D)
+
+        return J, K
+
+    def update(self, D):
+        """
+        Build J and K for the next density of an iterative (e.g., SCF) procedure, incrementally
+        from the density of the previous call if requested.
+
+        Parameters
+        ----------
+        D: AO-basis density (NumPy array)
+
+        Returns
+        -------
+        J, K: AO-basis Coulomb and exchange matrices (NumPy arrays)
+        """
+        if self.incremental and self.D is not None and self.nupdate % self.rebuild != 0:
+            dJ, dK = self.jk(D - self.D)
+            J = self.J + dJ
+            K = self.K + dK
+        else:
+            J, K = self.jk(D)
+
+        self.nupdate += 1
+        self.D = D.copy()
+        self.J = J
+        self.K = K
+
+        return J, K
+
 
 class DIIS(object):
     """
     DIIS solver for SCF and correlated methods.
 
+    The coefficient and error vectors are kept in preallocated ring buffers of max_diis rows, and
+    the DIIS matrix B is updated by a single row/column as each error vector is added, so neither
+    storage nor the cost of an extrapolation grows with the number of iterations.
+
+    For large amplitude vectors the buffers may instead be memory-mapped to a scratch file
+    (storage='DISK') and/or kept in single precision (precision='SINGLE').  In single precision
+    the coefficient vectors are stored as differences from the most recent vector, which is kept
+    in double precision, so the rounding error of an extrapolation vanishes at convergence.
     """
-    def __init__(self, C, max_diis):
+    def __init__(self, C, max_diis, **kwargs):
         """
         Constructor for DIIS solver.
 
@@ -108,15 +893,73 @@ class DIIS(object):
         C: Initial set of coefficients/amplitudes to extrapolate (e.g., Fock matrix, cluster amplitudes, etc.).  The
         coefficients must be provided as a single NumPy array, e.g., different classes of cluster amplitudes (T1, T2,
         etc.) must be concatentated together.
+        max_diis: Maximum dimension of the DIIS subspace
+        regularization: Tikhonov shift added to the diagonal of B, relative to its largest diagonal element
+        (default 0.0)
+        rescale: Scale B by its largest element before solving the DIIS equations (default False)
+        storage: 'MEMORY' (default) or 'DISK' for subspace vectors memory-mapped to a scratch file
+        precision: 'DOUBLE' (default) or 'SINGLE' precision storage of the subspace vectors
+        scratch: directory for the scratch file with storage='DISK' (default: the system temporary directory)
 
         Returns
         -------
         DIIS object
         """
-        self.diis_C = [C.copy()] # List of Fock matrices or concatenated amplitude increment arrays
-        self.diis_errors = [] # List of error matrices/vectors
-        self.diis_size = 0 # Current DIIS dimension
+        self.regularization = kwargs.pop('regularization', 0.0)
+        self.rescale = kwargs.pop('rescale', False)
+
+        valid_storages = ['MEMORY', 'DISK']
+        storage = kwargs.pop('storage', 'MEMORY').upper()
+        if storage not in valid_storages:
+            raise Exception(f"{storage:s} is not an allowed choice of DIIS storage.")
+        self.storage = storage
+
+        valid_precisions = ['DOUBLE', 'SINGLE']
+        precision = kwargs.pop('precision', 'DOUBLE').upper()
+        if precision not in valid_precisions:
+            raise Exception(f"{precision:s} is not an allowed choice of DIIS precision.")
+        self.precision = precision
+
+        self.scratch = kwargs.pop('scratch', None)
+        self.files = []
+
+        self.shape = C.shape
         self.max_diis = max_diis # Maximum DIIS dimension
+        self.diis_size = 0 # Current DIIS dimension
+        self.diis_C = None # Ring buffer of Fock matrices or concatenated amplitude arrays (one per row)
+        self.diis_errors = None # Ring buffer of error matrices/vectors (one per row)
+        self.anchor = None # Most recent coefficients (single precision only)
+        self.B = np.zeros((max_diis, max_diis), dtype=C.dtype) # DIIS matrix for the occupied slots
+        self.slot = 0 # Next slot to be overwritten (the oldest once the buffers are full)
+
+    def buffer(self, size, dtype, old=None):
+        """
+        Allocate a (max_diis, size) ring buffer, optionally initialized from an existing one
+
+        Parameters
+        ----------
+        size: length of each stored vector
+        dtype: NumPy dtype of the full-precision vectors
+        old: existing buffer to copy into the new one (or None)
+
+        Returns
+        -------
+        buf: the ring buffer (NumPy array or memmap)
+        """
+        if self.precision == 'SINGLE':
+            dtype = np.complex64 if np.issubdtype(dtype, np.complexfloating) else np.float32
+
+        if self.storage == 'DISK':
+            f = tempfile.TemporaryFile(dir=self.scratch)
+            self.files.append(f)
+            buf = np.memmap(f, dtype=dtype, mode='w+', shape=(self.max_diis, size))
+        else:
+            buf = np.zeros((self.max_diis, size), dtype=dtype)
+
+        if old is not None:
+            buf[...] = old
+
+        return buf
 
     def add_error_vector(self, C, e):
         """
@@ -133,8 +976,42 @@ class DIIS(object):
         -------
         None
         """
-        self.diis_C.append(C.copy())
-        self.diis_errors.append(e.ravel())
+        if self.max_diis == 0:
+            return
+
+        C = C.ravel()
+        e = e.ravel()
+
+        # Allocate the buffers on first use, and promote them if complex vectors follow real ones
+        if self.diis_C is None:
+            self.diis_C = self.buffer(C.size, C.dtype)
+            self.diis_errors = self.buffer(e.size, e.dtype)
+        if np.iscomplexobj(C) and not np.iscomplexobj(self.diis_C):
+            self.diis_C = self.buffer(C.size, C.dtype, self.diis_C)
+        if np.iscomplexobj(e) and not np.iscomplexobj(self.diis_errors):
+            self.diis_errors = self.buffer(e.size, e.dtype, self.diis_errors)
+        if np.iscomplexobj(e) and not np.iscomplexobj(self.B):
+            self.B = self.B.astype(e.dtype)
+
+        n = self.slot
+        if self.precision == 'SINGLE':
+            # Shift the stored differences to the new anchor: C_i - C = (C_i - anchor) + (anchor - C)
+            if self.anchor is not None:
+                self.diis_C[:self.diis_size] += (self.anchor - C).astype(self.diis_C.dtype)
+            self.anchor = C.copy()
+            self.diis_C[n] = 0
+        else:
+            self.diis_C[n] = C
+        self.diis_errors[n] = e
+        self.slot = (n + 1) % self.max_diis
+        self.diis_size = min(self.diis_size + 1, self.max_diis)
+
+        # New row/column of B: overlaps of the stored error vectors with the new one (a single GEMV)
+        errors = self.diis_errors[:self.diis_size]
+        row = errors.conj() @ e if errors.dtype == e.dtype else errors.astype(e.dtype).conj() @ e
+        self.B[:self.diis_size, n] = row
+        self.B[n, :self.diis_size] = row
+        self.B[n, n] = np.dot(e.conj(), e)
 
     def extrapolate(self, C):
         """
@@ -149,40 +1026,117 @@ class DIIS(object):
         -------
         C: The extrapolated coefficients as a single NumPy array.
         """
-        if(self.max_diis == 0):
+        if(self.max_diis == 0 or self.diis_size == 0):
             return C
 
-        if (len(self.diis_errors) > self.max_diis):
-            del self.diis_C[0]
-            del self.diis_errors[0]
+        n = self.diis_size
 
-        self.diis_size = len(self.diis_errors)
-
-        # Build DIIS matrix B
-        B = -1 * np.ones((self.diis_size + 1, self.diis_size + 1), dtype=self.diis_errors[0].dtype)
+        # Augmented DIIS matrix
+        B = -1 * np.ones((n + 1, n + 1), dtype=self.B.dtype)
         B[-1, -1] = 0
+        B[:n, :n] = self.B[:n, :n]
 
-        for n1, e1 in enumerate(self.diis_errors):
-            B[n1, n1] = np.dot(e1.conj(), e1)
-            for n2, e2 in enumerate(self.diis_errors):
-                if n1 > n2:
-                    continue
-                B[n1, n2] = np.dot(e1.conj(), e2)
-                B[n2, n1] = B[n1, n2]
-
-#        B[:-1, :-1] /= np.abs(B[:-1, :-1]).max()
+        if self.rescale:
+            B[:n, :n] /= np.abs(B[:n, :n]).max()
+        if self.regularization > 0.0:
+            B[:n, :n] += self.regularization * np.abs(np.diag(B[:n, :n])).max() * np.eye(n)
 
-        A = np.zeros((self.diis_size+1))
+        A = np.zeros((n+1))
         A[-1] = -1
 
         c = np.linalg.solve(B, A)
 
-        C *= 0
-        for i in range(self.diis_size):
-            C += c[i] * self.diis_C[i+1]
+        # The slot order of the buffers is irrelevant, since B is stored in the same order
+        if self.precision == 'SINGLE':
+            # sum_i c_i C_i = anchor + sum_i c_i (C_i - anchor), since the c_i sum to one
+            C[...] = (self.anchor + c[:n] @ self.diis_C[:n]).reshape(C.shape)
+        else:
+            C[...] = (c[:n] @ self.diis_C[:n]).reshape(C.shape)
 
         return C
 
+class EDIIS(object):
+    """
+    Energy-DIIS (EDIIS) extrapolation for SCF methods.
+
+    The Fock matrix is extrapolated with the convex combination of previous Fock matrices that
+    minimizes the interpolated closed-shell energy
+
+        E(c) = sum_i c_i E_i - 1/2 sum_ij c_i c_j Tr[(D_i - D_j)(F_i - F_j)],   c_i >= 0, sum_i c_i = 1,
+
+    which, unlike commutator DIIS, cannot extrapolate far from the densities already visited.
+    """
+    def __init__(self, max_ediis):
+        """
+        Constructor for EDIIS solver.
+
+        Parameters
+        ----------
+        max_ediis: Maximum number of previous densities, Fock matrices, and energies to keep
+
+        Returns
+        -------
+        EDIIS object
+        """
+        self.D = [] # List of densities
+        self.F = [] # List of Fock matrices built from the densities
+        self.E = [] # List of energies of the densities
+        self.max_ediis = max_ediis
+
+    def add(self, D, F, E):
+        """
+        Add a density, its Fock matrix, and its energy to the EDIIS space.
+
+        Parameters
+        ----------
+        D: density matrix (NumPy array)
+        F: Fock matrix built from D (NumPy array)
+        E: energy of D (float)
+
+        Returns
+        -------
+        None
+        """
+        self.D.append(D.copy())
+        self.F.append(F.copy())
+        self.E.append(E)
+        if len(self.E) > max(self.max_ediis, 1):
+            del self.D[0]
+            del self.F[0]
+            del self.E[0]
+
+    def extrapolate(self):
+        """
+        Extrapolate the Fock matrix.
+
+        Returns
+        -------
+        F: The extrapolated Fock matrix (NumPy array)
+        """
+        n = len(self.E)
+        if n == 1:
+            return self.F[0].copy()
+
+        E = np.array(self.E)
+        M = np.zeros((n, n))
+        for i in range(n):
+            for j in range(i):
+                M[i,j] = M[j,i] = contract('pq,qp->', self.D[i]-self.D[j], self.F[i]-self.F[j]).real
+
+        # Minimize the quadratic energy model on the simplex
+        c0 = np.zeros(n)
+        c0[np.argmin(E)] = 1.0
+        result = scipy.optimize.minimize(lambda c: (c @ E - 0.5 * c @ M @ c, E - M @ c), c0, jac=True, method='SLSQP',
+                bounds=[(0.0, 1.0)] * n, constraints={'type': 'eq', 'fun': lambda c: np.sum(c) - 1.0, 'jac': lambda c: np.ones(n)})
+        c = np.clip(result.x, 0.0, None)
+        c /= np.sum(c)
+
+        F = np.zeros_like(self.F[0])
+        for i in range(n):
+            F += c[i] * self.F[i]
+
+        return F
+
 def make_np_array(a):
     """
     Create a numpy array from the text output of calling print() of a numpy array